@@ -1,16 +1,21 @@
 from __future__ import annotations
 
+import asyncio
 from typing import Any, Dict, List, Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 
-from core.modules.anchor_points.manager import AnchorPointManager
-from core.modules.guardrails.abcd import ABCDGuardrail
-from core.modules.reasoning.verbal_reasoning import ReasoningType, VerbalReasoningEngine
+from api.body import body_schema, json_body
+from core.modules.anchor_points.manager import AnchorPointManager, get_anchor_manager
+from core.modules.guardrails.abcd import ABCDGuardrail, get_guardrail
+from core.modules.reasoning.memo import ReasoningMemo, get_reasoning_memo
+from core.modules.reasoning.verbal_reasoning import ReasoningType, VerbalReasoningEngine, get_reasoning_engine
 
 router = APIRouter()
 
+_REASONING_TYPES = {m.name: m for m in ReasoningType}
+
 
 class ReasoningRequest(BaseModel):
     query: str
@@ -26,17 +31,31 @@ class AnchorPointRequest(BaseModel):
     priority: int = 5
 
 
-@router.post("/reasoning")
-async def perform_reasoning(request: ReasoningRequest):
-    engine = VerbalReasoningEngine()
-    rt = request.reasoning_type.upper()
-    reasoning_type = ReasoningType[rt] if rt in ReasoningType.__members__ else ReasoningType.DEDUCTIVE
-    return await engine.reason(request.query, request.context, reasoning_type)
+@router.post("/reasoning", openapi_extra=body_schema(ReasoningRequest))
+async def perform_reasoning(
+    request: ReasoningRequest = Depends(json_body(ReasoningRequest)),
+    engine: VerbalReasoningEngine = Depends(get_reasoning_engine),
+    memo: ReasoningMemo = Depends(get_reasoning_memo),
+):
+    reasoning_type = _REASONING_TYPES.get(request.reasoning_type.upper(), ReasoningType.DEDUCTIVE)
+    cached = engine.cached_result(request.query, request.context, reasoning_type)
+    if cached is not None:
+        return cached
+    # the memo blocks on SQLite and the encoder, so it runs off the event loop
+    prior = await asyncio.to_thread(memo.lookup, request.query, request.context, reasoning_type.value)
+    result = await engine.reason(request.query, request.context, reasoning_type, prior_chains=prior)
+    await asyncio.to_thread(
+        memo.write_back,
+        request.query, request.context, reasoning_type.value, result, source_ids=[c["id"] for c in prior]
+    )
+    return result
 
 
-@router.post("/anchor-points")
-async def create_anchor_point(request: AnchorPointRequest):
-    manager = AnchorPointManager()
+@router.post("/anchor-points", openapi_extra=body_schema(AnchorPointRequest))
+async def create_anchor_point(
+    request: AnchorPointRequest = Depends(json_body(AnchorPointRequest)),
+    manager: AnchorPointManager = Depends(get_anchor_manager),
+):
     anchor = manager.create_anchor(
         session_id=request.session_id,
         objective=request.objective,
@@ -48,93 +67,18 @@ async def create_anchor_point(request: AnchorPointRequest):
 
 
 @router.get("/anchor-points/{session_id}")
-async def get_anchor_point(session_id: str):
-    manager = AnchorPointManager()
-    anchor = manager.get_active_anchor(session_id)
-    if not anchor:
+async def get_anchor_point(session_id: str, manager: AnchorPointManager = Depends(get_anchor_manager)):
+    anchor = manager.get_active_anchor_dict(session_id)
+    if anchor is None:
         raise HTTPException(status_code=404, detail="No anchor point found")
-    return {"anchor": anchor.to_dict()}
+    return {"anchor": anchor}
 
 
 @router.post("/guardrails/validate")
-async def validate_guardrails(text: str, context: Optional[Dict[str, Any]] = None):
-    guardrail = ABCDGuardrail()
+async def validate_guardrails(
+    text: str,
+    context: Optional[Dict[str, Any]] = None,
+    guardrail: ABCDGuardrail = Depends(get_guardrail),
+):
     is_valid, level, violations = await guardrail.validate(text, context or {})
     return {"is_valid": is_valid, "level": level, "violations": violations}
-
-"""Cognitive API routes"""
-
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-
-router = APIRouter()
-
-
-class ReasoningRequest(BaseModel):
-    query: str
-    context: Dict[str, Any]
-    reasoning_type: Optional[str] = "deductive"
-
-
-class AnchorPointRequest(BaseModel):
-    session_id: str
-    objective: str
-    constraints: Optional[List[str]] = None
-    context: Optional[Dict[str, Any]] = None
-    priority: int = 5
-
-
-@router.post("/reasoning")
-async def perform_reasoning(request: ReasoningRequest):
-    """Perform verbal reasoning"""
-    # Import here to avoid circular imports
-    from core.modules.reasoning.verbal_reasoning import VerbalReasoningEngine, ReasoningType
-    
-    engine = VerbalReasoningEngine()
-    reasoning_type = ReasoningType[request.reasoning_type.upper()] if hasattr(ReasoningType, request.reasoning_type.upper()) else ReasoningType.DEDUCTIVE
-    
-    result = await engine.reason(request.query, request.context, reasoning_type)
-    return result
-
-
-@router.post("/anchor-points")
-async def create_anchor_point(request: AnchorPointRequest):
-    """Create anchor point"""
-    from core.modules.anchor_points.manager import AnchorPointManager
-    
-    manager = AnchorPointManager()
-    anchor = manager.create_anchor(
-        request.session_id,
-        request.objective,
-        request.constraints,
-        request.context,
-        request.priority
-    )
-    return {"anchor": anchor}
-
-
-@router.get("/anchor-points/{session_id}")
-async def get_anchor_point(session_id: str):
-    """Get active anchor point"""
-    from core.modules.anchor_points.manager import AnchorPointManager
-    
-    manager = AnchorPointManager()
-    anchor = manager.get_active_anchor(session_id)
-    if not anchor:
-        raise HTTPException(status_code=404, detail="No anchor point found")
-    return {"anchor": anchor}
-
-
-@router.post("/guardrails/validate")
-async def validate_guardrails(text: str, context: Optional[Dict[str, Any]] = None):
-    """Validate text against guardrails"""
-    from core.modules.guardrails.abcd import ABCDGuardrail
-    
-    guardrail = ABCDGuardrail()
-    is_valid, level, violations = await guardrail.validate(text, context)
-    return {
-        "is_valid": is_valid,
-        "level": level.value,
-        "violations": violations
-    }
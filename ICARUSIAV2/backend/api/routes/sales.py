@@ -2,13 +2,20 @@ from __future__ import annotations
 
 from typing import Any, Dict, List, Optional
 
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Depends, Request
 from pydantic import BaseModel
 
-from sales.objections.handler import ObjectionHandler
-from sales.scripts.engine import SalesScriptEngine
-from sales.webhooks.twilio_handler import TwilioWebhookHandler
-from sales.whatsapp.api import WhatsAppAPI
+try:
+    import orjson  # type: ignore  # noqa: F401
+    from fastapi.responses import ORJSONResponse as DirectResponse
+except Exception:  # pragma: no cover
+    from fastapi.responses import JSONResponse as DirectResponse  # type: ignore
+
+from api.body import OBJECT_BODY_SCHEMA, body_schema, json_body, json_object
+from sales.objections.handler import ObjectionHandler, get_objection_handler
+from sales.scripts.engine import SalesScriptEngine, get_sales_engine
+from sales.webhooks.twilio_handler import TwilioWebhookHandler, get_twilio_handler
+from sales.whatsapp.api import WhatsAppAPI, get_whatsapp_api
 
 router = APIRouter()
 
@@ -26,9 +33,11 @@ class ObjectionRequest(BaseModel):
     customer_data: Optional[Dict[str, Any]] = None
 
 
-@router.post("/message")
-async def handle_sales_message(request: SalesMessageRequest):
-    engine = SalesScriptEngine()
+@router.post("/message", openapi_extra=body_schema(SalesMessageRequest))
+async def handle_sales_message(
+    request: SalesMessageRequest = Depends(json_body(SalesMessageRequest)),
+    engine: SalesScriptEngine = Depends(get_sales_engine),
+):
     return await engine.get_response(
         user_message=request.message,
         conversation_history=request.conversation_history or [],
@@ -37,9 +46,11 @@ async def handle_sales_message(request: SalesMessageRequest):
     )
 
 
-@router.post("/objections/handle")
-async def handle_objection(request: ObjectionRequest):
-    handler = ObjectionHandler()
+@router.post("/objections/handle", openapi_extra=body_schema(ObjectionRequest))
+async def handle_objection(
+    request: ObjectionRequest = Depends(json_body(ObjectionRequest)),
+    handler: ObjectionHandler = Depends(get_objection_handler),
+):
     return await handler.handle_objection_flow(
         message=request.message,
         conversation_history=request.conversation_history,
@@ -48,83 +59,15 @@ async def handle_objection(request: ObjectionRequest):
 
 
 @router.post("/twilio/webhook")
-async def twilio_webhook(request: Request):
-    handler = TwilioWebhookHandler()
+async def twilio_webhook(request: Request, handler: TwilioWebhookHandler = Depends(get_twilio_handler)):
     twiml = await handler.handle_incoming_message(request)
-    return {"twiml": twiml}
-
-
-@router.post("/whatsapp/webhook")
-async def whatsapp_webhook(payload: Dict[str, Any]):
-    api = WhatsAppAPI()
-    return await api.handle_webhook(payload)
-
-"""Sales API routes"""
-
-from fastapi import APIRouter, Request, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-
-router = APIRouter()
-
-
-class SalesMessageRequest(BaseModel):
-    message: str
-    session_id: str
-    conversation_history: Optional[List[str]] = None
-    customer_data: Optional[Dict[str, Any]] = None
+    return DirectResponse({"twiml": twiml})
 
 
-class ObjectionRequest(BaseModel):
-    message: str
-    conversation_history: List[str]
-    customer_data: Optional[Dict[str, Any]] = None
-
-
-@router.post("/message")
-async def handle_sales_message(request: SalesMessageRequest):
-    """Handle sales message"""
-    from sales.scripts.engine import SalesScriptEngine
-    
-    engine = SalesScriptEngine()
-    result = await engine.get_response(
-        request.message,
-        request.conversation_history or [],
-        request.session_id,
-        request.customer_data
-    )
-    return result
-
-
-@router.post("/objections/handle")
-async def handle_objection(request: ObjectionRequest):
-    """Handle customer objection"""
-    from sales.objections.handler import ObjectionHandler
-    
-    handler = ObjectionHandler()
-    result = await handler.handle_objection_flow(
-        request.message,
-        request.conversation_history,
-        request.customer_data
-    )
-    return result
-
-
-@router.post("/twilio/webhook")
-async def twilio_webhook(request: Request):
-    """Handle Twilio webhook"""
-    from sales.webhooks.twilio_handler import TwilioWebhookHandler
-    
-    handler = TwilioWebhookHandler()
-    response = await handler.handle_incoming_message(request)
-    return {"response": response}
-
-
-@router.post("/whatsapp/webhook")
-async def whatsapp_webhook(payload: Dict[str, Any]):
-    """Handle WhatsApp webhook"""
-    from sales.whatsapp.api import WhatsAppAPI
-    
-    api = WhatsAppAPI()
-    result = await api.handle_webhook(payload)
-    return result
+@router.post("/whatsapp/webhook", openapi_extra=OBJECT_BODY_SCHEMA)
+async def whatsapp_webhook(
+    payload: Dict[str, Any] = Depends(json_object),
+    api: WhatsAppAPI = Depends(get_whatsapp_api),
+):
+    # webhook results are plain JSON types: serialize directly, no jsonable_encoder pass
+    return DirectResponse(await api.handle_webhook(payload))
@@ -1,13 +1,107 @@
 from __future__ import annotations
 
+import asyncio
+from collections import defaultdict
 from dataclasses import dataclass, field
-from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import logging
+import time
+
+try:
+    import ahocorasick  # type: ignore
+except Exception:  # pragma: no cover
+    ahocorasick = None  # type: ignore
+
+try:
+    from rapidfuzz import fuzz  # type: ignore
+    from rapidfuzz.utils import default_process  # type: ignore
+except Exception:  # pragma: no cover
+    fuzz = None  # type: ignore
+    default_process = None  # type: ignore
 
 logger = logging.getLogger("icarusiav2.anchor_points")
 
+# Anchors kept per session; older ones fall off like a deque(maxlen=...).
+_HISTORY_SIZE = 64
+
+# Up to this many constraints a generated chain of `in` checks beats the
+# automaton; past it the branches cost more than a single pass.
+_CODEGEN_MAX_CONSTRAINTS = 32
+
+
+@lru_cache(maxsize=1)
+def _iso_second(sec: int) -> str:
+    return datetime.fromtimestamp(sec, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _iso(ns: int) -> str:
+    # anchors created within the same second share the formatted prefix
+    sec, rem = divmod(ns, 1_000_000_000)
+    return f"{_iso_second(sec)}.{rem // 1000:06d}"
+
+
+def _objective_alignment(anchor: "AnchorPoint", proposed_action: str, action_lower: str) -> float:
+    if fuzz is not None:
+        return fuzz.token_set_ratio(anchor._obj_processed, default_process(proposed_action), processor=None) / 100
+    obj = anchor._obj_tokens
+    return len(obj & _action_tokens(action_lower)) / max(len(obj), 1)
+
+
+@lru_cache(maxsize=2048)
+def _action_tokens(action_lower: str) -> frozenset:
+    return frozenset(action_lower.split())
+
+
+ConstraintMatcher = Callable[[str], Optional[str]]
+
+# (matcher or None when there are no constraints, shortest lowered constraint)
+_CompiledConstraints = Tuple[Optional[ConstraintMatcher], int]
+
+
+def _codegen_matcher(lowered: List[Tuple[str, str]]) -> ConstraintMatcher:
+    # Partially evaluate the constraint loop: one literal `in` test per constraint.
+    lines = ["def _match(s):"]
+    seen = set()
+    for key, c in lowered:
+        if key not in seen:
+            seen.add(key)
+            lines.append(f"    if {key!r} in s: return {c!r}")
+    lines.append("    return None")
+    namespace: Dict[str, Any] = {}
+    exec("\n".join(lines), namespace)
+    return namespace["_match"]
+
+
+def _automaton_matcher(lowered: List[Tuple[str, str]]) -> ConstraintMatcher:
+    automaton = ahocorasick.Automaton()
+    for key, c in lowered:
+        if key not in automaton:
+            automaton.add_word(key, c)
+    automaton.make_automaton()
+    return lambda s: next((c for _, c in automaton.iter(s)), None)
+
+
+def _build_constraint_matcher(constraints: List[str]) -> _CompiledConstraints:
+    if not constraints:
+        return None, 0
+    lowered = [(c.lower(), c) for c in constraints]
+    min_len = min(len(key) for key, _ in lowered)
+    # an empty constraint matches everything; the generated `"" in s` handles that
+    if ahocorasick is not None and len(lowered) > _CODEGEN_MAX_CONSTRAINTS and min_len > 0:
+        return _automaton_matcher(lowered), min_len
+    return _codegen_matcher(lowered), min_len
+
+
+def _find_constraint_violation(compiled: _CompiledConstraints, action_lower: str) -> Optional[str]:
+    matcher, min_len = compiled
+    # cheapest rejection first: no constraints, or the action is shorter than all of them
+    if matcher is None or len(action_lower) < min_len:
+        return None
+    return matcher(action_lower)
+
 
 @dataclass
 class AnchorPoint:
@@ -16,8 +110,25 @@ class AnchorPoint:
     constraints: List[str] = field(default_factory=list)
     context: Dict[str, Any] = field(default_factory=dict)
     priority: int = 5
-    created_at: datetime = field(default_factory=datetime.utcnow)
-    updated_at: datetime = field(default_factory=datetime.utcnow)
+    created_at_ns: int = field(default_factory=time.time_ns)
+    updated_at_ns: int = field(default_factory=time.time_ns)
+    _obj_tokens: frozenset[str] = field(init=False, repr=False, compare=False)
+    _obj_processed: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self._index_objective()
+
+    def _index_objective(self) -> None:
+        self._obj_tokens = frozenset(self.objective.lower().split())
+        self._obj_processed = default_process(self.objective) if default_process else self.objective.lower()
+
+    @property
+    def created_at(self) -> datetime:
+        return datetime.fromtimestamp(self.created_at_ns / 1e9, timezone.utc)
+
+    @property
+    def updated_at(self) -> datetime:
+        return datetime.fromtimestamp(self.updated_at_ns / 1e9, timezone.utc)
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -26,15 +137,18 @@ class AnchorPoint:
             "constraints": self.constraints,
             "context": self.context,
             "priority": self.priority,
-            "created_at": self.created_at.isoformat(),
-            "updated_at": self.updated_at.isoformat(),
+            "created_at": _iso(self.created_at_ns),
+            "updated_at": _iso(self.updated_at_ns),
         }
 
 
 class AnchorPointManager:
     def __init__(self):
-        self._anchors: Dict[str, List[AnchorPoint]] = {}
+        self._anchors: Dict[str, Dict[str, AnchorPoint]] = defaultdict(dict)
+        self._counters: Dict[str, int] = defaultdict(int)
         self._active: Dict[str, AnchorPoint] = {}
+        self._matchers: Dict[str, _CompiledConstraints] = {}
+        self._last_seen: Dict[str, float] = {}
 
     def create_anchor(
         self,
@@ -44,15 +158,22 @@ class AnchorPointManager:
         context: Optional[Dict[str, Any]] = None,
         priority: int = 5,
     ) -> AnchorPoint:
+        idx = self._counters[session_id]
+        self._counters[session_id] = idx + 1
         anchor = AnchorPoint(
-            id=f"{session_id}_{len(self._anchors.get(session_id, []))}",
+            id=f"{session_id}_{idx}",
             objective=objective,
             constraints=constraints or [],
             context=context or {},
             priority=priority,
         )
-        self._anchors.setdefault(session_id, []).append(anchor)
+        history = self._anchors[session_id]
+        history[anchor.id] = anchor
+        if len(history) > _HISTORY_SIZE:
+            del history[next(iter(history))]
         self._active[session_id] = anchor
+        self._matchers.pop(session_id, None)
+        self._last_seen[session_id] = time.monotonic()
         logger.info("anchor_created session_id=%s anchor_id=%s", session_id, anchor.id)
         return anchor
 
@@ -65,19 +186,29 @@ class AnchorPointManager:
         anchor = self.get_active_anchor(session_id)
         if not anchor:
             return True, None
+        self._last_seen[session_id] = time.monotonic()
 
-        for c in anchor.constraints:
-            if c.lower() in proposed_action.lower():
-                return False, f"Violates constraint: {c}"
+        if session_id not in self._matchers:
+            self._matchers[session_id] = _build_constraint_matcher(anchor.constraints)
+        lower = proposed_action.lower()
+        hit = _find_constraint_violation(self._matchers[session_id], lower)
+        if hit is not None:
+            return False, f"Violates constraint: {hit}"
 
         # lightweight alignment check
-        obj = set(anchor.objective.lower().split())
-        act = set(proposed_action.lower().split())
-        alignment = len(obj & act) / max(len(obj), 1)
+        alignment = _objective_alignment(anchor, proposed_action, lower)
         if alignment < 0.2:
             return False, "Low alignment with objective"
         return True, None
 
+    def evict_idle(self, max_idle: float) -> int:
+        cutoff = time.monotonic() - max_idle
+        idle = [sid for sid, seen in self._last_seen.items() if seen < cutoff]
+        for sid in idle:
+            for store in (self._anchors, self._counters, self._active, self._matchers, self._last_seen):
+                store.pop(sid, None)
+        return len(idle)
+
 """
 Anchor Points Manager
 Manages objectives, goals, and constraints for conversations
@@ -87,6 +218,7 @@ from typing import Dict, List, Optional, Any
 from dataclasses import dataclass, field
 from datetime import datetime
 import structlog
+from config.settings import settings
 
 logger = structlog.get_logger()
 
@@ -99,17 +231,54 @@ class AnchorPoint:
     constraints: List[str] = field(default_factory=list)
     context: Dict[str, Any] = field(default_factory=dict)
     priority: int = 5  # 1-10 scale
-    created_at: datetime = field(default_factory=datetime.now)
-    updated_at: datetime = field(default_factory=datetime.now)
+    created_at_ns: int = field(default_factory=time.time_ns)  # UTC epoch
+    updated_at_ns: int = field(default_factory=time.time_ns)
     metadata: Dict[str, Any] = field(default_factory=dict)
+    _obj_tokens: frozenset[str] = field(init=False, repr=False, compare=False)
+    _obj_processed: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._index_objective()
+
+    def _index_objective(self):
+        # Objective keywords only change through update_anchor; normalize once
+        self._obj_tokens = frozenset(self.objective.lower().split())
+        self._obj_processed = default_process(self.objective) if default_process else self.objective.lower()
+
+    @property
+    def created_at(self) -> datetime:
+        return datetime.fromtimestamp(self.created_at_ns / 1e9, timezone.utc)
+
+    @property
+    def updated_at(self) -> datetime:
+        return datetime.fromtimestamp(self.updated_at_ns / 1e9, timezone.utc)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize anchor point for API responses"""
+        return {
+            "id": self.id,
+            "objective": self.objective,
+            "constraints": self.constraints,
+            "context": self.context,
+            "priority": self.priority,
+            "created_at": _iso(self.created_at_ns),
+            "updated_at": _iso(self.updated_at_ns),
+            "metadata": self.metadata,
+        }
 
 
 class AnchorPointManager:
     """Manages anchor points for conversations"""
     
     def __init__(self):
-        self._anchors: Dict[str, List[AnchorPoint]] = {}
+        self._anchors: Dict[str, Dict[str, AnchorPoint]] = defaultdict(dict)  # session_id -> anchor_id -> anchor
+        self._counters: Dict[str, int] = defaultdict(int)
         self._active_anchors: Dict[str, AnchorPoint] = {}
+        self._matchers: Dict[str, _CompiledConstraints] = {}  # session_id -> compiled constraints
+        self._versions: Dict[str, int] = defaultdict(int)  # bumped on every anchor mutation
+        self._serialized: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        self._last_seen: Dict[str, float] = {}  # session_id -> monotonic time of last use
+        self.history_size = max(settings.ANCHOR_HISTORY_SIZE, 1)
     
     def create_anchor(
         self,
@@ -120,19 +289,25 @@ class AnchorPointManager:
         priority: int = 5
     ) -> AnchorPoint:
         """Create a new anchor point"""
+        idx = self._counters[session_id]
+        self._counters[session_id] = idx + 1
         anchor = AnchorPoint(
-            id=f"{session_id}_{len(self._anchors.get(session_id, []))}",
+            id=f"{session_id}_{idx}",
             objective=objective,
             constraints=constraints or [],
             context=context or {},
             priority=priority
         )
         
-        if session_id not in self._anchors:
-            self._anchors[session_id] = []
-        
-        self._anchors[session_id].append(anchor)
+        history = self._anchors[session_id]
+        history[anchor.id] = anchor
+        if len(history) > self.history_size:
+            # Insertion-ordered, so the oldest anchor goes first (the active one is always newest)
+            del history[next(iter(history))]
         self._active_anchors[session_id] = anchor
+        self._matchers.pop(session_id, None)
+        self._versions[session_id] += 1
+        self._last_seen[session_id] = time.monotonic()
         
         logger.info(
             "Anchor point created",
@@ -157,27 +332,51 @@ class AnchorPointManager:
         priority: Optional[int] = None
     ) -> Optional[AnchorPoint]:
         """Update an existing anchor point"""
-        anchors = self._anchors.get(session_id, [])
-        for anchor in anchors:
-            if anchor.id == anchor_id:
-                if objective:
-                    anchor.objective = objective
-                if constraints is not None:
-                    anchor.constraints = constraints
-                if context:
-                    anchor.context.update(context)
-                if priority is not None:
-                    anchor.priority = priority
-                anchor.updated_at = datetime.now()
-                
-                logger.info("Anchor point updated", session_id=session_id, anchor_id=anchor_id)
-                return anchor
+        anchor = self._anchors.get(session_id, {}).get(anchor_id)
+        if anchor is None:
+            return None
         
-        return None
+        if objective:
+            anchor.objective = objective
+            anchor._index_objective()
+        if constraints is not None:
+            anchor.constraints = constraints
+            self._matchers.pop(session_id, None)
+        if context:
+            anchor.context.update(context)
+        if priority is not None:
+            anchor.priority = priority
+        anchor.updated_at_ns = time.time_ns()
+        self._versions[session_id] += 1
+        self._last_seen[session_id] = time.monotonic()
+        
+        logger.info("Anchor point updated", session_id=session_id, anchor_id=anchor_id)
+        return anchor
+    
+    def get_version(self, session_id: str) -> int:
+        """Get the mutation counter for a session's anchors"""
+        return self._versions.get(session_id, 0)
+    
+    def get_active_anchor_dict(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Get the serialized active anchor, rebuilt only after the session changes"""
+        # reads count as use too, so a session that is only polled isn't evicted
+        if session_id in self._last_seen:
+            self._last_seen[session_id] = time.monotonic()
+        version = self._versions.get(session_id, 0)
+        cached = self._serialized.get(session_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        
+        anchor = self.get_active_anchor(session_id)
+        if not anchor:
+            return None
+        data = anchor.to_dict()
+        self._serialized[session_id] = (version, data)
+        return data
     
     def get_anchor_history(self, session_id: str) -> List[AnchorPoint]:
         """Get all anchor points for a session"""
-        return self._anchors.get(session_id, [])
+        return list(self._anchors.get(session_id, {}).values())
     
     def validate_against_anchors(
         self,
@@ -189,17 +388,18 @@ class AnchorPointManager:
         anchor = self.get_active_anchor(session_id)
         if not anchor:
             return True, None
+        self._last_seen[session_id] = time.monotonic()
         
-        # Check constraints
-        for constraint in anchor.constraints:
-            if constraint.lower() in proposed_action.lower():
-                return False, f"Violates constraint: {constraint}"
+        # Check constraints (generated matcher, or a single automaton pass for large sets)
+        if session_id not in self._matchers:
+            self._matchers[session_id] = _build_constraint_matcher(anchor.constraints)
+        action_lower = proposed_action.lower()
+        violated = _find_constraint_violation(self._matchers[session_id], action_lower)
+        if violated is not None:
+            return False, f"Violates constraint: {violated}"
         
         # Check objective alignment
-        objective_keywords = set(anchor.objective.lower().split())
-        action_keywords = set(proposed_action.lower().split())
-        
-        alignment_score = len(objective_keywords.intersection(action_keywords)) / max(len(objective_keywords), 1)
+        alignment_score = _objective_alignment(anchor, proposed_action, action_lower)
         
         if alignment_score < 0.3:
             return False, "Low alignment with objective"
@@ -208,9 +408,35 @@ class AnchorPointManager:
     
     def clear_session(self, session_id: str):
         """Clear all anchor points for a session"""
-        if session_id in self._anchors:
-            del self._anchors[session_id]
+        self._anchors.pop(session_id, None)
+        self._counters.pop(session_id, None)
+        self._serialized.pop(session_id, None)
+        self._versions.pop(session_id, None)
         if session_id in self._active_anchors:
             del self._active_anchors[session_id]
+        self._matchers.pop(session_id, None)
+        self._last_seen.pop(session_id, None)
         
         logger.info("Session anchors cleared", session_id=session_id)
+    
+    def evict_idle(self, max_idle: float) -> int:
+        """Clear every session not used for more than max_idle seconds"""
+        cutoff = time.monotonic() - max_idle
+        idle = [sid for sid, seen in self._last_seen.items() if seen < cutoff]
+        for sid in idle:
+            self.clear_session(sid)
+        return len(idle)
+    
+    async def run_gc(self, interval: float, max_idle: float):
+        """Evict idle sessions every interval seconds until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            evicted = self.evict_idle(max_idle)
+            if evicted:
+                logger.info("Idle anchor sessions evicted", count=evicted)
+
+
+@lru_cache(maxsize=1)
+def get_anchor_manager() -> AnchorPointManager:
+    """Process-wide AnchorPointManager shared across requests."""
+    return AnchorPointManager()
@@ -1,19 +1,120 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import json
-from typing import Any, Dict, List, Tuple
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
 
 import logging
 
+from pydantic import BaseModel, ConfigDict
+
+try:
+    import orjson  # type: ignore
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+
 try:
-    from openai import AsyncOpenAI  # type: ignore
+    from cachetools import LFUCache  # type: ignore
 except Exception:  # pragma: no cover
-    AsyncOpenAI = None  # type: ignore
+    LFUCache = None  # type: ignore
 
 from config.settings import settings
+from core.openai_client import chat_completion, estimate_tokens, get_openai_client, get_rate_limiter, truncate_prompt
 
 logger = logging.getLogger("icarusiav2.guardrails")
 
+_CATEGORIES = ("accuracy", "bias", "compliance", "danger")
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+
+def _dumps_context(context: Optional[Dict[str, Any]]) -> str:
+    if orjson is not None:
+        return orjson.dumps(context or {}, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str).decode()
+    return json.dumps(context or {}, sort_keys=True, default=str, ensure_ascii=False)
+
+
+class _Verdict(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    violated: bool
+    reasons: List[str]
+
+
+class _ABCDVerdicts(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    accuracy: _Verdict
+    bias: _Verdict
+    compliance: _Verdict
+    danger: _Verdict
+
+
+_ABCD_SCHEMA = _ABCDVerdicts.model_json_schema()
+
+
+def _response_format() -> Dict[str, Any]:
+    # json_schema (structured outputs) needs a model that supports it, e.g. gpt-4o
+    if settings.OPENAI_STRUCTURED_OUTPUTS:
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": "abcd_verdicts", "strict": True, "schema": _ABCD_SCHEMA},
+        }
+    return {"type": "json_object"}
+
+
+def _verdict_key(text: str, model: str) -> str:
+    return hashlib.blake2b(f"{model}\0{text}".encode(), digest_size=16).hexdigest()
+
+
+class _VerdictCache:
+    """Bounded guardrail verdict cache: LFU with cachetools, LRU without it."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._lru = LFUCache is None or maxsize <= 0
+        self._entries: Any = OrderedDict() if self._lru else LFUCache(maxsize)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self._lru:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = value
+        if self._lru:
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _parse_check(raw: Any) -> Dict[str, Any]:
+    # a missing or malformed category counts as not violated
+    if not isinstance(raw, dict):
+        return {"violated": False, "reasons": []}
+    reasons = raw.get("reasons") or []
+    if not isinstance(reasons, list):
+        reasons = [reasons]
+    return {"violated": bool(raw.get("violated", False)), "reasons": [str(r) for r in reasons]}
+
 
 class ABCDGuardrail:
     """
@@ -25,31 +126,36 @@ class ABCDGuardrail:
     """
 
     def __init__(self):
-        self.client = (
-            AsyncOpenAI(api_key=settings.OPENAI_API_KEY) if (AsyncOpenAI and settings.OPENAI_API_KEY) else None
-        )
-        self.model = settings.OPENAI_MODEL
+        self.client = get_openai_client()
+        self.model = settings.GUARDRAIL_MODEL
+        self.limiter = get_rate_limiter()
 
     async def validate(self, text: str, context: Dict[str, Any]) -> Tuple[bool, str, List[str]]:
-        if not self.client:
+        if not self.client or not text.strip():
             return True, "safe", []
 
         prompt = f"""
 Valida el texto según ABCD (accuracy/bias/compliance/danger).
 Devuelve JSON con: violated(true/false), level(safe|warning|blocked|critical), reasons([..]).
 
-Contexto: {context}
+Contexto: {_dumps_context(context)}
 Texto: {text}
 """
+        prompt = truncate_prompt(prompt, self.model, settings.OPENAI_MAX_INPUT_TOKENS)
         try:
-            resp = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.1,
-                response_format={"type": "json_object"},
+            await self.limiter.acquire(estimate_tokens(prompt, self.model))
+            resp = await asyncio.wait_for(
+                chat_completion(
+                    self.client,
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.1,
+                    response_format={"type": "json_object"},
+                ),
+                settings.GUARDRAIL_TIMEOUT,
             )
             raw = resp.choices[0].message.content or "{}"
-            data = json.loads(raw)
+            data = _loads(raw)
             violated = bool(data.get("violated", False))
             level = str(data.get("level", "safe"))
             reasons = data.get("reasons", []) or []
@@ -67,7 +173,6 @@ A: Accuracy, B: Bias, C: Compliance, D: Danger
 from typing import Dict, List, Optional, Tuple
 from enum import Enum
 import structlog
-from openai import AsyncOpenAI
 from config.settings import settings
 
 logger = structlog.get_logger()
@@ -85,8 +190,9 @@ class ABCDGuardrail:
     """ABCD Cognitive Guardrails System"""
     
     def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-        self.model = settings.OPENAI_MODEL
+        self.client = get_openai_client()
+        self.model = settings.GUARDRAIL_MODEL
+        self.limiter = get_rate_limiter()
         
         # Predefined rules
         self.rules = {
@@ -111,6 +217,8 @@ class ABCDGuardrail:
                 "Prioritize safety"
             ]
         }
+        # Verdicts depend only on text, model and rules (context is not part of the prompt)
+        self._cache = _VerdictCache(settings.GUARDRAIL_CACHE_SIZE)
     
     async def validate(
         self,
@@ -121,34 +229,17 @@ class ABCDGuardrail:
         Validate text against ABCD guardrails
         Returns: (is_valid, level, violations)
         """
-        violations = []
-        
-        # Check each category
-        accuracy_check = await self._check_accuracy(text, context)
-        bias_check = await self._check_bias(text, context)
-        compliance_check = await self._check_compliance(text, context)
-        danger_check = await self._check_danger(text, context)
+        if not text.strip():
+            return True, GuardrailLevel.SAFE, []
         
-        if accuracy_check["violated"]:
-            violations.extend(accuracy_check["reasons"])
-        if bias_check["violated"]:
-            violations.extend(bias_check["reasons"])
-        if compliance_check["violated"]:
-            violations.extend(compliance_check["reasons"])
-        if danger_check["violated"]:
-            violations.extend(danger_check["reasons"])
-        
-        # Determine severity level
-        if danger_check["violated"]:
-            level = GuardrailLevel.CRITICAL
-        elif compliance_check["violated"]:
-            level = GuardrailLevel.BLOCKED
-        elif bias_check["violated"] or accuracy_check["violated"]:
-            level = GuardrailLevel.WARNING
-        else:
-            level = GuardrailLevel.SAFE
+        key = _verdict_key(text, self.model)
+        cached = self._cache.get(key)
+        if cached is not None:
+            is_valid, level, violations = cached
+            return is_valid, level, list(violations)
         
-        is_valid = level in [GuardrailLevel.SAFE, GuardrailLevel.WARNING]
+        checks, complete = await self._check_all(text, context)
+        is_valid, level, violations = self._verdict(checks)
         
         logger.info(
             "Guardrail validation",
@@ -157,131 +248,178 @@ class ABCDGuardrail:
             violations_count=len(violations)
         )
         
+        # Fallback verdicts (timeout/error) are not cached so the next call retries
+        if complete:
+            self._cache.put(key, (is_valid, level, tuple(violations)))
+        
         return is_valid, level, violations
     
-    async def _check_accuracy(
+    async def validate_many(
         self,
-        text: str,
-        context: Optional[Dict[str, Any]]
-    ) -> Dict[str, any]:
-        """Check accuracy guardrails"""
-        prompt = f"""
-Analyze the following text for accuracy violations:
-- Unsubstantiated claims
-- False information
-- Unverified facts
-
-Text: {text}
-
-Respond with JSON:
-{{"violated": true/false, "reasons": ["reason1", "reason2"]}}
-"""
-        
-        try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.1,
-                response_format={"type": "json_object"}
-            )
-            
-            result = eval(response.choices[0].message.content)
-            return result
-        except:
-            return {"violated": False, "reasons": []}
+        items: List[Tuple[str, Optional[Dict[str, Any]]]]
+    ) -> List[Tuple[bool, GuardrailLevel, List[str]]]:
+        """Validate several texts concurrently; duplicate texts share one check"""
+        pending: Dict[str, asyncio.Future] = {}
+        for text, context in items:
+            if text not in pending:
+                pending[text] = asyncio.ensure_future(self.validate(text, context))
+        await asyncio.gather(*pending.values())
+        results = []
+        for text, _ in items:
+            is_valid, level, violations = pending[text].result()
+            results.append((is_valid, level, list(violations)))
+        return results
     
-    async def _check_bias(
+    async def validate_batch(
         self,
-        text: str,
-        context: Optional[Dict[str, Any]]
-    ) -> Dict[str, any]:
-        """Check bias guardrails"""
-        prompt = f"""
-Analyze the following text for bias violations:
-- Discriminatory language
-- Stereotypes
-- Unequal treatment
-
-Text: {text}
-
-Respond with JSON:
-{{"violated": true/false, "reasons": ["reason1", "reason2"]}}
-"""
+        items: List[Tuple[str, Optional[Dict[str, Any]]]],
+        poll_interval: Optional[float] = None
+    ) -> List[Tuple[bool, GuardrailLevel, List[str]]]:
+        """
+        Validate texts through the OpenAI Batch API (half price, separate rate pool)
+        Completes within the 24h batch window; meant for background/bulk validation only.
+        """
+        poll_interval = poll_interval or settings.GUARDRAIL_BATCH_POLL_INTERVAL
+        results: List[Optional[Tuple[bool, GuardrailLevel, List[str]]]] = [None] * len(items)
+        misses: Dict[str, List[int]] = {}
+        for i, (text, _) in enumerate(items):
+            cached = self._cache.get(_verdict_key(text, self.model))
+            if cached is not None:
+                results[i] = (cached[0], cached[1], list(cached[2]))
+            else:
+                misses.setdefault(text, []).append(i)
+        
+        if misses:
+            texts = list(misses)
+            lines = [
+                json.dumps({
+                    "custom_id": str(n),
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {
+                        "model": self.model,
+                        "messages": [{"role": "user", "content": self._build_check_prompt(text)}],
+                        "temperature": 0.1,
+                        "response_format": _response_format()
+                    }
+                })
+                for n, text in enumerate(texts)
+            ]
+            outputs = await self._run_batch("\n".join(lines).encode(), poll_interval)
+            
+            for n, text in enumerate(texts):
+                data = outputs.get(str(n))
+                checks = {category: _parse_check((data or {}).get(category)) for category in _CATEGORIES}
+                verdict = self._verdict(checks)
+                if data is not None:
+                    self._cache.put(_verdict_key(text, self.model), (verdict[0], verdict[1], tuple(verdict[2])))
+                for i in misses[text]:
+                    results[i] = (verdict[0], verdict[1], list(verdict[2]))
         
+        logger.info("Guardrail batch validation", items=len(items), submitted=len(misses))
+        return results  # type: ignore[return-value]
+    
+    async def _run_batch(self, jsonl: bytes, poll_interval: float) -> Dict[str, Dict[str, Any]]:
+        """Submit a JSONL batch, wait for it and return parsed JSON bodies by custom_id"""
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.1,
-                response_format={"type": "json_object"}
+            batch_file = await self.client.files.create(file=("abcd_batch.jsonl", jsonl), purpose="batch")
+            batch = await self.client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h"
             )
-            
-            result = eval(response.choices[0].message.content)
-            return result
-        except:
-            return {"violated": False, "reasons": []}
+            while batch.status not in ("completed", "failed", "expired", "cancelled"):
+                await asyncio.sleep(poll_interval)
+                batch = await self.client.batches.retrieve(batch.id)
+            if not batch.output_file_id:
+                logger.error("Guardrail batch produced no output", batch_id=batch.id, status=batch.status)
+                return {}
+            content = await self.client.files.content(batch.output_file_id)
+        except Exception as e:
+            logger.error("Guardrail batch error", error=str(e))
+            return {}
+        
+        outputs: Dict[str, Dict[str, Any]] = {}
+        for line in content.text.splitlines():
+            try:
+                record = _loads(line)
+                message = record["response"]["body"]["choices"][0]["message"]["content"]
+                outputs[record["custom_id"]] = _loads(message or "{}")
+            except (ValueError, KeyError, IndexError, TypeError):
+                continue
+        return outputs
     
-    async def _check_compliance(
-        self,
-        text: str,
-        context: Optional[Dict[str, Any]]
-    ) -> Dict[str, any]:
-        """Check compliance guardrails"""
-        prompt = f"""
-Analyze the following text for compliance violations:
-- Legal regulations
-- Privacy laws
-- Illegal activities
+    def _verdict(self, checks: Dict[str, Dict[str, Any]]) -> Tuple[bool, GuardrailLevel, List[str]]:
+        """Map per-category checks to (is_valid, level, violations)"""
+        violations = []
+        for category in _CATEGORIES:
+            if checks[category]["violated"]:
+                violations.extend(checks[category]["reasons"])
+        
+        # Determine severity level
+        if checks["danger"]["violated"]:
+            level = GuardrailLevel.CRITICAL
+        elif checks["compliance"]["violated"]:
+            level = GuardrailLevel.BLOCKED
+        elif checks["bias"]["violated"] or checks["accuracy"]["violated"]:
+            level = GuardrailLevel.WARNING
+        else:
+            level = GuardrailLevel.SAFE
+        
+        is_valid = level in [GuardrailLevel.SAFE, GuardrailLevel.WARNING]
+        return is_valid, level, violations
+    
+    def _build_check_prompt(self, text: str) -> str:
+        """Build the combined ABCD prompt for one text"""
+        rules = "\n".join(
+            f"- {category}: " + "; ".join(self.rules.get(category, []))
+            for category in _CATEGORIES
+        )
+        return truncate_prompt(f"""
+Analyze the following text against each guardrail category:
+{rules}
 
 Text: {text}
 
 Respond with JSON:
-{{"violated": true/false, "reasons": ["reason1", "reason2"]}}
-"""
-        
-        try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.1,
-                response_format={"type": "json_object"}
-            )
-            
-            result = eval(response.choices[0].message.content)
-            return result
-        except:
-            return {"violated": False, "reasons": []}
+{{"accuracy": {{"violated": true/false, "reasons": ["reason1"]}},
+ "bias": {{"violated": true/false, "reasons": []}},
+ "compliance": {{"violated": true/false, "reasons": []}},
+ "danger": {{"violated": true/false, "reasons": []}}}}
+""", self.model, settings.OPENAI_MAX_INPUT_TOKENS)
     
-    async def _check_danger(
+    async def _check_all(
         self,
         text: str,
         context: Optional[Dict[str, Any]]
-    ) -> Dict[str, any]:
-        """Check danger guardrails"""
-        prompt = f"""
-Analyze the following text for danger violations:
-- Harmful behavior encouragement
-- Dangerous instructions
-- Safety risks
-
-Text: {text}
-
-Respond with JSON:
-{{"violated": true/false, "reasons": ["reason1", "reason2"]}}
-"""
+    ) -> Tuple[Dict[str, Dict[str, Any]], bool]:
+        """Check all four ABCD categories with a single LLM call; flags whether the model answered"""
+        prompt = self._build_check_prompt(text)
         
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.1,
-                response_format={"type": "json_object"}
+            await self.limiter.acquire(estimate_tokens(prompt, self.model))
+            # One round-trip for all categories; bounded so a slow model can't stall the request
+            response = await asyncio.wait_for(
+                chat_completion(
+                    self.client,
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.1,
+                    response_format=_response_format()
+                ),
+                timeout=settings.GUARDRAIL_TIMEOUT
             )
             
-            result = eval(response.choices[0].message.content)
-            return result
-        except:
-            return {"violated": False, "reasons": []}
+            data = _loads(response.choices[0].message.content or "{}")
+            complete = True
+        except asyncio.TimeoutError:
+            logger.warning("Guardrail check timed out", timeout=settings.GUARDRAIL_TIMEOUT)
+            data, complete = {}, False
+        except Exception as e:
+            logger.error("Guardrail check error", error=str(e))
+            data, complete = {}, False
+        
+        return {category: _parse_check(data.get(category)) for category in _CATEGORIES}, complete
     
     def get_rules(self) -> Dict[str, List[str]]:
         """Get all guardrail rules"""
@@ -292,4 +430,11 @@ Respond with JSON:
         if category not in self.rules:
             self.rules[category] = []
         self.rules[category].append(rule)
+        self._cache.clear()
         logger.info("Rule added", category=category, rule=rule)
+
+
+@lru_cache(maxsize=1)
+def get_guardrail() -> ABCDGuardrail:
+    """Process-wide ABCDGuardrail shared across requests."""
+    return ABCDGuardrail()
@@ -0,0 +1,304 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import logging
+
+try:
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover
+    np = None  # type: ignore
+
+try:
+    from sentence_transformers import SentenceTransformer  # type: ignore
+except Exception:  # pragma: no cover
+    SentenceTransformer = None  # type: ignore
+
+from config.settings import settings
+
+logger = logging.getLogger("icarusiav2.reasoning_memo")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reasoning_chains (
+    id TEXT PRIMARY KEY,
+    reasoning_type TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    embedding TEXT,
+    conclusion TEXT NOT NULL,
+    reasoning_steps TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    source_ids TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+)
+"""
+
+_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS reasoning_chains_signature ON reasoning_chains(reasoning_type, signature)",
+    "CREATE INDEX IF NOT EXISTS reasoning_chains_expires ON reasoning_chains(expires_at)",
+)
+
+
+def _signature(query: str, context: Optional[Dict[str, Any]]) -> str:
+    # structure (context keys) + semantics (query text)
+    keys = " ".join(sorted((context or {}).keys()))
+    return f"{query.strip().lower()} | {keys}".strip()
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class ReasoningMemo:
+    """Persistent store of validated reasoning chains, searchable by similarity.
+
+    Uses sentence-transformers embeddings (scored with one matrix-vector
+    product) when the package and numpy are installed, and falls back to
+    token overlap otherwise. Expired chains and those past ``max_chains``
+    (oldest first) are pruned on every write. Methods block on SQLite and
+    the encoder, so async callers run them in a worker thread.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        similarity_threshold: Optional[float] = None,
+        min_confidence: Optional[float] = None,
+        ttl: Optional[float] = None,
+        max_chains: Optional[int] = None,
+    ):
+        self.path = path or settings.REASONING_MEMO_PATH
+        self.similarity_threshold = (
+            similarity_threshold if similarity_threshold is not None else settings.REASONING_MEMO_SIMILARITY
+        )
+        self.min_confidence = min_confidence if min_confidence is not None else settings.REASONING_CACHE_MIN_CONFIDENCE
+        self.ttl = ttl if ttl is not None else settings.REASONING_MEMO_TTL
+        self.max_chains = max_chains if max_chains is not None else settings.REASONING_MEMO_MAX_CHAINS
+        self._lock = threading.Lock()  # guards the connection and the index
+        self._encoder_lock = threading.Lock()
+        self._encoder = None
+        self._encoder_failed = SentenceTransformer is None or np is None
+
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(_SCHEMA)
+        for statement in _INDEXES:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+        # in-memory index of live chains, oldest first; row i of _vectors is
+        # the unit-norm embedding of _ids[i] (all zeros when it has none)
+        self._ids: List[str] = []
+        self._types: List[str] = []
+        self._tokens: List[frozenset] = []
+        self._expires: List[float] = []
+        self._vectors = None
+        self._load_index()
+
+    def _load_index(self) -> None:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, reasoning_type, signature, embedding, expires_at FROM reasoning_chains ORDER BY expires_at"
+            ).fetchall()
+            for chain_id, rtype, signature, embedding, expires_at in rows:
+                self._append(chain_id, rtype, signature, json.loads(embedding) if embedding else None, expires_at)
+            self._prune(time.time())
+            self._conn.commit()
+
+    def _encode(self, text: str) -> Optional[List[float]]:
+        if self._encoder_failed:
+            return None
+        if self._encoder is None:
+            with self._encoder_lock:
+                if self._encoder is None and not self._encoder_failed:
+                    try:
+                        self._encoder = SentenceTransformer(settings.REASONING_MEMO_EMBEDDING_MODEL)
+                    except Exception:
+                        logger.exception("reasoning_memo_encoder_unavailable")
+                        self._encoder_failed = True
+            if self._encoder is None:
+                return None
+        return [float(x) for x in self._encoder.encode(text)]
+
+    def _unit(self, embedding: Optional[List[float]]):
+        if embedding is None or np is None:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else None
+
+    def _append(
+        self, chain_id: str, rtype: str, signature: str, embedding: Optional[List[float]], expires_at: float
+    ) -> None:
+        # caller holds self._lock
+        row = len(self._ids)
+        self._ids.append(chain_id)
+        self._types.append(rtype)
+        self._tokens.append(frozenset(signature.split()))
+        self._expires.append(expires_at)
+        vector = self._unit(embedding)
+        if vector is None:
+            if self._vectors is not None and row >= self._vectors.shape[0]:
+                self._grow()
+            return
+        if self._vectors is None:
+            self._vectors = np.zeros((max(16, 2 * (row + 1)), vector.shape[0]), dtype=np.float32)
+        elif vector.shape[0] != self._vectors.shape[1]:
+            return  # stored with a different embedding model
+        if row >= self._vectors.shape[0]:
+            self._grow()
+        self._vectors[row] = vector
+
+    def _grow(self) -> None:
+        grown = np.zeros((2 * self._vectors.shape[0], self._vectors.shape[1]), dtype=np.float32)
+        grown[: self._vectors.shape[0]] = self._vectors
+        self._vectors = grown
+
+    def _prune(self, now: float) -> None:
+        # caller holds self._lock and commits; drops expired chains, then the
+        # oldest beyond max_chains
+        keep = [i for i, expires_at in enumerate(self._expires) if expires_at >= now]
+        if self.max_chains > 0:
+            keep = keep[-self.max_chains :]
+        if len(keep) == len(self._ids):
+            return
+        kept = set(keep)
+        dropped = [(chain_id,) for i, chain_id in enumerate(self._ids) if i not in kept]
+        self._conn.executemany("DELETE FROM reasoning_chains WHERE id = ?", dropped)
+        # also chains other workers wrote and that expired since
+        self._conn.execute("DELETE FROM reasoning_chains WHERE expires_at < ?", (now,))
+        self._ids = [self._ids[i] for i in keep]
+        self._types = [self._types[i] for i in keep]
+        self._tokens = [self._tokens[i] for i in keep]
+        self._expires = [self._expires[i] for i in keep]
+        if self._vectors is not None:
+            self._vectors[: len(keep)] = self._vectors[keep]
+            self._vectors[len(keep) :] = 0.0
+
+    def lookup(
+        self, query: str, context: Optional[Dict[str, Any]], reasoning_type: str, k: int = 3
+    ) -> List[Dict[str, Any]]:
+        """Return up to k stored chains similar to (query, context) above the threshold."""
+        if not self._ids:
+            return []
+        signature = _signature(query, context)
+        embedding = self._unit(self._encode(signature))
+
+        now = time.time()
+        scored: List[tuple] = []
+        with self._lock:
+            count = len(self._ids)
+            if embedding is not None and self._vectors is not None and embedding.shape[0] == self._vectors.shape[1]:
+                scores = self._vectors[:count] @ embedding
+                candidates = [(float(scores[i]), i) for i in np.flatnonzero(scores >= self.similarity_threshold)]
+            else:
+                tokens = frozenset(signature.split())
+                candidates = [(_jaccard(tokens, chain_tokens), i) for i, chain_tokens in enumerate(self._tokens)]
+            for score, i in candidates:
+                if score >= self.similarity_threshold and self._types[i] == reasoning_type and self._expires[i] >= now:
+                    scored.append((score, self._ids[i]))
+            if not scored:
+                return []
+            scored.sort(reverse=True)
+
+            chains: List[Dict[str, Any]] = []
+            for score, chain_id in scored[:k]:
+                row = self._conn.execute(
+                    "SELECT conclusion, reasoning_steps, confidence, source_ids "
+                    "FROM reasoning_chains WHERE id = ?",
+                    (chain_id,),
+                ).fetchone()
+                if not row:
+                    continue
+                chains.append(
+                    {
+                        "id": chain_id,
+                        "similarity": round(score, 4),
+                        "conclusion": row[0],
+                        "reasoning_steps": json.loads(row[1]),
+                        "confidence": row[2],
+                        "source_ids": json.loads(row[3]),
+                    }
+                )
+        return chains
+
+    def write_back(
+        self,
+        query: str,
+        context: Optional[Dict[str, Any]],
+        reasoning_type: str,
+        result: Dict[str, Any],
+        source_ids: Optional[List[str]] = None,
+    ) -> Optional[str]:
+        """Persist a reasoning chain if it passed verification; returns its id."""
+        confidence = float(result.get("confidence", 0.0) or 0.0)
+        if confidence < self.min_confidence or result.get("error"):
+            return None
+
+        signature = _signature(query, context)
+        now = time.time()
+        steps = json.dumps(result.get("reasoning_steps", []), default=str)
+        with self._lock:
+            existing = self._conn.execute(
+                "SELECT id FROM reasoning_chains WHERE reasoning_type = ? AND signature = ? AND expires_at >= ?",
+                (reasoning_type, signature, now),
+            ).fetchone()
+            if existing:
+                # same structure seen before: refresh the chain in place, but
+                # keep its expiry so a hot query still ages out
+                self._conn.execute(
+                    "UPDATE reasoning_chains SET conclusion = ?, reasoning_steps = ?, confidence = ?, "
+                    "source_ids = ? WHERE id = ?",
+                    (
+                        str(result.get("conclusion", "")),
+                        steps,
+                        confidence,
+                        json.dumps([sid for sid in source_ids or [] if sid != existing[0]]),
+                        existing[0],
+                    ),
+                )
+                self._conn.commit()
+                return existing[0]
+
+        embedding = self._encode(signature)
+        chain_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO reasoning_chains VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    chain_id,
+                    reasoning_type,
+                    signature,
+                    json.dumps(embedding) if embedding is not None else None,
+                    str(result.get("conclusion", "")),
+                    steps,
+                    confidence,
+                    json.dumps(source_ids or []),
+                    now,
+                    now + self.ttl,
+                ),
+            )
+            self._append(chain_id, reasoning_type, signature, embedding, now + self.ttl)
+            self._prune(now)
+            self._conn.commit()
+        return chain_id
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+@lru_cache(maxsize=1)
+def get_reasoning_memo() -> ReasoningMemo:
+    """Process-wide ReasoningMemo shared across requests."""
+    return ReasoningMemo()
@@ -1,20 +1,112 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict, deque
 from enum import Enum
-from typing import Any, Dict
+from functools import lru_cache
+from typing import Any, Deque, Dict, List, Optional, Tuple
 
 import logging
 
 try:
-    from openai import AsyncOpenAI  # type: ignore
+    import orjson  # type: ignore
 except Exception:  # pragma: no cover
-    AsyncOpenAI = None  # type: ignore
+    orjson = None  # type: ignore
 
 from config.settings import settings
+from core.openai_client import chat_completion, estimate_tokens, get_openai_client, get_rate_limiter, truncate_prompt
 
 logger = logging.getLogger("icarusiav2.reasoning")
 
 
+# Response fields; the last conclusion/confidence line wins, numbered or bulleted lines are steps
+_CONCLUSION_RE = re.compile(r"(?im)^.*conclusion.*$")
+# any label containing "confidence" ("4. Confidence level (0-1):", "**Confidence:**", ...)
+_CONFIDENCE_RE = re.compile(r"(?im)^[^\n]*confidence[^\n:]*:\W*?([0-9]*\.?[0-9]+)[ \t]*(%?)")
+_STEP_RE = re.compile(r"(?m)^[ \t]*(?:[1-4]\.|-)(?![^\n]*(?i:conclusion|confidence))[^\n]*")
+
+
+def _format_prior_chains(prior_chains: Optional[List[Dict[str, Any]]]) -> str:
+    if not prior_chains:
+        return ""
+    blocks = []
+    for chain in prior_chains:
+        steps = "\n".join(f"  - {step}" for step in chain.get("reasoning_steps", []))
+        blocks.append(f"- {chain.get('conclusion', '')} (confidence {chain.get('confidence', 0)})\n{steps}".rstrip())
+    return "\n\nPrior validated reasoning for similar queries (reuse steps that still apply):\n" + "\n".join(blocks)
+
+
+def _freeze_context(context: Optional[Dict[str, Any]]) -> str:
+    # canonical (sorted) JSON: used both in prompts and as part of the cache key
+    if orjson is not None:
+        return orjson.dumps(context or {}, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str).decode()
+    return json.dumps(context or {}, sort_keys=True, default=str, ensure_ascii=False)
+
+
+def _cache_key(query: str, reasoning_type: str, context: Optional[Dict[str, Any]]) -> str:
+    # fixed-size digest: long queries/contexts aren't kept alive as cache keys
+    raw = f"{reasoning_type}\0{query}\0{_freeze_context(context)}"
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+class _ReasoningCache:
+    """Bounded LRU with per-entry TTL for verified reasoning results."""
+
+    def __init__(self, maxsize: int, ttl: float, min_confidence: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.min_confidence = min_confidence
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        if self.maxsize <= 0 or result.get("confidence", 1.0) < self.min_confidence:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ReasoningContext:
+    """Sub-results shared by the steps of one reasoning chain.
+
+    Results are keyed by (sub_query, reasoning_type) so a sub-query repeated
+    within the chain costs one LLM call; the last ``window`` results are handed
+    to later steps as prior chains.
+    """
+
+    def __init__(self, window: int = 5):
+        self.results: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=window)
+
+    def get(self, query: str, reasoning_type: str) -> Optional[Dict[str, Any]]:
+        return self.results.get((query, reasoning_type))
+
+    def put(self, query: str, reasoning_type: str, result: Dict[str, Any]) -> None:
+        self.results[(query, reasoning_type)] = result
+        self.recent.append(result)
+
+
 class ReasoningType(Enum):
     DEDUCTIVE = "deductive"
     INDUCTIVE = "inductive"
@@ -25,11 +117,13 @@ class ReasoningType(Enum):
 
 class VerbalReasoningEngine:
     def __init__(self):
-        self.client = (
-            AsyncOpenAI(api_key=settings.OPENAI_API_KEY) if (AsyncOpenAI and settings.OPENAI_API_KEY) else None
-        )
-        self.model = settings.OPENAI_MODEL
+        self.client = get_openai_client()
+        self.model = settings.REASONING_MODEL
+        self.limiter = get_rate_limiter()
         self.max_depth = settings.MAX_REASONING_DEPTH
+        self._reasoning_cache = _ReasoningCache(
+            settings.REASONING_CACHE_SIZE, settings.REASONING_CACHE_TTL, settings.REASONING_CACHE_MIN_CONFIDENCE
+        )
 
     async def reason(
         self,
@@ -37,10 +131,14 @@ class VerbalReasoningEngine:
         context: Dict[str, Any],
         reasoning_type: ReasoningType = ReasoningType.DEDUCTIVE,
         depth: int = 0,
+        prior_chains: Optional[List[Dict[str, Any]]] = None,
     ) -> Dict[str, Any]:
         if depth >= self.max_depth:
             return {"conclusion": "Maximum reasoning depth reached", "confidence": 0.5, "reasoning_steps": []}
 
+        if not query.strip():
+            return {"conclusion": "", "confidence": 0.0, "reasoning_steps": [], "reasoning_type": reasoning_type.value, "depth": depth}
+
         if not self.client:
             # fallback (sin OpenAI key)
             return {
@@ -51,10 +149,20 @@ class VerbalReasoningEngine:
                 "depth": depth,
             }
 
-        prompt = self._build_prompt(query, context, reasoning_type)
+        cache_key = _cache_key(query, reasoning_type.value, context)
+        cached = self._reasoning_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        prompt = truncate_prompt(
+            self._build_prompt(query, context, reasoning_type, prior_chains), self.model, settings.OPENAI_MAX_INPUT_TOKENS
+        )
 
         try:
-            resp = await self.client.chat.completions.create(
+            # completion tokens count against TPM too
+            await self.limiter.acquire(estimate_tokens(prompt, self.model) + 700)
+            resp = await chat_completion(
+                self.client,
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "Eres un motor de razonamiento verbal. Responde claro y estructurado."},
@@ -64,7 +172,7 @@ class VerbalReasoningEngine:
                 max_tokens=700,
             )
             text = (resp.choices[0].message.content or "").strip()
-            return {
+            result = {
                 "conclusion": text[:400],
                 "confidence": 0.7,
                 "reasoning_steps": [],
@@ -72,13 +180,21 @@ class VerbalReasoningEngine:
                 "depth": depth,
                 "full_response": text,
             }
+            self._reasoning_cache.put(cache_key, result)
+            return result
         except Exception as e:
             logger.exception("reasoning_error")
             return {"conclusion": "Reasoning failed", "confidence": 0.0, "reasoning_steps": [], "error": str(e)}
 
-    def _build_prompt(self, query: str, context: Dict[str, Any], reasoning_type: ReasoningType) -> str:
-        ctx = "\n".join([f"{k}: {v}" for k, v in (context or {}).items()])
-        return f"""Tipo: {reasoning_type.value}
+    def _build_prompt(
+        self,
+        query: str,
+        context: Dict[str, Any],
+        reasoning_type: ReasoningType,
+        prior_chains: Optional[List[Dict[str, Any]]] = None,
+    ) -> str:
+        ctx = _freeze_context(context)
+        prompt = f"""Tipo: {reasoning_type.value}
 
 Contexto:
 {ctx}
@@ -86,6 +202,7 @@ Contexto:
 Consulta: {query}
 
 Devuelve: premisas, pasos, conclusión y una recomendación accionable."""
+        return prompt + _format_prior_chains(prior_chains)
 
 """
 Verbal Reasoning Engine
@@ -95,7 +212,6 @@ Advanced verbal reasoning with multi-step logic chains
 from typing import Dict, List, Optional, Any
 from enum import Enum
 import structlog
-from openai import AsyncOpenAI
 from config.settings import settings
 
 logger = structlog.get_logger()
@@ -110,21 +226,120 @@ class ReasoningType(Enum):
     CAUSAL = "causal"
 
 
+# Static prompt templates; only the context and query slots vary per call
+_REASONING_PROMPTS: Dict[ReasoningType, str] = {
+    ReasoningType.DEDUCTIVE: """
+Given the following premises and context, apply deductive reasoning to reach a conclusion.
+
+Context:
+{context}
+
+Query: {query}
+
+Provide:
+1. Premises identified
+2. Logical steps
+3. Conclusion
+4. Confidence level (0-1)
+""",
+    ReasoningType.INDUCTIVE: """
+Given the following observations and context, apply inductive reasoning to form a general conclusion.
+
+Context:
+{context}
+
+Query: {query}
+
+Provide:
+1. Observations identified
+2. Pattern recognition
+3. General conclusion
+4. Confidence level (0-1)
+""",
+    ReasoningType.ABDUCTIVE: """
+Given the following observations and context, apply abductive reasoning to find the best explanation.
+
+Context:
+{context}
+
+Query: {query}
+
+Provide:
+1. Observations
+2. Possible explanations
+3. Best explanation (most likely)
+4. Confidence level (0-1)
+""",
+    ReasoningType.ANALOGICAL: """
+Given the following query and context, apply analogical reasoning by finding similar cases.
+
+Context:
+{context}
+
+Query: {query}
+
+Provide:
+1. Similar cases/analogies
+2. Mapping between cases
+3. Inferred conclusion
+4. Confidence level (0-1)
+""",
+    ReasoningType.CAUSAL: """
+Given the following query and context, apply causal reasoning to identify cause-effect relationships.
+
+Context:
+{context}
+
+Query: {query}
+
+Provide:
+1. Causal factors identified
+2. Causal chain
+3. Predicted outcome
+4. Confidence level (0-1)
+"""
+}
+
+_SYSTEM_PROMPTS: Dict[ReasoningType, str] = {
+    ReasoningType.DEDUCTIVE: "You are an expert in deductive reasoning. Apply strict logical rules.",
+    ReasoningType.INDUCTIVE: "You are an expert in inductive reasoning. Identify patterns and generalize.",
+    ReasoningType.ABDUCTIVE: "You are an expert in abductive reasoning. Find the best explanation.",
+    ReasoningType.ANALOGICAL: "You are an expert in analogical reasoning. Find and apply analogies.",
+    ReasoningType.CAUSAL: "You are an expert in causal reasoning. Identify cause-effect relationships."
+}
+
+
 class VerbalReasoningEngine:
     """Advanced verbal reasoning engine"""
     
     def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-        self.model = settings.OPENAI_MODEL
+        self.client = get_openai_client()
+        self.model = settings.REASONING_MODEL
+        self.limiter = get_rate_limiter()
         self.max_depth = settings.MAX_REASONING_DEPTH
-        self._reasoning_cache: Dict[str, Any] = {}
+        self._reasoning_cache = _ReasoningCache(
+            maxsize=settings.REASONING_CACHE_SIZE,
+            ttl=settings.REASONING_CACHE_TTL,
+            min_confidence=settings.REASONING_CACHE_MIN_CONFIDENCE
+        )
+    
+    def cached_result(
+        self,
+        query: str,
+        context: Dict[str, Any],
+        reasoning_type: ReasoningType = ReasoningType.DEDUCTIVE
+    ) -> Optional[Dict[str, Any]]:
+        """The cached result reason() would return for this query, if any"""
+        return self._reasoning_cache.get(_cache_key(query, reasoning_type.value, context))
     
     async def reason(
         self,
         query: str,
         context: Dict[str, Any],
         reasoning_type: ReasoningType = ReasoningType.DEDUCTIVE,
-        depth: int = 0
+        depth: int = 0,
+        prior_chains: Optional[List[Dict[str, Any]]] = None,
+        reasoning_ctx: Optional[ReasoningContext] = None
     ) -> Dict[str, Any]:
         """Perform verbal reasoning on a query"""
         
@@ -136,15 +351,36 @@ class VerbalReasoningEngine:
                 "reasoning_steps": []
             }
         
-        cache_key = f"{query}_{reasoning_type.value}_{hash(str(context))}"
-        if cache_key in self._reasoning_cache:
+        if not query.strip():
+            return {
+                "conclusion": "Empty query",
+                "confidence": 0.0,
+                "reasoning_steps": []
+            }
+        
+        if reasoning_ctx is not None:
+            known = reasoning_ctx.get(query, reasoning_type.value)
+            if known is not None:
+                return known
+            if prior_chains is None:
+                prior_chains = list(reasoning_ctx.recent)
+        
+        cache_key = _cache_key(query, reasoning_type.value, context)
+        cached = self._reasoning_cache.get(cache_key)
+        if cached is not None:
             logger.debug("Using cached reasoning result")
-            return self._reasoning_cache[cache_key]
+            if reasoning_ctx is not None:
+                reasoning_ctx.put(query, reasoning_type.value, cached)
+            return cached
         
         reasoning_prompt = self._build_reasoning_prompt(query, context, reasoning_type)
+        reasoning_prompt += _format_prior_chains(prior_chains)
+        reasoning_prompt = truncate_prompt(reasoning_prompt, self.model, settings.OPENAI_MAX_INPUT_TOKENS)
         
         try:
-            response = await self.client.chat.completions.create(
+            await self.limiter.acquire(estimate_tokens(reasoning_prompt, self.model) + 1000)
+            response = await chat_completion(
+                self.client,
                 model=self.model,
                 messages=[
                     {
@@ -164,8 +400,10 @@ class VerbalReasoningEngine:
             result["reasoning_type"] = reasoning_type.value
             result["depth"] = depth
             
-            # Cache result
-            self._reasoning_cache[cache_key] = result
+            # Cache result (skipped below the confidence threshold)
+            self._reasoning_cache.put(cache_key, result)
+            if reasoning_ctx is not None:
+                reasoning_ctx.put(query, reasoning_type.value, result)
             
             logger.info(
                 "Reasoning completed",
@@ -185,119 +423,46 @@ class VerbalReasoningEngine:
                 "error": str(e)
             }
     
-    def _build_reasoning_prompt(
+    async def reason_chain(
         self,
+        sub_queries: List[str],
+        context: Dict[str, Any],
+        reasoning_type: ReasoningType = ReasoningType.DEDUCTIVE
+    ) -> List[Dict[str, Any]]:
+        """Reason over dependent sub-queries in order, one depth level per step"""
+        reasoning_ctx = ReasoningContext(settings.REASONING_CHAIN_WINDOW)
+        return [
+            await self.reason(sub_query, context, reasoning_type, depth=depth, reasoning_ctx=reasoning_ctx)
+            for depth, sub_query in enumerate(sub_queries)
+        ]
+    
+    @staticmethod
+    def _build_reasoning_prompt(
         query: str,
         context: Dict[str, Any],
         reasoning_type: ReasoningType
     ) -> str:
         """Build reasoning prompt"""
-        context_str = "\n".join([f"{k}: {v}" for k, v in context.items()])
-        
-        prompts = {
-            ReasoningType.DEDUCTIVE: f"""
-Given the following premises and context, apply deductive reasoning to reach a conclusion.
-
-Context:
-{context_str}
-
-Query: {query}
-
-Provide:
-1. Premises identified
-2. Logical steps
-3. Conclusion
-4. Confidence level (0-1)
-""",
-            ReasoningType.INDUCTIVE: f"""
-Given the following observations and context, apply inductive reasoning to form a general conclusion.
-
-Context:
-{context_str}
-
-Query: {query}
-
-Provide:
-1. Observations identified
-2. Pattern recognition
-3. General conclusion
-4. Confidence level (0-1)
-""",
-            ReasoningType.ABDUCTIVE: f"""
-Given the following observations and context, apply abductive reasoning to find the best explanation.
-
-Context:
-{context_str}
-
-Query: {query}
-
-Provide:
-1. Observations
-2. Possible explanations
-3. Best explanation (most likely)
-4. Confidence level (0-1)
-""",
-            ReasoningType.ANALOGICAL: f"""
-Given the following query and context, apply analogical reasoning by finding similar cases.
-
-Context:
-{context_str}
-
-Query: {query}
-
-Provide:
-1. Similar cases/analogies
-2. Mapping between cases
-3. Inferred conclusion
-4. Confidence level (0-1)
-""",
-            ReasoningType.CAUSAL: f"""
-Given the following query and context, apply causal reasoning to identify cause-effect relationships.
-
-Context:
-{context_str}
-
-Query: {query}
-
-Provide:
-1. Causal factors identified
-2. Causal chain
-3. Predicted outcome
-4. Confidence level (0-1)
-"""
-        }
-        
-        return prompts.get(reasoning_type, prompts[ReasoningType.DEDUCTIVE])
+        return _REASONING_PROMPTS.get(reasoning_type, _REASONING_PROMPTS[ReasoningType.DEDUCTIVE]).format(
+            context=_freeze_context(context), query=query
+        )
     
-    def _get_system_prompt(self, reasoning_type: ReasoningType) -> str:
+    @staticmethod
+    def _get_system_prompt(reasoning_type: ReasoningType) -> str:
         """Get system prompt for reasoning type"""
-        prompts = {
-            ReasoningType.DEDUCTIVE: "You are an expert in deductive reasoning. Apply strict logical rules.",
-            ReasoningType.INDUCTIVE: "You are an expert in inductive reasoning. Identify patterns and generalize.",
-            ReasoningType.ABDUCTIVE: "You are an expert in abductive reasoning. Find the best explanation.",
-            ReasoningType.ANALOGICAL: "You are an expert in analogical reasoning. Find and apply analogies.",
-            ReasoningType.CAUSAL: "You are an expert in causal reasoning. Identify cause-effect relationships."
-        }
-        return prompts.get(reasoning_type, prompts[ReasoningType.DEDUCTIVE])
+        return _SYSTEM_PROMPTS.get(reasoning_type, _SYSTEM_PROMPTS[ReasoningType.DEDUCTIVE])
     
     def _parse_reasoning_response(self, response: str) -> Dict[str, Any]:
         """Parse reasoning response from LLM"""
-        # Simple parsing - can be enhanced with structured output
-        lines = response.split("\n")
-        conclusion = ""
+        conclusions = _CONCLUSION_RE.findall(response)
+        # drop markdown emphasis left around the value ("**Conclusion:** yes")
+        conclusion = conclusions[-1].split(":", 1)[-1].strip(" \t*_") if conclusions else ""
         confidence = 0.5
-        reasoning_steps = []
-        
-        for line in lines:
-            if "conclusion" in line.lower():
-                conclusion = line.split(":", 1)[-1].strip()
-            elif "confidence" in line.lower():
-                try:
-                    confidence = float(line.split(":")[-1].strip())
-                except:
-                    pass
-            elif line.strip().startswith(("1.", "2.", "3.", "4.", "-")):
-                reasoning_steps.append(line.strip())
+        confidences = _CONFIDENCE_RE.findall(response)
+        if confidences:
+            value, percent = confidences[-1]
+            confidence = min(max(float(value) / 100 if percent else float(value), 0.0), 1.0)
+        reasoning_steps = [step.strip() for step in _STEP_RE.findall(response)]
         
         return {
             "conclusion": conclusion or response[:200],
@@ -309,3 +474,9 @@ Provide:
     def is_ready(self) -> bool:
         """Check if reasoning engine is ready"""
         return self.client is not None and settings.OPENAI_API_KEY is not None
+
+
+@lru_cache(maxsize=1)
+def get_reasoning_engine() -> VerbalReasoningEngine:
+    """Process-wide VerbalReasoningEngine shared across requests."""
+    return VerbalReasoningEngine()
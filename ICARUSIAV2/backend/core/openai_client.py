@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Optional
+
+import httpx
+
+try:
+    from openai import APIConnectionError, APIError, APITimeoutError, AsyncOpenAI, RateLimitError  # type: ignore
+    _TRANSIENT_ERRORS: tuple = (APIConnectionError, APITimeoutError, RateLimitError)
+    # everything a completion may raise once retries are exhausted (callers fall back on these)
+    OPENAI_ERRORS: tuple = (APIError,)
+except Exception:  # pragma: no cover
+    AsyncOpenAI = None  # type: ignore
+    _TRANSIENT_ERRORS = ()
+    OPENAI_ERRORS = ()
+
+try:
+    import tiktoken  # type: ignore
+except Exception:  # pragma: no cover
+    tiktoken = None  # type: ignore
+
+try:
+    import h2  # type: ignore  # noqa: F401
+    _HTTP2 = True
+except Exception:  # pragma: no cover
+    _HTTP2 = False
+
+from config.settings import settings
+
+
+_client: Optional[Any] = None
+_client_lock = threading.Lock()
+
+
+def get_openai_client() -> Optional[Any]:
+    """Process-wide AsyncOpenAI client sharing one pooled HTTP connection set.
+
+    Returns None when the SDK or OPENAI_API_KEY is missing so callers can use
+    their offline fallbacks. Creation is locked: FastAPI resolves sync
+    dependencies on worker threads, and concurrent first requests must not
+    each open their own pool.
+    """
+    global _client
+    if _client is None and AsyncOpenAI is not None and settings.OPENAI_API_KEY:
+        with _client_lock:
+            if _client is None:
+                _client = _create_client()
+    return _client
+
+
+def _create_client() -> Any:
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        ),
+        timeout=httpx.Timeout(settings.OPENAI_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT),
+        http2=_HTTP2,
+    )
+    # retries are handled by chat_completion() so there is a single backoff policy
+    return AsyncOpenAI(api_key=settings.OPENAI_API_KEY, http_client=http_client, max_retries=0)
+
+
+async def close_openai_client() -> None:
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        await client.close()
+
+
+async def chat_completion(client: Any, **kwargs: Any) -> Any:
+    """``client.chat.completions.create`` retried on transient errors.
+
+    Connection errors, timeouts and 429s are retried with jittered exponential
+    backoff (OPENAI_RETRY_MIN_WAIT doubling up to OPENAI_RETRY_MAX_WAIT);
+    anything else, or the last failed attempt, propagates to the caller.
+    """
+    attempts = max(1, settings.OPENAI_RETRY_ATTEMPTS)
+    for attempt in range(attempts):
+        try:
+            return await client.chat.completions.create(**kwargs)
+        except _TRANSIENT_ERRORS:
+            if attempt == attempts - 1:
+                raise
+            ceiling = min(settings.OPENAI_RETRY_MAX_WAIT, settings.OPENAI_RETRY_MIN_WAIT * 2 ** attempt)
+            await asyncio.sleep(random.uniform(settings.OPENAI_RETRY_MIN_WAIT, ceiling))
+
+
+class RateLimiter:
+    """Request and token buckets sized to the account's per-minute limits.
+
+    Buckets refill continuously from the elapsed time on each acquire; callers
+    wait (in arrival order) until both have capacity. A limit of 0 disables
+    that bucket. ``burst`` caps the request bucket below a full minute's
+    worth, for APIs that enforce per-second throughput.
+    """
+
+    def __init__(self, rpm: int, tpm: int, burst: Optional[float] = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.burst = float(rpm if burst is None else burst)
+        self._requests = self.burst
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm > 0:
+            self._requests = min(self.burst, self._requests + elapsed * self.rpm / 60)
+        if self.tpm > 0:
+            self._tokens = min(float(self.tpm), self._tokens + elapsed * self.tpm / 60)
+
+    async def acquire(self, tokens: int = 0) -> None:
+        if self.rpm <= 0 and self.tpm <= 0:
+            return
+        async with self._lock:
+            # a single oversized request may drain the whole bucket but never waits forever
+            tokens = min(tokens, self.tpm) if self.tpm > 0 else 0
+            while True:
+                self._refill()
+                need_requests = 1 - self._requests if self.rpm > 0 else 0.0
+                need_tokens = tokens - self._tokens if self.tpm > 0 else 0.0
+                if need_requests <= 0 and need_tokens <= 0:
+                    break
+                await asyncio.sleep(
+                    max(
+                        need_requests * 60 / self.rpm if need_requests > 0 else 0.0,
+                        need_tokens * 60 / self.tpm if need_tokens > 0 else 0.0,
+                    )
+                )
+            if self.rpm > 0:
+                self._requests -= 1
+            if self.tpm > 0:
+                self._tokens -= tokens
+
+
+@lru_cache(maxsize=1)
+def get_rate_limiter() -> RateLimiter:
+    """Process-wide limiter shared by every OpenAI caller."""
+    return RateLimiter(settings.OPENAI_RPM_LIMIT, settings.OPENAI_TPM_LIMIT)
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str) -> Any:
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+@lru_cache(maxsize=1024)
+def estimate_tokens(prompt: str, model: str) -> int:
+    """Prompt token count for rate limiting (tiktoken when installed, ~4 chars/token otherwise)."""
+    if tiktoken is not None:
+        return len(_encoding(model).encode(prompt))
+    return len(prompt) // 4 + 1
+
+
+_TRIM_MARKER = "\n[...]\n"
+
+
+def truncate_prompt(prompt: str, model: str, max_tokens: int) -> str:
+    """Cap ``prompt`` at ``max_tokens`` by cutting its middle.
+
+    Instructions sit at both ends of our prompts and the pasted user input in
+    between, so head and tail are kept. Without tiktoken the budget is
+    approximated as 4 chars/token. A budget of 0 disables trimming.
+    """
+    if max_tokens <= 0:
+        return prompt
+    if tiktoken is None:
+        limit = max_tokens * 4
+        if len(prompt) <= limit:
+            return prompt
+        half = limit // 2
+        return prompt[:half] + _TRIM_MARKER + prompt[-half:]
+    enc = _encoding(model)
+    tokens = enc.encode(prompt)
+    if len(tokens) <= max_tokens:
+        return prompt
+    half = max_tokens // 2
+    return enc.decode(tokens[:half]) + _TRIM_MARKER + enc.decode(tokens[-half:])
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import threading
+from typing import Any, Optional
+
+try:
+    import redis.asyncio as aioredis  # type: ignore
+    REDIS_ERRORS: tuple = (aioredis.RedisError, OSError)
+except Exception:  # pragma: no cover
+    aioredis = None  # type: ignore
+    REDIS_ERRORS = (OSError,)
+
+from config.settings import settings
+
+
+_client: Optional[Any] = None
+_client_lock = threading.Lock()
+
+
+def get_redis() -> Optional[Any]:
+    """Process-wide ``redis.asyncio`` client over one connection pool.
+
+    Returns None when the redis package is missing so callers fall back to
+    their in-process state. Socket timeouts are short: Redis backs caches
+    here, and a slow Redis must cost less than the work it saves.
+    """
+    global _client
+    if _client is None and aioredis is not None:
+        with _client_lock:
+            if _client is None:
+                _client = aioredis.Redis(
+                    host=settings.REDIS_HOST,
+                    port=settings.REDIS_PORT,
+                    db=settings.REDIS_DB,
+                    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                    socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                )
+    return _client
+
+
+async def close_redis() -> None:
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        await client.aclose()
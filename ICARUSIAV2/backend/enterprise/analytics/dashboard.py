@@ -1,32 +1,137 @@
 from __future__ import annotations
 
-from collections import defaultdict
+import time
+from bisect import bisect_right
+from collections import Counter, defaultdict, deque, namedtuple
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import Any, Dict, Optional
+from functools import lru_cache
+from itertools import islice
+from operator import attrgetter
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+try:
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover
+    np = None  # type: ignore
 
 from config.settings import settings
 
+_FUNNEL_STAGES = ("greeting", "qualification", "presentation", "objection", "closing", "conversion")
+_MINUTE = 60
+_HOUR = 3600
+_DAY = 24 * _HOUR
+
+
+# tuple-backed record: no per-event dict, attribute reads by index
+Event = namedtuple("Event", ("type", "session_id", "timestamp", "data"))
+
+_timestamp = attrgetter("timestamp")
+
+
+def _recent(events: Deque[Event], cutoff: float) -> List[Event]:
+    # events are appended in time order, so the window is a suffix found by bisection
+    return list(islice(events, bisect_right(events, cutoff, key=_timestamp), None))
+
+
+@lru_cache(maxsize=1024)
+def _funnel_stage(event_type: str) -> Optional[str]:
+    # event types are a small fixed vocabulary; classify each once
+    et = event_type.lower()
+    for stage in _FUNNEL_STAGES[:-1]:
+        if stage in et:
+            return stage
+    if "conversion" in et or "sale" in et:
+        return "conversion"
+    return None
+
+
+def _funnel_from_stages(stages: Dict[str, int]) -> Dict[str, Any]:
+    conversion_rates: Dict[str, float] = {}
+    prev_count = stages["greeting"]
+    for stage, count in stages.items():
+        conversion_rates[stage] = (count / prev_count) * 100 if prev_count > 0 else 0
+        prev_count = count
+    return {
+        "stages": stages,
+        "conversion_rates": conversion_rates,
+        "overall_conversion": conversion_rates.get("conversion", 0),
+    }
+
+
+class _PerfRing:
+    """Response-time/success columns for the buffered events, as NumPy ring buffers.
+
+    Sized like the event deque and appended in lockstep with it, so the newest
+    ``n`` slots always line up with the newest ``n`` events.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.response_time = np.zeros(capacity, dtype=np.float64)
+        self.has_response_time = np.zeros(capacity, dtype=bool)
+        self.success = np.zeros(capacity, dtype=bool)
+        self._next = 0
+
+    def append(self, data: Dict[str, Any]) -> None:
+        i = self._next
+        self.has_response_time[i] = "response_time" in data
+        self.response_time[i] = data.get("response_time", 0) or 0
+        self.success[i] = bool(data.get("success", False))
+        self._next = (i + 1) % self.capacity
+
+    def stats(self, n: int) -> Tuple[float, float]:
+        """(average response time, success rate %) over the newest n events"""
+        if n <= 0:
+            return 0, 0
+        idx = (self._next - n + np.arange(n)) % self.capacity
+        response_times = self.response_time[idx][self.has_response_time[idx]]
+        avg = float(response_times.mean()) if response_times.size else 0
+        return avg, float(self.success[idx].mean() * 100)
+
+
+@dataclass
+class _RollupBucket:
+    total: int = 0
+    by_type: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    sessions: Set[str] = field(default_factory=set)
+    stages: Dict[str, int] = field(default_factory=lambda: dict.fromkeys(_FUNNEL_STAGES, 0))
+    response_time_sum: float = 0.0
+    response_time_count: int = 0
+    successes: int = 0
+
+    def add(self, event_type: str, session_id: str, data: Dict[str, Any], stage: Optional[str]) -> None:
+        self.total += 1
+        self.by_type[event_type] += 1
+        self.sessions.add(session_id)
+        if stage:
+            self.stages[stage] += 1
+        if "response_time" in data:
+            self.response_time_sum += data["response_time"]
+            self.response_time_count += 1
+        if data.get("success", False):
+            self.successes += 1
+
 
 class AnalyticsDashboard:
     def __init__(self):
-        self._events: list[dict[str, Any]] = []
-        self._metrics: dict[str, list[dict[str, Any]]] = defaultdict(list)
+        self._events: deque[Event] = deque(maxlen=settings.ANALYTICS_MAX_EVENTS)
+        self._metrics: dict[str, deque[Event]] = defaultdict(
+            lambda: deque(maxlen=settings.ANALYTICS_MAX_EVENTS)
+        )
         self.update_interval = settings.ANALYTICS_UPDATE_INTERVAL
 
     def track_event(self, event_type: str, session_id: str, data: Optional[Dict[str, Any]] = None) -> None:
-        ev = {"type": event_type, "session_id": session_id, "timestamp": datetime.utcnow(), "data": data or {}}
+        ev = Event(event_type, session_id, time.time(), data or {})
         self._events.append(ev)
         self._metrics[event_type].append(ev)
 
     def get_metrics(self, time_range: Optional[timedelta] = None) -> Dict[str, Any]:
-        cutoff = datetime.utcnow() - (time_range or timedelta(hours=24))
-        events = [e for e in self._events if e["timestamp"] > cutoff]
-        by_type: dict[str, int] = defaultdict(int)
-        by_session: dict[str, int] = defaultdict(int)
-        for e in events:
-            by_type[e["type"]] += 1
-            by_session[e["session_id"]] += 1
-        return {"total_events": len(events), "events_by_type": dict(by_type), "unique_sessions": len(by_session)}
+        cutoff = time.time() - (time_range or timedelta(hours=24)).total_seconds()
+        events = _recent(self._events, cutoff)
+        by_type = Counter(e.type for e in events)
+        sessions = {e.session_id for e in events}
+        return {"total_events": len(events), "events_by_type": dict(by_type), "unique_sessions": len(sessions)}
 
     def get_dashboard_data(self, time_range: Optional[timedelta] = None) -> Dict[str, Any]:
         return {"metrics": self.get_metrics(time_range=time_range), "timestamp": datetime.utcnow().isoformat()}
@@ -36,10 +141,10 @@ Real-time Analytics Dashboard
 Provides real-time analytics and metrics
 """
 
-from typing import Dict, List, Optional, Any
+from typing import Deque, Dict, List, Optional, Any
 from datetime import datetime, timedelta
 import structlog
-from collections import defaultdict
+from collections import defaultdict, deque
 from config.settings import settings
 
 logger = structlog.get_logger()
@@ -49,10 +154,21 @@ class AnalyticsDashboard:
     """Real-time analytics dashboard"""
     
     def __init__(self):
-        self._metrics: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
-        self._events: List[Dict[str, Any]] = []
+        # bounded ring buffers: the oldest events drop off in O(1)
+        self._metrics: Dict[str, Deque[Event]] = defaultdict(
+            lambda: deque(maxlen=settings.ANALYTICS_MAX_EVENTS)
+        )
+        self._events: Deque[Event] = deque(maxlen=settings.ANALYTICS_MAX_EVENTS)
+        # vectorized performance columns for windows past minute-rollup retention
+        self._perf = _PerfRing(settings.ANALYTICS_MAX_EVENTS) if np is not None else None
+        # running counts over everything currently in _events (decremented on eviction)
+        self._by_type: Counter = Counter()
+        self._session_counts: Counter = Counter()
         self.update_interval = settings.ANALYTICS_UPDATE_INTERVAL
         self._initialized = False
+        # incremental rollups maintained on ingest: bucket start (epoch s) -> bucket
+        self._rollups: Dict[str, Dict[int, _RollupBucket]] = {"minute": {}, "hourly": {}, "daily": {}}
+        self._rollup_cache: Dict[Tuple[str, int], Tuple[float, Dict[str, Any]]] = {}
     
     async def initialize(self):
         """Initialize analytics dashboard"""
@@ -70,21 +186,25 @@ class AnalyticsDashboard:
         data: Optional[Dict[str, Any]] = None
     ):
         """Track an event"""
-        event = {
-            "type": event_type,
-            "session_id": session_id,
-            "timestamp": datetime.now(),
-            "data": data or {}
-        }
+        # epoch seconds; float compares in window queries
+        event = Event(event_type, session_id, time.time(), data or {})
         
+        if len(self._events) == self._events.maxlen:
+            self._forget(self._events[0])
         self._events.append(event)
+        if self._perf is not None:
+            self._perf.append(event.data)
+        self._by_type[event_type] += 1
+        self._session_counts[session_id] += 1
         self._metrics[event_type].append(event)
-        
-        # Keep only recent events (last 10000)
-        if len(self._events) > 10000:
-            self._events = self._events[-10000:]
-        
-        logger.debug("Event tracked", event_type=event_type, session_id=session_id)
+        self._update_rollups(event_type, session_id, event.data)
+    
+    def _forget(self, event: Event):
+        """Remove an event about to be evicted from the running counts"""
+        for counter, key in ((self._by_type, event.type), (self._session_counts, event.session_id)):
+            counter[key] -= 1
+            if counter[key] <= 0:
+                del counter[key]
     
     def get_metrics(
         self,
@@ -92,31 +212,33 @@ class AnalyticsDashboard:
         time_range: Optional[timedelta] = None
     ) -> Dict[str, Any]:
         """Get metrics"""
-        cutoff = datetime.now() - (time_range or timedelta(hours=24))
+        cutoff = time.time() - (time_range or timedelta(hours=24)).total_seconds()
+        
+        if not metric_type and (not self._events or self._events[0].timestamp > cutoff):
+            # the whole buffer is inside the window: answer from the running counts
+            return {
+                "total_events": len(self._events),
+                "events_by_type": dict(self._by_type),
+                "unique_sessions": len(self._session_counts),
+                "time_range": str(time_range or timedelta(hours=24))
+            }
         
         if metric_type:
-            events = [
-                e for e in self._metrics.get(metric_type, [])
-                if e["timestamp"] > cutoff
-            ]
+            if metric_type not in self._metrics:
+                events = []
+            else:
+                events = _recent(self._metrics[metric_type], cutoff)
         else:
-            events = [
-                e for e in self._events
-                if e["timestamp"] > cutoff
-            ]
+            events = _recent(self._events, cutoff)
         
         # Calculate basic metrics
-        by_type = defaultdict(int)
-        by_session = defaultdict(int)
-        
-        for event in events:
-            by_type[event["type"]] += 1
-            by_session[event["session_id"]] += 1
+        by_type = Counter(event.type for event in events)
+        sessions = {event.session_id for event in events}
         
         return {
             "total_events": len(events),
             "events_by_type": dict(by_type),
-            "unique_sessions": len(by_session),
+            "unique_sessions": len(sessions),
             "time_range": str(time_range or timedelta(hours=24))
         }
     
@@ -125,71 +247,71 @@ class AnalyticsDashboard:
         time_range: Optional[timedelta] = None
     ) -> Dict[str, Any]:
         """Get conversion funnel metrics"""
-        cutoff = datetime.now() - (time_range or timedelta(hours=24))
-        
-        events = [e for e in self._events if e["timestamp"] > cutoff]
-        
-        # Define funnel stages
-        stages = {
-            "greeting": 0,
-            "qualification": 0,
-            "presentation": 0,
-            "objection": 0,
-            "closing": 0,
-            "conversion": 0
-        }
+        seconds = int((time_range or timedelta(hours=24)).total_seconds())
+        if seconds <= settings.ANALYTICS_ROLLUP_MINUTE_RETENTION_MINUTES * _MINUTE:
+            # sum per-minute stage counters instead of classifying every event
+            stages = dict.fromkeys(_FUNNEL_STAGES, 0)
+            for bucket in self._window_buckets("minute", _MINUTE, seconds):
+                for stage, count in bucket.stages.items():
+                    stages[stage] += count
+            return _funnel_from_stages(stages)
+        
+        cutoff = time.time() - seconds
+        events = _recent(self._events, cutoff)
         
+        stages = dict.fromkeys(_FUNNEL_STAGES, 0)
         for event in events:
-            event_type = event["type"].lower()
-            if "greeting" in event_type:
-                stages["greeting"] += 1
-            elif "qualification" in event_type:
-                stages["qualification"] += 1
-            elif "presentation" in event_type:
-                stages["presentation"] += 1
-            elif "objection" in event_type:
-                stages["objection"] += 1
-            elif "closing" in event_type:
-                stages["closing"] += 1
-            elif "conversion" in event_type or "sale" in event_type:
-                stages["conversion"] += 1
-        
-        # Calculate conversion rates
-        conversion_rates = {}
-        prev_count = stages["greeting"]
-        for stage, count in stages.items():
-            if prev_count > 0:
-                conversion_rates[stage] = (count / prev_count) * 100
-            else:
-                conversion_rates[stage] = 0
-            prev_count = count
+            stage = _funnel_stage(event.type)
+            if stage:
+                stages[stage] += 1
         
-        return {
-            "stages": stages,
-            "conversion_rates": conversion_rates,
-            "overall_conversion": conversion_rates.get("conversion", 0)
-        }
+        return _funnel_from_stages(stages)
     
     def get_performance_metrics(
         self,
         time_range: Optional[timedelta] = None
     ) -> Dict[str, Any]:
         """Get performance metrics"""
-        cutoff = datetime.now() - (time_range or timedelta(hours=24))
+        seconds = int((time_range or timedelta(hours=24)).total_seconds())
+        if seconds <= settings.ANALYTICS_ROLLUP_MINUTE_RETENTION_MINUTES * _MINUTE:
+            total = successes = response_time_count = 0
+            response_time_sum = 0.0
+            for bucket in self._window_buckets("minute", _MINUTE, seconds):
+                total += bucket.total
+                successes += bucket.successes
+                response_time_sum += bucket.response_time_sum
+                response_time_count += bucket.response_time_count
+            return {
+                "total_events": total,
+                "average_response_time": response_time_sum / response_time_count if response_time_count else 0,
+                "success_rate": (successes / total * 100) if total else 0,
+                "events_per_hour": total / max(seconds / 3600, 1)
+            }
+        
+        cutoff = time.time() - seconds
+        if self._perf is not None:
+            count = len(self._events) - bisect_right(self._events, cutoff, key=_timestamp)
+            avg_response_time, success_rate = self._perf.stats(count)
+            return {
+                "total_events": count,
+                "average_response_time": avg_response_time,
+                "success_rate": success_rate,
+                "events_per_hour": count / max(seconds / 3600, 1)
+            }
         
-        events = [e for e in self._events if e["timestamp"] > cutoff]
+        events = _recent(self._events, cutoff)
         
         # Calculate response times (if available in event data)
         response_times = [
-            e["data"].get("response_time", 0)
+            e.data["response_time"]
             for e in events
-            if "response_time" in e.get("data", {})
+            if "response_time" in e.data
         ]
         
         avg_response_time = sum(response_times) / len(response_times) if response_times else 0
         
         # Calculate success rates
-        success_events = [e for e in events if e.get("data", {}).get("success", False)]
+        success_events = [e for e in events if e.data.get("success", False)]
         success_rate = (len(success_events) / len(events) * 100) if events else 0
         
         return {
@@ -210,3 +332,96 @@ class AnalyticsDashboard:
             "performance": self.get_performance_metrics(time_range=time_range),
             "timestamp": datetime.now().isoformat()
         }
+    
+    def _update_rollups(self, event_type: str, session_id: str, data: Dict[str, Any]):
+        """Fold an event into the minute, hourly and daily rollup buckets"""
+        now = int(time.time())
+        stage = _funnel_stage(event_type)
+        for grain, width, retention in (
+            ("minute", _MINUTE, settings.ANALYTICS_ROLLUP_MINUTE_RETENTION_MINUTES * _MINUTE),
+            ("hourly", _HOUR, settings.ANALYTICS_ROLLUP_HOURLY_RETENTION_HOURS * _HOUR),
+            ("daily", _DAY, settings.ANALYTICS_ROLLUP_DAILY_RETENTION_DAYS * _DAY),
+        ):
+            buckets = self._rollups[grain]
+            start = now - now % width
+            bucket = buckets.get(start)
+            if bucket is None:
+                bucket = buckets[start] = _RollupBucket()
+                # a new bucket opened: drop the ones that fell out of retention
+                for old in [b for b in buckets if b < now - retention]:
+                    del buckets[old]
+            bucket.add(event_type, session_id, data, stage)
+    
+    def _window_buckets(self, grain: str, width: int, seconds: int):
+        """Yield the rollup buckets overlapping the last `seconds` (oldest one partially)"""
+        cutoff = int(time.time()) - seconds
+        first = cutoff - cutoff % width
+        for start, bucket in self._rollups[grain].items():
+            if start >= first:
+                yield bucket
+    
+    def get_dashboard_data_rollup(
+        self,
+        time_range: Optional[timedelta] = None
+    ) -> Dict[str, Any]:
+        """Get dashboard data from pre-aggregated rollups.
+        
+        Uses hourly buckets up to 48h and daily buckets beyond that; falls back
+        to the raw event scan when the range exceeds rollup retention.
+        """
+        time_range = time_range or timedelta(hours=24)
+        seconds = int(time_range.total_seconds())
+        if seconds <= 48 * _HOUR:
+            grain, width, retention = "hourly", _HOUR, settings.ANALYTICS_ROLLUP_HOURLY_RETENTION_HOURS * _HOUR
+        else:
+            grain, width, retention = "daily", _DAY, settings.ANALYTICS_ROLLUP_DAILY_RETENTION_DAYS * _DAY
+        if seconds > retention:
+            return self.get_dashboard_data(time_range=time_range)
+        
+        cache_key = (grain, seconds)
+        now = time.time()
+        cached = self._rollup_cache.get(cache_key)
+        if cached and cached[0] > now:
+            return cached[1]
+        
+        total = successes = response_time_count = 0
+        response_time_sum = 0.0
+        by_type: Dict[str, int] = defaultdict(int)
+        sessions: Set[str] = set()
+        stages = dict.fromkeys(_FUNNEL_STAGES, 0)
+        for bucket in self._window_buckets(grain, width, seconds):
+            total += bucket.total
+            successes += bucket.successes
+            response_time_sum += bucket.response_time_sum
+            response_time_count += bucket.response_time_count
+            sessions |= bucket.sessions
+            for event_type, count in bucket.by_type.items():
+                by_type[event_type] += count
+            for stage, count in bucket.stages.items():
+                stages[stage] += count
+        
+        data = {
+            "metrics": {
+                "total_events": total,
+                "events_by_type": dict(by_type),
+                "unique_sessions": len(sessions),
+                "time_range": str(time_range)
+            },
+            "funnel": _funnel_from_stages(stages),
+            "performance": {
+                "total_events": total,
+                "average_response_time": response_time_sum / response_time_count if response_time_count else 0,
+                "success_rate": (successes / total * 100) if total else 0,
+                "events_per_hour": total / max(seconds / 3600, 1)
+            },
+            "grain": grain,
+            "timestamp": datetime.now().isoformat()
+        }
+        self._rollup_cache[cache_key] = (now + settings.ANALYTICS_CACHE_TTL, data)
+        return data
+
+
+@lru_cache(maxsize=1)
+def get_analytics_dashboard() -> AnalyticsDashboard:
+    """Process-wide AnalyticsDashboard shared across requests."""
+    return AnalyticsDashboard()
@@ -1,23 +1,64 @@
 from __future__ import annotations
 
-from datetime import datetime
+import hashlib
+import json
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import Any, Dict, Optional
 
+try:
+    import h2  # type: ignore  # noqa: F401
+    _HTTP2 = True
+except Exception:  # pragma: no cover
+    _HTTP2 = False
+
+try:
+    import orjson  # type: ignore
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+
+_LEAD_ID_KEY = b"icarus-lead"
+
+
+def _lead_digest(lead_data: Dict[str, Any]) -> int:
+    # 40-bit keyed digest of the canonical JSON: stable across processes, unlike hash(str(...))
+    if orjson is not None:
+        raw = orjson.dumps(lead_data, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str)
+    else:
+        raw = json.dumps(lead_data, sort_keys=True, default=str).encode()
+    return int.from_bytes(hashlib.blake2b(raw, digest_size=5, key=_LEAD_ID_KEY).digest(), "big")
+
+
+@dataclass(slots=True)
+class _CRMIntegrationState:
+    type: str
+    credentials: Dict[str, Any] = field(default_factory=dict)
+    endpoint: Optional[str] = None
+    connected: bool = True
+    last_sync: Optional[str] = None
+
+
+def _auth_headers(integration: _CRMIntegrationState) -> Dict[str, str]:
+    credentials = integration.credentials
+    token = credentials.get("access_token") or credentials.get("api_key")
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
 
 class CRMIntegration:
     def __init__(self):
         self._connected: dict[str, dict[str, Any]] = {}
 
     async def connect(self, crm_type: str, credentials: Dict[str, Any]) -> bool:
-        self._connected[crm_type] = {"credentials": credentials, "connected": True, "at": datetime.utcnow().isoformat()}
+        self._connected[crm_type] = {"credentials": credentials, "connected": True, "at": time.time()}
         return True
 
     async def sync_lead(self, crm_type: str, lead_data: Dict[str, Any]) -> Optional[str]:
         # Placeholder (integrar APIs reales por proveedor)
         if crm_type not in self._connected:
             # allow “best effort” even if not connected
-            self._connected[crm_type] = {"connected": False, "at": datetime.utcnow().isoformat()}
-        return f"{crm_type}_lead_{abs(hash(str(lead_data))) % 10_000_000}"
+            self._connected[crm_type] = {"connected": False, "at": time.time()}
+        return f"{crm_type}_lead_{_lead_digest(lead_data)}"
 
 """
 CRM Integration
@@ -37,8 +78,34 @@ class CRMIntegration:
     """CRM integration system"""
     
     def __init__(self):
-        self._integrations: Dict[str, Dict[str, Any]] = {}
+        self._integrations: Dict[str, _CRMIntegrationState] = {}
         self.sync_interval = settings.CRM_SYNC_INTERVAL
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Get the shared HTTP client (keeps CRM connections alive across requests)"""
+        if not self._client:
+            self._client = httpx.AsyncClient(
+                timeout=settings.CRM_TIMEOUT,
+                limits=httpx.Limits(
+                    max_keepalive_connections=settings.CRM_MAX_KEEPALIVE_CONNECTIONS,
+                    max_connections=settings.CRM_MAX_CONNECTIONS
+                ),
+                http2=_HTTP2
+            )
+        return self._client
+    
+    async def close(self):
+        """Close the shared HTTP client"""
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+    
+    async def __aenter__(self) -> "CRMIntegration":
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
     
     async def connect(
         self,
@@ -48,12 +115,19 @@ class CRMIntegration:
         """Connect to CRM system"""
         try:
             # Store credentials
-            self._integrations[crm_type] = {
-                "type": crm_type,
-                "credentials": credentials,
-                "connected": True,
-                "last_sync": None
-            }
+            integration = self._integrations[crm_type] = _CRMIntegrationState(
+                type=crm_type,
+                credentials=credentials,
+                endpoint=credentials.get("endpoint")
+            )
+            
+            # Open the pooled connection now so the first sync skips the TCP/TLS handshake
+            endpoint = integration.endpoint
+            if endpoint:
+                try:
+                    await self._get_client().head(endpoint, headers=_auth_headers(integration))
+                except httpx.HTTPError as e:
+                    logger.warning("CRM warmup failed", crm_type=crm_type, error=str(e))
             
             logger.info("CRM connected", crm_type=crm_type)
             return True
@@ -68,12 +142,12 @@ class CRMIntegration:
         lead_data: Dict[str, Any]
     ) -> Optional[str]:
         """Sync lead to CRM"""
-        if crm_type not in self._integrations:
+        integration = self._integrations.get(crm_type)
+        if integration is None:
             logger.error("CRM not connected", crm_type=crm_type)
             return None
         
         try:
-            integration = self._integrations[crm_type]
             
             # Map lead data to CRM format
             crm_lead = self._map_lead_to_crm(lead_data, crm_type)
@@ -82,7 +156,7 @@ class CRMIntegration:
             lead_id = await self._sync_to_crm(crm_type, integration, crm_lead)
             
             if lead_id:
-                integration["last_sync"] = str(datetime.now())
+                integration.last_sync = str(datetime.now())
                 logger.info("Lead synced", crm_type=crm_type, lead_id=lead_id)
             
             return lead_id
@@ -97,11 +171,11 @@ class CRMIntegration:
         lead_id: str
     ) -> Optional[Dict[str, Any]]:
         """Get lead from CRM"""
-        if crm_type not in self._integrations:
+        integration = self._integrations.get(crm_type)
+        if integration is None:
             return None
         
         try:
-            integration = self._integrations[crm_type]
             lead = await self._get_from_crm(crm_type, integration, lead_id)
             
             if lead:
@@ -120,11 +194,11 @@ class CRMIntegration:
         updates: Dict[str, Any]
     ) -> bool:
         """Update lead in CRM"""
-        if crm_type not in self._integrations:
+        integration = self._integrations.get(crm_type)
+        if integration is None:
             return False
         
         try:
-            integration = self._integrations[crm_type]
             success = await self._update_in_crm(crm_type, integration, lead_id, updates)
             
             if success:
@@ -157,33 +231,53 @@ class CRMIntegration:
     async def _sync_to_crm(
         self,
         crm_type: str,
-        integration: Dict[str, Any],
+        integration: _CRMIntegrationState,
         lead_data: Dict[str, Any]
     ) -> Optional[str]:
         """Sync lead to specific CRM"""
-        # Placeholder - implement actual CRM API calls
-        # Examples: Salesforce, HubSpot, Pipedrive, etc.
-        return f"crm_{crm_type}_{len(lead_data)}"
+        endpoint = integration.endpoint
+        if not endpoint:
+            # Placeholder until a provider endpoint is configured (Salesforce, HubSpot, Pipedrive, etc.)
+            return f"crm_{crm_type}_{len(lead_data)}"
+        
+        response = await self._get_client().post(endpoint, json=lead_data, headers=_auth_headers(integration))
+        response.raise_for_status()
+        lead_id = response.json().get("id")
+        return str(lead_id) if lead_id is not None else None
     
     async def _get_from_crm(
         self,
         crm_type: str,
-        integration: Dict[str, Any],
+        integration: _CRMIntegrationState,
         lead_id: str
     ) -> Optional[Dict[str, Any]]:
         """Get lead from specific CRM"""
-        # Placeholder - implement actual CRM API calls
-        return None
+        endpoint = integration.endpoint
+        if not endpoint:
+            return None
+        
+        response = await self._get_client().get(f"{endpoint.rstrip('/')}/{lead_id}", headers=_auth_headers(integration))
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
     
     async def _update_in_crm(
         self,
         crm_type: str,
-        integration: Dict[str, Any],
+        integration: _CRMIntegrationState,
         lead_id: str,
         updates: Dict[str, Any]
     ) -> bool:
         """Update lead in specific CRM"""
-        # Placeholder - implement actual CRM API calls
+        endpoint = integration.endpoint
+        if not endpoint:
+            return True
+        
+        response = await self._get_client().patch(
+            f"{endpoint.rstrip('/')}/{lead_id}", json=updates, headers=_auth_headers(integration)
+        )
+        response.raise_for_status()
         return True
     
     def get_integrations(self) -> List[str]:
@@ -192,4 +286,11 @@ class CRMIntegration:
     
     def is_connected(self, crm_type: str) -> bool:
         """Check if CRM is connected"""
-        return crm_type in self._integrations and self._integrations[crm_type].get("connected", False)
+        integration = self._integrations.get(crm_type)
+        return integration is not None and integration.connected
+
+
+@lru_cache(maxsize=1)
+def get_crm_integration() -> CRMIntegration:
+    """Process-wide CRMIntegration shared across requests."""
+    return CRMIntegration()
@@ -1,7 +1,18 @@
 from __future__ import annotations
 
+from functools import lru_cache
 from typing import Any, Dict
 
+try:
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover
+    np = None  # type: ignore
+
+try:
+    from sentence_transformers import SentenceTransformer  # type: ignore
+except Exception:  # pragma: no cover
+    SentenceTransformer = None  # type: ignore
+
 
 class MultiAgentCoordinator:
     def __init__(self):
@@ -15,11 +26,16 @@ Multi-Agent Orchestration Coordinator
 Coordinates multiple AI agents
 """
 
-from typing import Dict, List, Optional, Any, Callable
+from typing import Dict, List, Optional, Any, Callable, Set, Tuple
 from enum import Enum
 import structlog
 import asyncio
+import heapq
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime
+from config.settings import settings
 
 logger = structlog.get_logger()
 
@@ -40,23 +56,56 @@ class MultiAgentCoordinator:
         self._agents: Dict[str, Dict[str, Any]] = {}
         self._active_sessions: Dict[str, Dict[str, Any]] = {}
         self._routing_rules: Dict[str, Callable] = {}
+        # Least-loaded selection: (load, registration order, agent_id) min-heaps per
+        # capability plus one over all agents. Entries are pushed on every load change
+        # and stale ones (load no longer current, agent inactive) are dropped lazily.
+        self._by_capability: Dict[str, Set[str]] = {}
+        self._heaps: Dict[str, List[Tuple[int, int, str]]] = {}
+        self._all_heap: List[Tuple[int, int, str]] = []
+        # optional per-agent concurrency caps (None = unbounded)
+        self._agent_sem: Dict[str, Optional[asyncio.Semaphore]] = {}
+        # Semantic routing: unit-norm description embeddings, one row per agent,
+        # so a request is scored against every agent with a single mat-vec product
+        self._encoder = None
+        self._encoder_lock = threading.Lock()
+        self._encoder_failed = np is None or SentenceTransformer is None
+        self._agent_emb = None
+        self._emb_agents: List[Optional[str]] = []
+        self._emb_row: Dict[str, int] = {}
     
     def register_agent(
         self,
         agent_id: str,
         role: AgentRole,
         handler: Callable,
-        capabilities: List[str]
+        capabilities: List[str],
+        max_concurrency: Optional[int] = None,
+        description: Optional[str] = None
     ):
-        """Register an agent"""
+        """Register an agent
+        
+        With a description (and sentence-transformers installed) the agent also
+        takes part in semantic routing of free-text requests.
+        """
+        previous = self._agents.get(agent_id)
+        if previous:
+            for capability in previous["capabilities"]:
+                self._by_capability.get(capability, set()).discard(agent_id)
+        
         self._agents[agent_id] = {
             "id": agent_id,
             "role": role.value,
             "handler": handler,
-            "capabilities": capabilities,
+            "capabilities": frozenset(capabilities),
             "active": True,
-            "load": 0
+            "load": 0,
+            "order": len(self._agents) if not previous else previous["order"]
         }
+        for capability in capabilities:
+            self._by_capability.setdefault(capability, set()).add(agent_id)
+        self._push_load(agent_id)
+        self._agent_sem[agent_id] = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self._set_embedding(agent_id, description)
         
         logger.info("Agent registered", agent_id=agent_id, role=role.value)
     
@@ -68,8 +117,14 @@ class MultiAgentCoordinator:
     ) -> Dict[str, Any]:
         """Route request to appropriate agent"""
         
+        # Embed free-text requests in a worker thread: encoding is CPU-bound
+        query = None
+        text = request.get("text")
+        if text and self._emb_row and request.get("agent_id") not in self._agents:
+            query = await asyncio.to_thread(self._encode, text)
+        
         # Determine which agent to use
-        agent_id = self._select_agent(request, context)
+        agent_id = self._select_agent(request, context, query)
         
         if not agent_id:
             logger.warning("No agent available", session_id=session_id)
@@ -81,7 +136,8 @@ class MultiAgentCoordinator:
         if session_id not in self._active_sessions:
             self._active_sessions[session_id] = {
                 "current_agent": agent_id,
-                "history": [],
+                # short-term working memory; the breadcrumb trail is the audit log
+                "history": deque(maxlen=settings.SESSION_HISTORY_MAX),
                 "started_at": datetime.now()
             }
         
@@ -94,9 +150,9 @@ class MultiAgentCoordinator:
         
         # Route to agent
         try:
-            agent["load"] += 1
-            response = await agent["handler"](request, context)
-            agent["load"] -= 1
+            with self._track_load(agent_id):
+                async with self._agent_slot(agent_id):
+                    response = await agent["handler"](request, context)
             
             logger.info("Request routed", session_id=session_id, agent_id=agent_id)
             
@@ -107,7 +163,6 @@ class MultiAgentCoordinator:
             }
             
         except Exception as e:
-            agent["load"] -= 1
             logger.error("Agent handling error", agent_id=agent_id, error=str(e))
             return {
                 "agent_id": agent_id,
@@ -118,9 +173,10 @@ class MultiAgentCoordinator:
     def _select_agent(
         self,
         request: Dict[str, Any],
-        context: Optional[Dict[str, Any]]
+        context: Optional[Dict[str, Any]],
+        query=None
     ) -> Optional[str]:
-        """Select appropriate agent"""
+        """Select appropriate agent (query: the request text's embedding, if any)"""
         # Simple routing logic - can be enhanced
         
         # Check for explicit agent in request
@@ -128,63 +184,181 @@ class MultiAgentCoordinator:
             if request["agent_id"] in self._agents:
                 return request["agent_id"]
         
-        # Route based on request type
         request_type = request.get("type", "general")
         
-        # Find agents with matching capabilities
-        suitable_agents = []
-        for agent_id, agent in self._agents.items():
-            if not agent["active"]:
-                continue
-            
-            if request_type in agent["capabilities"]:
-                suitable_agents.append((agent_id, agent))
+        # Free-text requests go to the closest agent descriptions when embeddings are
+        # available; a typed request only considers agents with that capability
+        if query is not None:
+            members = self._by_capability.get(request_type, set()) if "type" in request else None
+            agent_id = self._select_semantic(query, members)
+            if agent_id:
+                return agent_id
+        
+        # Route based on request type: least-loaded agent with a matching capability,
+        # falling back to the least-loaded available agent
+        heap = self._heaps.get(request_type)
+        agent_id = self._peek_least_loaded(heap, self._by_capability.get(request_type)) if heap else None
+        return agent_id or self._peek_least_loaded(self._all_heap, None)
+    
+    def _select_semantic(self, query, members: Optional[Set[str]]) -> Optional[str]:
+        """Least-loaded active agent among the AGENT_ROUTING_TOP_K best description matches
         
-        if not suitable_agents:
-            # Fallback to any available agent
-            suitable_agents = [
-                (aid, agent) for aid, agent in self._agents.items()
-                if agent["active"]
-            ]
+        members restricts the candidates (None = every agent with a description).
+        """
+        if members is None:
+            rows = np.arange(len(self._emb_agents))
+            sims = self._agent_emb[:rows.size] @ query
+        else:
+            rows = np.fromiter((self._emb_row[aid] for aid in members if aid in self._emb_row), dtype=np.intp)
+            if not rows.size:
+                return None
+            sims = self._agent_emb[rows] @ query
+        n = rows.size
+        k = min(settings.AGENT_ROUTING_TOP_K, n)
+        top = np.argpartition(-sims, k - 1)[:k] if k < n else range(n)
+        best = None
+        for row in top:
+            agent_id = self._emb_agents[rows[row]]
+            agent = self._agents.get(agent_id) if agent_id else None
+            if agent is None or not agent["active"]:
+                continue
+            key = (agent["load"], -float(sims[row]), agent["order"])
+            if best is None or key < best[0]:
+                best = (key, agent_id)
+        return best[1] if best else None
+    
+    def _set_embedding(self, agent_id: str, description: Optional[str]):
+        """Store (or drop) the agent's description embedding row"""
+        vector = self._encode(description) if description else None
+        row = self._emb_row.get(agent_id)
+        if vector is None:
+            if row is not None:
+                # rows are never shifted; a dropped agent just leaves an unused row
+                self._emb_agents[row] = None
+                del self._emb_row[agent_id]
+            return
+        if row is None:
+            row = len(self._emb_agents)
+            if self._agent_emb is None:
+                self._agent_emb = np.empty((16, vector.shape[0]), dtype=np.float32)
+            elif row == self._agent_emb.shape[0]:
+                grown = np.empty((2 * row, self._agent_emb.shape[1]), dtype=np.float32)
+                grown[:row] = self._agent_emb
+                self._agent_emb = grown
+            self._emb_agents.append(agent_id)
+            self._emb_row[agent_id] = row
+        self._agent_emb[row] = vector
+    
+    def load_encoder(self) -> bool:
+        """Load the routing encoder (blocking; called off the loop at startup)
         
-        if not suitable_agents:
+        Returns whether semantic routing is available.
+        """
+        if self._encoder is None and not self._encoder_failed:
+            with self._encoder_lock:
+                if self._encoder is None and not self._encoder_failed:
+                    try:
+                        self._encoder = SentenceTransformer(settings.AGENT_ROUTING_EMBEDDING_MODEL)
+                    except Exception as e:
+                        logger.error("Agent routing encoder unavailable", error=str(e))
+                        self._encoder_failed = True
+        return self._encoder is not None
+    
+    def _encode(self, text: str):
+        """Unit-norm float32 embedding, or None when no encoder is available"""
+        if not self.load_encoder():
             return None
+        vector = np.asarray(self._encoder.encode(text), dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+    
+    def set_agent_active(self, agent_id: str, active: bool):
+        """Take an agent out of (or back into) routing"""
+        agent = self._agents.get(agent_id)
+        if agent and agent["active"] != active:
+            agent["active"] = active
+            if active:
+                self._push_load(agent_id)
+    
+    @contextmanager
+    def _track_load(self, agent_id: str):
+        """Count an in-flight request against the agent for as long as it runs.
         
-        # Select agent with lowest load
-        suitable_agents.sort(key=lambda x: x[1]["load"])
-        return suitable_agents[0][0]
+        The decrement sits in ``finally`` so failures and cancellation can't leak
+        load. No lock is needed: the counter and heap updates never span an await.
+        """
+        self._adjust_load(agent_id, 1)
+        try:
+            yield
+        finally:
+            self._adjust_load(agent_id, -1)
+    
+    def _adjust_load(self, agent_id: str, delta: int):
+        """Change an agent's load and publish the new value to the selection heaps"""
+        self._agents[agent_id]["load"] += delta
+        self._push_load(agent_id)
+    
+    def _push_load(self, agent_id: str):
+        agent = self._agents[agent_id]
+        entry = (agent["load"], agent["order"], agent_id)
+        for capability in agent["capabilities"]:
+            heap = self._heaps.setdefault(capability, [])
+            heapq.heappush(heap, entry)
+            if len(heap) > 4 * len(self._by_capability[capability]) + 16:
+                self._rebuild(heap, self._by_capability[capability])
+        heapq.heappush(self._all_heap, entry)
+        if len(self._all_heap) > 4 * len(self._agents) + 16:
+            self._rebuild(self._all_heap, self._agents)
+    
+    def _rebuild(self, heap: List[Tuple[int, int, str]], members):
+        """Drop stale entries once they outnumber live ones"""
+        agents = [self._agents[aid] for aid in members]
+        heap[:] = [(a["load"], a["order"], a["id"]) for a in agents if a["active"]]
+        heapq.heapify(heap)
+    
+    def _peek_least_loaded(
+        self,
+        heap: List[Tuple[int, int, str]],
+        members: Optional[Set[str]]
+    ) -> Optional[str]:
+        """Top of heap after discarding stale entries (lazy deletion)"""
+        while heap:
+            load, _, agent_id = heap[0]
+            agent = self._agents.get(agent_id)
+            if (
+                agent is not None
+                and agent["active"]
+                and agent["load"] == load
+                and (members is None or agent_id in members)
+            ):
+                return agent_id
+            heapq.heappop(heap)
+        return None
     
     async def orchestrate_workflow(
         self,
         session_id: str,
-        workflow: List[Dict[str, Any]]
+        workflow: List[Dict[str, Any]],
+        parallel: bool = False
     ) -> Dict[str, Any]:
-        """Orchestrate multi-step workflow"""
-        results = []
-        
-        for step in workflow:
-            agent_id = step.get("agent_id")
-            if not agent_id or agent_id not in self._agents:
-                results.append({"error": f"Agent {agent_id} not found"})
-                continue
-            
-            agent = self._agents[agent_id]
-            
-            try:
-                result = await agent["handler"](step.get("request", {}), step.get("context"))
-                results.append({
-                    "step": step.get("name", "unknown"),
-                    "agent": agent_id,
-                    "result": result,
-                    "success": True
-                })
-            except Exception as e:
-                results.append({
-                    "step": step.get("name", "unknown"),
-                    "agent": agent_id,
-                    "error": str(e),
-                    "success": False
-                })
+        """
+        Orchestrate multi-step workflow
+        Steps run in order by default. With parallel=True they run concurrently
+        (bounded by each agent's max_concurrency); a step's "depends_on" lists the
+        names of earlier steps it must wait for. Results keep workflow order.
+        """
+        if not parallel:
+            results = [await self._run_step(step) for step in workflow]
+        else:
+            tasks: Dict[str, asyncio.Task] = {}
+            ordered = []
+            for step in workflow:
+                deps = [tasks[name] for name in step.get("depends_on", ()) if name in tasks]
+                task = asyncio.ensure_future(self._run_step(step, deps))
+                if "name" in step:
+                    tasks[step["name"]] = task
+                ordered.append(task)
+            results = list(await asyncio.gather(*ordered))
         
         return {
             "session_id": session_id,
@@ -193,6 +367,49 @@ class MultiAgentCoordinator:
             "total_steps": len(workflow)
         }
     
+    async def _run_step(
+        self,
+        step: Dict[str, Any],
+        depends_on: Optional[List[asyncio.Task]] = None
+    ) -> Dict[str, Any]:
+        """Run one workflow step; failures are reported in the result, never raised"""
+        if depends_on:
+            await asyncio.gather(*depends_on)
+        
+        agent_id = step.get("agent_id")
+        if not agent_id or agent_id not in self._agents:
+            return {"error": f"Agent {agent_id} not found"}
+        
+        agent = self._agents[agent_id]
+        
+        try:
+            with self._track_load(agent_id):
+                async with self._agent_slot(agent_id):
+                    result = await agent["handler"](step.get("request", {}), step.get("context"))
+            return {
+                "step": step.get("name", "unknown"),
+                "agent": agent_id,
+                "result": result,
+                "success": True
+            }
+        except Exception as e:
+            return {
+                "step": step.get("name", "unknown"),
+                "agent": agent_id,
+                "error": str(e),
+                "success": False
+            }
+    
+    @asynccontextmanager
+    async def _agent_slot(self, agent_id: str):
+        """Hold one of the agent's concurrency slots (no-op for unbounded agents)"""
+        semaphore = self._agent_sem.get(agent_id)
+        if semaphore is None:
+            yield
+            return
+        async with semaphore:
+            yield
+    
     def get_agent_status(self) -> Dict[str, Any]:
         """Get status of all agents"""
         return {
@@ -203,7 +420,7 @@ class MultiAgentCoordinator:
                     "role": agent["role"],
                     "active": agent["active"],
                     "load": agent["load"],
-                    "capabilities": agent["capabilities"]
+                    "capabilities": list(agent["capabilities"])
                 }
                 for aid, agent in self._agents.items()
             }
@@ -211,4 +428,13 @@ class MultiAgentCoordinator:
     
     def get_session_info(self, session_id: str) -> Optional[Dict[str, Any]]:
         """Get session information"""
-        return self._active_sessions.get(session_id)
+        info = self._active_sessions.get(session_id)
+        if info is None:
+            return None
+        return {**info, "history": list(info["history"])}
+
+
+@lru_cache(maxsize=1)
+def get_coordinator() -> MultiAgentCoordinator:
+    """Process-wide MultiAgentCoordinator shared across requests."""
+    return MultiAgentCoordinator()
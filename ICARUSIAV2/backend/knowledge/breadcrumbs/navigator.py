@@ -1,15 +1,22 @@
 from __future__ import annotations
 
+import time
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timezone
+from functools import lru_cache
 from typing import Any, Dict, List, Optional
 
 
-@dataclass
+def _iso(timestamp: float) -> str:
+    # timestamps are kept as epoch seconds and only formatted when serialized
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+
+@dataclass(slots=True)
 class Breadcrumb:
     id: str
     session_id: str
-    timestamp: datetime
+    timestamp: float
     module: str
     action: str
     context: Dict[str, Any] = field(default_factory=dict)
@@ -19,7 +26,7 @@ class Breadcrumb:
         return {
             "id": self.id,
             "session_id": self.session_id,
-            "timestamp": self.timestamp.isoformat(),
+            "timestamp": _iso(self.timestamp),
             "module": self.module,
             "action": self.action,
             "context": self.context,
@@ -42,7 +49,7 @@ class BreadcrumbsNavigator:
         b = Breadcrumb(
             id=f"{session_id}_{len(self._breadcrumbs.get(session_id, []))}",
             session_id=session_id,
-            timestamp=datetime.utcnow(),
+            timestamp=time.time(),
             module=module,
             action=action,
             context=context or {},
@@ -64,33 +71,76 @@ Breadcrumbs Navigator
 Navigation system for decision trails
 """
 
-from typing import Dict, List, Optional, Any
-from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional
 from dataclasses import dataclass, field
+from collections import defaultdict, deque
+from itertools import islice
+import asyncio
 import structlog
+from config.settings import settings
 
 logger = structlog.get_logger()
 
+# New breadcrumbs are buffered and applied in bulk every 10ms or every 100 items;
+# readers flush first, so trails are always up to date when read
+_FLUSH_INTERVAL = 0.01
+_FLUSH_BATCH = 100
+
 
-@dataclass
+@dataclass(slots=True)
 class Breadcrumb:
     """Represents a breadcrumb in the decision trail"""
     id: str
     session_id: str
-    timestamp: datetime
+    timestamp: float  # epoch seconds
     module: str
     action: str
     context: Dict[str, Any] = field(default_factory=dict)
     result: Optional[Any] = None
     metadata: Dict[str, Any] = field(default_factory=dict)
+    cleared: bool = field(default=False, repr=False, compare=False)  # session cleared; skipped by the module index
+    search_text: Optional[str] = field(default=None, init=False, repr=False, compare=False)  # lowercased, built on first search
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize breadcrumb for API responses"""
+        return {
+            "id": self.id,
+            "session_id": self.session_id,
+            "timestamp": _iso(self.timestamp),
+            "module": self.module,
+            "action": self.action,
+            "context": self.context,
+            "result": self.result,
+            "metadata": self.metadata,
+        }
+
+
+def _tail(items, limit: Optional[int], match: Optional[Callable[[Any], bool]] = None) -> List[Any]:
+    """Last ``limit`` items (all when falsy) matching ``match``, in order, without copying the rest"""
+    if match is None:
+        if not limit:
+            return list(items)
+        return list(islice(items, max(0, len(items) - limit), None))
+    if not limit:
+        return [item for item in items if match(item)]
+    found = list(islice((item for item in reversed(items) if match(item)), limit))
+    found.reverse()
+    return found
 
 
 class BreadcrumbsNavigator:
     """Navigates breadcrumb trails"""
     
     def __init__(self):
-        self._breadcrumbs: Dict[str, List[Breadcrumb]] = {}
-        self._index: Dict[str, List[str]] = {}  # module -> breadcrumb_ids
+        # per-session trails are bounded; the oldest breadcrumbs are evicted first
+        self._breadcrumbs: Dict[str, Deque[Breadcrumb]] = {}
+        self._index: Dict[str, Deque[Breadcrumb]] = {}  # module -> breadcrumbs in insertion (= time) order
+        self._cleared_counts: Dict[str, int] = {}  # module -> cleared breadcrumbs still in its index
+        self._serialized: Dict[str, Deque[Dict[str, Any]]] = {}  # session_id -> to_dict() of each breadcrumb
+        self._serialized_total: Dict[str, int] = {}  # session_id -> breadcrumbs ever serialized
+        self._counts: Dict[str, int] = {}  # session_id -> breadcrumbs added, including pending
+        self._pending: Deque[Breadcrumb] = deque()
+        self._flush_task: Optional[asyncio.Task] = None
     
     def add_breadcrumb(
         self,
@@ -102,10 +152,12 @@ class BreadcrumbsNavigator:
         metadata: Optional[Dict[str, Any]] = None
     ) -> Breadcrumb:
         """Add a new breadcrumb"""
+        seq = self._counts.get(session_id, 0)
+        self._counts[session_id] = seq + 1
         breadcrumb = Breadcrumb(
-            id=f"{session_id}_{len(self._breadcrumbs.get(session_id, []))}",
+            id=f"{session_id}_{seq}",
             session_id=session_id,
-            timestamp=datetime.now(),
+            timestamp=time.time(),
             module=module,
             action=action,
             context=context or {},
@@ -113,24 +165,51 @@ class BreadcrumbsNavigator:
             metadata=metadata or {}
         )
         
-        if session_id not in self._breadcrumbs:
-            self._breadcrumbs[session_id] = []
+        self._pending.append(breadcrumb)
+        if len(self._pending) >= _FLUSH_BATCH:
+            self._flush()
+        elif self._flush_task is None:
+            try:
+                self._flush_task = asyncio.get_running_loop().create_task(self._flusher())
+            except RuntimeError:
+                # no event loop (scripts, sync callers): apply immediately
+                self._flush()
         
-        self._breadcrumbs[session_id].append(breadcrumb)
+        return breadcrumb
+    
+    async def _flusher(self):
+        """Apply pending breadcrumbs every _FLUSH_INTERVAL until the buffer stays empty"""
+        try:
+            while self._pending:
+                await asyncio.sleep(_FLUSH_INTERVAL)
+                self._flush()
+        finally:
+            self._flush_task = None
+    
+    def _flush(self):
+        """Append all pending breadcrumbs to their session trails and module index"""
+        if not self._pending:
+            return
         
-        # Index by module
-        if module not in self._index:
-            self._index[module] = []
-        self._index[module].append(breadcrumb.id)
+        pending, self._pending = self._pending, deque()
+        by_session: Dict[str, List[Breadcrumb]] = defaultdict(list)
+        by_module: Dict[str, List[Breadcrumb]] = defaultdict(list)
+        for breadcrumb in pending:
+            by_session[breadcrumb.session_id].append(breadcrumb)
+            by_module[breadcrumb.module].append(breadcrumb)
         
-        logger.debug(
-            "Breadcrumb added",
-            session_id=session_id,
-            module=module,
-            action=action
-        )
+        for session_id, breadcrumbs in by_session.items():
+            trail = self._breadcrumbs.get(session_id)
+            if trail is None:
+                trail = self._breadcrumbs[session_id] = deque(maxlen=settings.BREADCRUMB_MAX_TRAIL)
+            trail.extend(breadcrumbs)
+        for module, breadcrumbs in by_module.items():
+            index = self._index.get(module)
+            if index is None:
+                index = self._index[module] = deque(maxlen=settings.BREADCRUMB_MAX_TRAIL)
+            index.extend(breadcrumbs)
         
-        return breadcrumb
+        logger.debug("Breadcrumbs flushed", count=len(pending))
     
     def get_trail(
         self,
@@ -139,21 +218,40 @@ class BreadcrumbsNavigator:
         limit: Optional[int] = None
     ) -> List[Breadcrumb]:
         """Get breadcrumb trail for a session"""
-        breadcrumbs = self._breadcrumbs.get(session_id, [])
-        
-        if module:
-            breadcrumbs = [b for b in breadcrumbs if b.module == module]
+        self._flush()
+        match = (lambda b: b.module == module) if module else None
+        return _tail(self._breadcrumbs.get(session_id, ()), limit, match)
+    
+    def get_trail_dicts(
+        self,
+        session_id: str,
+        module: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Get the serialized trail; trails are append-only so each breadcrumb is serialized once"""
+        self._flush()
+        breadcrumbs = self._breadcrumbs.get(session_id)
+        if not breadcrumbs:
+            return []
         
-        if limit:
-            breadcrumbs = breadcrumbs[-limit:]
+        serialized = self._serialized.get(session_id)
+        if serialized is None:
+            serialized = self._serialized[session_id] = deque(maxlen=breadcrumbs.maxlen)
+        added = self._counts[session_id] - self._serialized_total.get(session_id, 0)
+        if added:
+            new = min(added, len(breadcrumbs))
+            serialized.extend(b.to_dict() for b in islice(breadcrumbs, len(breadcrumbs) - new, None))
+            self._serialized_total[session_id] = self._counts[session_id]
         
-        return breadcrumbs
+        match = (lambda d: d["module"] == module) if module else None
+        return _tail(serialized, limit, match)
     
     def get_trail_summary(
         self,
         session_id: str
     ) -> Dict[str, Any]:
         """Get summary of breadcrumb trail"""
+        self._flush()
         breadcrumbs = self._breadcrumbs.get(session_id, [])
         
         if not breadcrumbs:
@@ -167,19 +265,19 @@ class BreadcrumbsNavigator:
         # Create timeline
         timeline = [
             {
-                "timestamp": str(b.timestamp),
+                "timestamp": _iso(b.timestamp),
                 "module": b.module,
                 "action": b.action
             }
-            for b in breadcrumbs[-20:]  # Last 20
+            for b in islice(breadcrumbs, max(0, len(breadcrumbs) - 20), None)  # Last 20
         ]
         
         return {
             "total": len(breadcrumbs),
             "modules": module_counts,
             "timeline": timeline,
-            "first": str(breadcrumbs[0].timestamp) if breadcrumbs else None,
-            "last": str(breadcrumbs[-1].timestamp) if breadcrumbs else None
+            "first": _iso(breadcrumbs[0].timestamp) if breadcrumbs else None,
+            "last": _iso(breadcrumbs[-1].timestamp) if breadcrumbs else None
         }
     
     def search_trail(
@@ -191,14 +289,19 @@ class BreadcrumbsNavigator:
         """Search breadcrumb trail"""
         breadcrumbs = self.get_trail(session_id, module)
         
-        # Simple text search
+        # Simple text search over action, context and result; each breadcrumb's
+        # lowercased text is built once and reused by later searches
         query_lower = query.lower()
         results = []
         
         for breadcrumb in breadcrumbs:
-            if (query_lower in breadcrumb.action.lower() or
-                query_lower in str(breadcrumb.context).lower() or
-                query_lower in str(breadcrumb.result).lower()):
+            text = breadcrumb.search_text
+            if text is None:
+                # NUL separators keep a match from spanning two fields
+                text = breadcrumb.search_text = "\0".join(
+                    (breadcrumb.action, str(breadcrumb.context), str(breadcrumb.result))
+                ).lower()
+            if query_lower in text:
                 results.append(breadcrumb)
         
         return results
@@ -209,26 +312,35 @@ class BreadcrumbsNavigator:
         limit: int = 50
     ) -> List[Breadcrumb]:
         """Get history for a specific module across all sessions"""
-        all_breadcrumbs = []
-        for session_breadcrumbs in self._breadcrumbs.values():
-            for breadcrumb in session_breadcrumbs:
-                if breadcrumb.module == module:
-                    all_breadcrumbs.append(breadcrumb)
-        
-        # Sort by timestamp
-        all_breadcrumbs.sort(key=lambda x: x.timestamp)
-        
-        return all_breadcrumbs[-limit:]
+        self._flush()
+        if not self._cleared_counts.get(module):
+            return _tail(self._index.get(module, ()), limit)
+        return _tail(self._index[module], limit, lambda b: not b.cleared)
     
     def clear_session(self, session_id: str):
         """Clear breadcrumbs for a session"""
+        self._flush()
         if session_id in self._breadcrumbs:
-            # Remove from index
+            # Flag instead of removing from the module index; an index is compacted
+            # once more than half of it is cleared
             for breadcrumb in self._breadcrumbs[session_id]:
-                if breadcrumb.module in self._index:
-                    if breadcrumb.id in self._index[breadcrumb.module]:
-                        self._index[breadcrumb.module].remove(breadcrumb.id)
+                breadcrumb.cleared = True
+                self._cleared_counts[breadcrumb.module] = self._cleared_counts.get(breadcrumb.module, 0) + 1
+            for module, cleared in list(self._cleared_counts.items()):
+                index = self._index.get(module)
+                if index is not None and cleared * 2 > len(index):
+                    self._index[module] = deque((b for b in index if not b.cleared), maxlen=index.maxlen)
+                    del self._cleared_counts[module]
             
             del self._breadcrumbs[session_id]
+        self._serialized.pop(session_id, None)
+        self._serialized_total.pop(session_id, None)
+        self._counts.pop(session_id, None)
         
         logger.debug("Breadcrumbs cleared", session_id=session_id)
+
+
+@lru_cache(maxsize=1)
+def get_breadcrumbs_navigator() -> BreadcrumbsNavigator:
+    """Process-wide BreadcrumbsNavigator shared across requests."""
+    return BreadcrumbsNavigator()
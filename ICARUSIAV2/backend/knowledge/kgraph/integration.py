@@ -1,7 +1,9 @@
 from __future__ import annotations
 
 import json
-from typing import Any, Dict
+import sys
+from functools import lru_cache
+from typing import Any, Dict, List
 
 try:
     import networkx as nx  # type: ignore
@@ -9,19 +11,81 @@ except Exception:  # pragma: no cover
     nx = None  # type: ignore
 
 try:
-    from openai import AsyncOpenAI  # type: ignore
+    import orjson  # type: ignore
 except Exception:  # pragma: no cover
-    AsyncOpenAI = None  # type: ignore
+    orjson = None  # type: ignore
+
+from pydantic import BaseModel, ConfigDict
 
 from config.settings import settings
+from core.openai_client import chat_completion, get_openai_client
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+
+# Strict structured outputs don't allow open-ended objects, so properties are
+# requested as key/value pairs and folded back into a dict after parsing
+class _Property(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    key: str
+    value: str
+
+
+class _Entity(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    id: str
+    type: str
+    properties: List[_Property]
+
+
+class _Relationship(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    source: str
+    target: str
+    type: str
+    properties: List[_Property]
+
+
+class _Extraction(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    entities: List[_Entity]
+    relationships: List[_Relationship]
+
+
+_EXTRACTION_SCHEMA = _Extraction.model_json_schema()
+
+
+def _response_format() -> Dict[str, Any]:
+    # json_schema (structured outputs) needs a model that supports it, e.g. gpt-4o
+    if settings.OPENAI_STRUCTURED_OUTPUTS:
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": "kg_extraction", "strict": True, "schema": _EXTRACTION_SCHEMA},
+        }
+    return {"type": "json_object"}
+
+
+def _intern_keys(properties: Dict[str, Any]) -> Dict[str, Any]:
+    # property names repeat across thousands of nodes/edges; share one string object per name
+    return {sys.intern(k): v for k, v in properties.items()}
+
+
+def _fold_properties(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    for item in items:
+        properties = item.get("properties")
+        if isinstance(properties, list):
+            item["properties"] = {p["key"]: p["value"] for p in properties}
+    return items
 
 
 class KnowledgeGraphIntegration:
     def __init__(self):
         self.graph = nx.DiGraph() if nx else None
-        self.client = (
-            AsyncOpenAI(api_key=settings.OPENAI_API_KEY) if (AsyncOpenAI and settings.OPENAI_API_KEY) else None
-        )
+        self.client = get_openai_client()
         self.model = settings.OPENAI_MODEL
 
     async def extract_and_link(self, text: str, session_id: str) -> Dict[str, Any]:
@@ -34,23 +98,23 @@ Extrae entidades y relaciones del texto y devuelve JSON:
 
 Texto: {text}
 """
-        resp = await self.client.chat.completions.create(
+        resp = await chat_completion(
+            self.client,
             model=self.model,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.2,
             response_format={"type": "json_object"},
         )
-        data = json.loads(resp.choices[0].message.content or "{}")
-
-        for ent in data.get("entities", []) or []:
-            self.graph.add_node(ent.get("id"), type=ent.get("type"), **(ent.get("properties") or {}))
-        for rel in data.get("relationships", []) or []:
-            self.graph.add_edge(
-                rel.get("source"),
-                rel.get("target"),
-                type=rel.get("type"),
-                **(rel.get("properties") or {}),
-            )
+        data = _loads(resp.choices[0].message.content or "{}")
+
+        self.graph.add_nodes_from(
+            (ent.get("id"), {"type": ent.get("type"), **_intern_keys(ent.get("properties") or {})})
+            for ent in data.get("entities", []) or []
+        )
+        self.graph.add_edges_from(
+            (rel.get("source"), rel.get("target"), {"type": rel.get("type"), **_intern_keys(rel.get("properties") or {})})
+            for rel in data.get("relationships", []) or []
+        )
         return data
 
 """
@@ -59,23 +123,52 @@ Integrates with knowledge graphs for enhanced understanding
 """
 
 from typing import Dict, List, Optional, Any, Tuple
+from collections import OrderedDict
 import structlog
 import networkx as nx
 from datetime import datetime
-from openai import AsyncOpenAI
 from config.settings import settings
 
 logger = structlog.get_logger()
 
+_EXTRACT_PROMPT = """
+Extract entities and relationships from the following text.
+
+Text: {text}
+
+Provide JSON with:
+1. Entities (id, type, properties)
+2. Relationships (source, target, type, properties)
+
+Format:
+{{
+    "entities": [
+        {{"id": "entity1", "type": "person", "properties": {{"name": "John"}}}}
+    ],
+    "relationships": [
+        {{"source": "entity1", "target": "entity2", "type": "knows", "properties": {{}}}}
+    ]
+}}
+"""
+
 
 class KnowledgeGraphIntegration:
     """Knowledge graph integration system"""
     
     def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        self.client = get_openai_client()
         self.model = settings.OPENAI_MODEL
+        # Node attributes live only in the graph. Ids and type labels are interned:
+        # each id is referenced from several adjacency dicts, and JSON parsing
+        # yields a fresh string object per occurrence.
         self.graph = nx.DiGraph()
-        self._entity_cache: Dict[str, Dict[str, Any]] = {}
+        # (nodes, edges); DiGraph.number_of_edges() sums every node's degree, so
+        # counts are cached for polled statistics and dropped on each mutation
+        self._counts: Optional[Tuple[int, int]] = None
+        # Shortest paths keyed by (graph version, source, target); the version is
+        # bumped on every mutation, so stale entries simply stop matching and age out
+        self._version = 0
+        self._paths: "OrderedDict[Tuple[int, str, str], Optional[List[str]]]" = OrderedDict()
         self._connected = False
     
     async def initialize(self):
@@ -92,6 +185,7 @@ class KnowledgeGraphIntegration:
     async def cleanup(self):
         """Cleanup knowledge graph"""
         self.graph.clear()
+        self._changed()
         self._connected = False
         logger.info("Knowledge graph cleaned up")
     
@@ -99,6 +193,11 @@ class KnowledgeGraphIntegration:
         """Check if knowledge graph is connected"""
         return self._connected
     
+    def _changed(self):
+        """Invalidate derived data after a graph mutation"""
+        self._counts = None
+        self._version += 1
+    
     async def add_entity(
         self,
         entity_id: str,
@@ -106,8 +205,8 @@ class KnowledgeGraphIntegration:
         properties: Dict[str, Any]
     ):
         """Add entity to knowledge graph"""
-        self.graph.add_node(entity_id, type=entity_type, **properties)
-        self._entity_cache[entity_id] = {"type": entity_type, **properties}
+        self.graph.add_node(sys.intern(entity_id), type=sys.intern(entity_type), **_intern_keys(properties))
+        self._changed()
         
         logger.debug("Entity added", entity_id=entity_id, entity_type=entity_type)
     
@@ -125,11 +224,12 @@ class KnowledgeGraphIntegration:
             await self.add_entity(target_id, "unknown", {})
         
         self.graph.add_edge(
-            source_id,
-            target_id,
-            type=relationship_type,
-            **(properties or {})
+            sys.intern(source_id),
+            sys.intern(target_id),
+            type=sys.intern(relationship_type),
+            **_intern_keys(properties or {})
         )
+        self._changed()
         
         logger.debug(
             "Relationship added",
@@ -148,22 +248,21 @@ class KnowledgeGraphIntegration:
         
         node_data = self.graph.nodes[entity_id]
         
-        # Get neighbors
-        neighbors = list(self.graph.neighbors(entity_id))
-        relationships = []
-        for neighbor in neighbors:
-            edge_data = self.graph.edges[entity_id, neighbor]
-            relationships.append({
+        # Outgoing edges straight from the adjacency dict (neighbor -> edge data)
+        relationships = [
+            {
                 "target": neighbor,
                 "type": edge_data.get("type", "unknown"),
                 "properties": {k: v for k, v in edge_data.items() if k != "type"}
-            })
+            }
+            for neighbor, edge_data in self.graph.adj[entity_id].items()
+        ]
         
         return {
             "id": entity_id,
             "properties": node_data,
             "relationships": relationships,
-            "neighbor_count": len(neighbors)
+            "neighbor_count": len(relationships)
         }
     
     async def find_path(
@@ -173,14 +272,24 @@ class KnowledgeGraphIntegration:
         max_depth: int = 5
     ) -> Optional[List[str]]:
         """Find path between entities"""
-        try:
-            if source_id not in self.graph or target_id not in self.graph:
-                return None
-            
-            path = nx.shortest_path(self.graph, source_id, target_id)
-            return path if len(path) <= max_depth + 1 else None
-        except nx.NetworkXNoPath:
+        if source_id not in self.graph or target_id not in self.graph:
             return None
+        
+        key = (self._version, source_id, target_id)
+        if key in self._paths:
+            self._paths.move_to_end(key)
+            path = self._paths[key]
+        else:
+            try:
+                path = nx.shortest_path(self.graph, source_id, target_id)
+            except nx.NetworkXNoPath:
+                path = None
+            if settings.KG_PATH_CACHE_SIZE > 0:
+                self._paths[key] = path
+                if len(self._paths) > settings.KG_PATH_CACHE_SIZE:
+                    self._paths.popitem(last=False)
+        
+        return list(path) if path is not None and len(path) <= max_depth + 1 else None
     
     async def extract_and_link(
         self,
@@ -188,52 +297,40 @@ class KnowledgeGraphIntegration:
         session_id: str
     ) -> Dict[str, Any]:
         """Extract entities and relationships from text and link to graph"""
-        
-        prompt = f"""
-Extract entities and relationships from the following text.
-
-Text: {text}
-
-Provide JSON with:
-1. Entities (id, type, properties)
-2. Relationships (source, target, type, properties)
-
-Format:
-{{
-    "entities": [
-        {{"id": "entity1", "type": "person", "properties": {{"name": "John"}}}}
-    ],
-    "relationships": [
-        {{"source": "entity1", "target": "entity2", "type": "knows", "properties": {{}}}}
-    ]
-}}
-"""
-        
         try:
-            response = await self.client.chat.completions.create(
+            response = await chat_completion(
+                self.client,
                 model=self.model,
-                messages=[{"role": "user", "content": prompt}],
+                messages=[{"role": "user", "content": _EXTRACT_PROMPT.format(text=text)}],
                 temperature=0.2,
-                response_format={"type": "json_object"}
+                response_format=_response_format()
             )
             
-            result = eval(response.choices[0].message.content)
+            result = _loads(response.choices[0].message.content or "{}")
+            _fold_properties(result.get("entities", []))
+            _fold_properties(result.get("relationships", []))
             
-            # Add to graph
-            for entity in result.get("entities", []):
-                await self.add_entity(
-                    entity["id"],
-                    entity["type"],
-                    entity.get("properties", {})
-                )
+            # Add to graph in bulk; relationship endpoints the graph doesn't know yet
+            # become "unknown" entities, as add_relationship does
+            intern = sys.intern
+            nodes = [
+                (intern(entity["id"]), {"type": intern(entity["type"]), **_intern_keys(entity.get("properties", {}))})
+                for entity in result.get("entities", [])
+            ]
+            edges = [
+                (intern(rel["source"]), intern(rel["target"]), {"type": intern(rel["type"]), **_intern_keys(rel.get("properties", {}))})
+                for rel in result.get("relationships", [])
+            ]
+            known = {node_id for node_id, _ in nodes}
+            nodes.extend(
+                (node_id, {"type": "unknown"})
+                for node_id in dict.fromkeys(n for u, v, _ in edges for n in (u, v))
+                if node_id not in known and node_id not in self.graph
+            )
             
-            for rel in result.get("relationships", []):
-                await self.add_relationship(
-                    rel["source"],
-                    rel["target"],
-                    rel["type"],
-                    rel.get("properties", {})
-                )
+            self.graph.add_nodes_from(nodes)
+            self.graph.add_edges_from(edges)
+            self._changed()
             
             logger.info(
                 "Entities extracted and linked",
@@ -256,35 +353,22 @@ Format:
         if entity_id not in self.graph:
             return {"nodes": [], "edges": []}
         
-        # Get nodes within depth
-        nodes = {entity_id}
-        current_level = {entity_id}
-        
-        for _ in range(depth):
-            next_level = set()
-            for node in current_level:
-                neighbors = list(self.graph.neighbors(node))
-                next_level.update(neighbors)
-            nodes.update(next_level)
-            current_level = next_level
-        
-        # Get subgraph
+        # Nodes within depth hops along outgoing edges (what nx.ego_graph computes,
+        # without copying the result into a new graph); the subgraph is a view
+        nodes = nx.single_source_shortest_path_length(self.graph, entity_id, cutoff=depth)
         subgraph = self.graph.subgraph(nodes)
         
         # Convert to dict format
-        nodes_data = [
-            {"id": n, **self.graph.nodes[n]}
-            for n in subgraph.nodes()
-        ]
+        nodes_data = [{"id": n, **data} for n, data in subgraph.nodes(data=True)]
         
         edges_data = [
             {
                 "source": u,
                 "target": v,
-                "type": subgraph.edges[u, v].get("type", "unknown"),
-                **{k: v for k, v in subgraph.edges[u, v].items() if k != "type"}
+                "type": data.get("type", "unknown"),
+                **{k: val for k, val in data.items() if k != "type"}
             }
-            for u, v in subgraph.edges()
+            for u, v, data in subgraph.edges(data=True)
         ]
         
         return {
@@ -295,9 +379,18 @@ Format:
     
     def get_statistics(self) -> Dict[str, Any]:
         """Get knowledge graph statistics"""
+        if self._counts is None:
+            self._counts = (self.graph.number_of_nodes(), self.graph.number_of_edges())
+        nodes, edges = self._counts
         return {
-            "node_count": self.graph.number_of_nodes(),
-            "edge_count": self.graph.number_of_edges(),
+            "node_count": nodes,
+            "edge_count": edges,
             "is_connected": self._connected,
-            "density": nx.density(self.graph) if self.graph.number_of_nodes() > 0 else 0
+            "density": edges / (nodes * (nodes - 1)) if nodes > 1 else 0
         }
+
+
+@lru_cache(maxsize=1)
+def get_knowledge_graph() -> KnowledgeGraphIntegration:
+    """Process-wide KnowledgeGraphIntegration shared across requests."""
+    return KnowledgeGraphIntegration()
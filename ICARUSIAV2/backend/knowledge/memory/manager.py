@@ -1,84 +1,92 @@
+"""
+Memory Management System
+Manages short-term and long-term memory
+"""
+
 from __future__ import annotations
 
+import asyncio
+import heapq
+import logging
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from enum import Enum
-from typing import Any, Dict, List, Optional
+from functools import lru_cache
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import structlog
 
 from config.settings import settings
 
+logger = structlog.get_logger()
 
-class MemoryType(Enum):
-    SHORT_TERM = "short_term"
-    LONG_TERM = "long_term"
-    EPISODIC = "episodic"
-    SEMANTIC = "semantic"
-    WORKING = "working"
+_WORD_RE = re.compile(r"\w+")
 
 
-class MemoryManager:
-    def __init__(self):
-        self._memories: Dict[str, List[Dict[str, Any]]] = {}
-        self.retention_days = settings.MEMORY_RETENTION_DAYS
+def _compact(items: List[Any], keep: Callable[[Any], bool]) -> int:
+    """Drop the items failing ``keep`` in place, preserving order; returns how many were dropped."""
+    w = 0
+    for item in items:
+        if keep(item):
+            items[w] = item
+            w += 1
+    removed = len(items) - w
+    del items[w:]
+    return removed
 
-    async def store(
-        self,
-        session_id: str,
-        content: Any,
-        memory_type: MemoryType = MemoryType.SHORT_TERM,
-        metadata: Optional[Dict[str, Any]] = None,
-        importance: float = 0.5,
-    ) -> str:
-        mem_id = f"{session_id}_{len(self._memories.get(session_id, []))}"
-        mem = {
-            "id": mem_id,
-            "session_id": session_id,
-            "content": content,
-            "type": memory_type.value,
-            "timestamp": datetime.utcnow().isoformat(),
-            "metadata": metadata or {},
-            "importance": float(importance),
-        }
-        self._memories.setdefault(session_id, []).append(mem)
-        return mem_id
 
-    async def retrieve(self, session_id: str, query: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
-        items = list(self._memories.get(session_id, []))
-        if query:
-            q = query.lower()
-            items = [m for m in items if q in str(m.get("content", "")).lower() or q in str(m.get("metadata", "")).lower()]
-        items.sort(key=lambda m: (m.get("importance", 0), m.get("timestamp", "")), reverse=True)
-        return items[:limit]
-
-    async def cleanup(self) -> int:
-        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
-        removed = 0
-        for sid, memories in list(self._memories.items()):
-            kept = []
-            for m in memories:
-                try:
-                    ts = datetime.fromisoformat(m.get("timestamp", ""))
-                except Exception:
-                    ts = datetime.utcnow()
-                if ts >= cutoff:
-                    kept.append(m)
-                else:
-                    removed += 1
-            self._memories[sid] = kept
-        return removed
+def _memory_words(memory: MemoryRecord) -> Set[str]:
+    return set(_WORD_RE.findall(memory.search_text))
 
-"""
-Memory Management System
-Manages short-term and long-term memory
-"""
 
-from typing import Dict, List, Optional, Any
-from datetime import datetime, timedelta
-from enum import Enum
-import structlog
-import json
-from config.settings import settings
+# (tick, isoformat string)
+_now_cache: Optional[tuple] = None
+# kept current by _clock_ticker() while it runs
+_ticker_now: Optional[str] = None
 
-logger = structlog.get_logger()
+
+def _now_iso() -> str:
+    """``datetime.now().isoformat()``, reused within one MEMORY_TIMESTAMP_CACHE_MS tick.
+
+    Bulk stores and retrieves stamp many memories back to back; they share one
+    formatted string instead of re-reading the clock for each. Set the window to
+    0 to format every call.
+    """
+    global _now_cache
+    if _ticker_now is not None:
+        return _ticker_now
+    window = settings.MEMORY_TIMESTAMP_CACHE_MS
+    if window <= 0:
+        return datetime.now().isoformat()
+    tick = time.monotonic_ns() // (window * 1_000_000)
+    if _now_cache is None or _now_cache[0] != tick:
+        _now_cache = (tick, datetime.now().isoformat())
+    return _now_cache[1]
+
+
+async def _clock_ticker(interval: float):
+    """Refresh the shared timestamp every ``interval`` seconds so _now_iso() reads no clock at all.
+
+    Timestamps can lag by however long the event loop is blocked.
+    """
+    global _ticker_now
+    try:
+        while True:
+            _ticker_now = datetime.now().isoformat()
+            await asyncio.sleep(interval)
+    finally:
+        _ticker_now = None
+
+
+@lru_cache(maxsize=1)
+def _debug_enabled() -> bool:
+    """Whether DEBUG events are emitted; read on first use, after main.py configures structlog"""
+    is_enabled_for = getattr(logger.bind(), "is_enabled_for", None)
+    return is_enabled_for(logging.DEBUG) if is_enabled_for else True
 
 
 class MemoryType(Enum):
@@ -90,19 +98,70 @@ class MemoryType(Enum):
     WORKING = "working"
 
 
+@dataclass(slots=True)
+class MemoryRecord:
+    """A stored memory"""
+    id: str
+    session_id: str
+    content: Any
+    type: str
+    timestamp: str  # isoformat
+    metadata: Dict[str, Any]
+    importance: float
+    access_count: int = 0
+    last_accessed: str = ""
+    # lowercased content + metadata (NUL-separated so a query can't span both); both are fixed once stored
+    search_text: str = field(init=False, repr=False, compare=False)
+    # retrieve() ranking: importance, then recency
+    rank: tuple = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.search_text = f"{self.content}\0{self.metadata}".lower()
+        self.rank = (self.importance, self.timestamp)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize memory for API responses"""
+        return {
+            "id": self.id,
+            "session_id": self.session_id,
+            "content": self.content,
+            "type": self.type,
+            "timestamp": self.timestamp,
+            "metadata": self.metadata,
+            "importance": self.importance,
+            "access_count": self.access_count,
+            "last_accessed": self.last_accessed,
+        }
+
+
+_rank = attrgetter("rank")
+
+
 class MemoryManager:
     """Memory management system"""
     
     def __init__(self):
-        self._memories: Dict[str, List[Dict[str, Any]]] = {}
+        # sessions in least- to most-recently used order, capped at MEMORY_MAX_SESSIONS
+        self._memories: "OrderedDict[str, List[MemoryRecord]]" = OrderedDict()
         self._session_memory: Dict[str, Dict[str, Any]] = {}
+        # next memory number per session; ids stay unique after forget()
+        self._counters: Dict[str, int] = {}
+        # word -> positions in _memories[session_id]; built on first query,
+        # extended by store() and rebuilt after anything removes memories
+        self._inverted: Dict[str, Dict[str, Set[int]]] = {}
+        self._inv_dirty: Dict[str, bool] = {}
+        # type value -> ascending positions in _memories[session_id]
+        self._by_type: Dict[str, Dict[str, List[int]]] = {}
         self.retention_days = settings.MEMORY_RETENTION_DAYS
         self._initialized = False
+        self._ticker: Optional[asyncio.Task] = None
     
     async def initialize(self):
         """Initialize memory manager"""
         try:
             # Load persistent memories if available
+            if settings.MEMORY_CLOCK_TICKER and settings.MEMORY_TIMESTAMP_CACHE_MS > 0 and self._ticker is None:
+                self._ticker = asyncio.create_task(_clock_ticker(settings.MEMORY_TIMESTAMP_CACHE_MS / 1000))
             self._initialized = True
             logger.info("Memory manager initialized")
         except Exception as e:
@@ -111,13 +170,17 @@ class MemoryManager:
     async def cleanup(self):
         """Cleanup memory manager"""
         # Clean up old memories
-        cutoff_date = datetime.now() - timedelta(days=self.retention_days)
+        # ISO timestamps compare chronologically as strings; no per-memory parsing
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).isoformat()
         
         for session_id, memories in self._memories.items():
-            self._memories[session_id] = [
-                m for m in memories
-                if datetime.fromisoformat(m.get("timestamp", "")) > cutoff_date
-            ]
+            if _compact(memories, lambda m: m.timestamp > cutoff):
+                self._inv_dirty[session_id] = True
+                self._reindex_types(session_id)
+        
+        if self._ticker is not None:
+            self._ticker.cancel()
+            self._ticker = None
         
         logger.info("Memory manager cleaned up")
     
@@ -134,40 +197,52 @@ class MemoryManager:
         importance: float = 0.5
     ) -> str:
         """Store a memory"""
-        memory_id = f"{session_id}_{len(self._memories.get(session_id, []))}"
+        seq = self._counters.get(session_id, 0)
+        self._counters[session_id] = seq + 1
+        memory_id = f"{session_id}_{seq}"
         
-        memory = {
-            "id": memory_id,
-            "session_id": session_id,
-            "content": content,
-            "type": memory_type.value,
-            "timestamp": datetime.now().isoformat(),
-            "metadata": metadata or {},
-            "importance": importance,
-            "access_count": 0,
-            "last_accessed": datetime.now().isoformat()
-        }
+        now = _now_iso()
+        memory = MemoryRecord(
+            id=memory_id,
+            session_id=session_id,
+            content=content,
+            type=memory_type.value,
+            timestamp=now,
+            metadata=metadata or {},
+            importance=importance,
+            last_accessed=now
+        )
         
         if session_id not in self._memories:
             self._memories[session_id] = []
+            self._evict_sessions()
+        else:
+            self._memories.move_to_end(session_id)
         
         self._memories[session_id].append(memory)
+        position = len(self._memories[session_id]) - 1
+        self._by_type.setdefault(session_id, {}).setdefault(memory.type, []).append(position)
+        index = self._inverted.get(session_id)
+        if index is not None and not self._inv_dirty.get(session_id):
+            for word in _memory_words(memory):
+                index.setdefault(word, set()).add(position)
         
         # Update session memory summary
         if session_id not in self._session_memory:
             self._session_memory[session_id] = {
                 "total_memories": 0,
-                "last_updated": datetime.now().isoformat()
+                "last_updated": _now_iso()
             }
         self._session_memory[session_id]["total_memories"] += 1
-        self._session_memory[session_id]["last_updated"] = datetime.now().isoformat()
+        self._session_memory[session_id]["last_updated"] = _now_iso()
         
-        logger.debug(
-            "Memory stored",
-            session_id=session_id,
-            memory_id=memory_id,
-            memory_type=memory_type.value
-        )
+        if _debug_enabled():
+            logger.debug(
+                "Memory stored",
+                session_id=session_id,
+                memory_id=memory_id,
+                memory_type=memory_type.value
+            )
         
         return memory_id
     
@@ -177,38 +252,102 @@ class MemoryManager:
         query: Optional[str] = None,
         memory_type: Optional[MemoryType] = None,
         limit: int = 10
-    ) -> List[Dict[str, Any]]:
+    ) -> List[MemoryRecord]:
         """Retrieve memories"""
         memories = self._memories.get(session_id, [])
+        if memories:
+            self._memories.move_to_end(session_id)
         
-        # Filter by type
+        # Filter by type straight from the per-type positions
+        positions = None
         if memory_type:
-            memories = [m for m in memories if m["type"] == memory_type.value]
+            positions = self._by_type.get(session_id, {}).get(memory_type.value, [])
+        
+        # Narrow to memories sharing the query's words before the substring check
+        if query and memories:
+            candidates = self._query_candidates(session_id, query.lower())
+            if candidates is not None:
+                positions = sorted(candidates) if positions is None else [i for i in positions if i in candidates]
+        
+        if positions is not None:
+            memories = [memories[i] for i in positions]
         
         # Filter by query (simple text search)
         if query:
             query_lower = query.lower()
-            memories = [
-                m for m in memories
-                if query_lower in str(m["content"]).lower() or
-                   query_lower in str(m["metadata"]).lower()
-            ]
+            memories = [m for m in memories if query_lower in m.search_text]
         
-        # Sort by importance and recency
-        memories.sort(
-            key=lambda x: (
-                x["importance"],
-                datetime.fromisoformat(x["timestamp"])
-            ),
-            reverse=True
-        )
+        # Top `limit` by importance and recency (ISO timestamps order as strings)
+        memories = heapq.nlargest(limit, memories, key=_rank)
         
         # Update access counts
-        for memory in memories[:limit]:
-            memory["access_count"] = memory.get("access_count", 0) + 1
-            memory["last_accessed"] = datetime.now().isoformat()
+        now = _now_iso()
+        for memory in memories:
+            memory.access_count += 1
+            memory.last_accessed = now
         
-        return memories[:limit]
+        return memories
+    
+    def _query_candidates(self, session_id: str, query_lower: str) -> Optional[Set[int]]:
+        """Positions of memories that can contain ``query_lower``; None when the index can't help
+        
+        Words strictly inside the query must occur whole in a match. The first and
+        last word may be cut by the substring, so they match any indexed word ending
+        (resp. starting) with them - or containing them for a single-word query.
+        """
+        tokens = _WORD_RE.findall(query_lower)
+        if not tokens:
+            return None
+        index = self._inverted_index(session_id)
+        open_start = _WORD_RE.match(query_lower) is not None
+        open_end = _WORD_RE.match(query_lower[-1]) is not None
+        
+        candidates: Optional[Set[int]] = None
+        last = len(tokens) - 1
+        for i, token in enumerate(tokens):
+            left, right = i == 0 and open_start, i == last and open_end
+            if left and right:
+                words = [w for w in index if token in w]
+            elif left:
+                words = [w for w in index if w.endswith(token)]
+            elif right:
+                words = [w for w in index if w.startswith(token)]
+            else:
+                words = [token] if token in index else []
+            postings = set().union(*(index[w] for w in words))
+            candidates = postings if candidates is None else candidates & postings
+            if not candidates:
+                return set()
+        return candidates
+    
+    def _inverted_index(self, session_id: str) -> Dict[str, Set[int]]:
+        index = self._inverted.get(session_id)
+        if index is None or self._inv_dirty.get(session_id):
+            index = {}
+            for position, memory in enumerate(self._memories.get(session_id, [])):
+                for word in _memory_words(memory):
+                    index.setdefault(word, set()).add(position)
+            self._inverted[session_id] = index
+            self._inv_dirty[session_id] = False
+        return index
+    
+    def _evict_sessions(self):
+        """Drop least recently used sessions (and their indexes) beyond MEMORY_MAX_SESSIONS"""
+        limit = settings.MEMORY_MAX_SESSIONS
+        while limit > 0 and len(self._memories) > limit:
+            session_id, _ = self._memories.popitem(last=False)
+            self._session_memory.pop(session_id, None)
+            self._counters.pop(session_id, None)
+            self._inverted.pop(session_id, None)
+            self._inv_dirty.pop(session_id, None)
+            self._by_type.pop(session_id, None)
+            logger.debug("Memory session evicted", session_id=session_id)
+    
+    def _reindex_types(self, session_id: str):
+        by_type: Dict[str, List[int]] = {}
+        for position, memory in enumerate(self._memories.get(session_id, [])):
+            by_type.setdefault(memory.type, []).append(position)
+        self._by_type[session_id] = by_type
     
     async def consolidate(
         self,
@@ -216,17 +355,18 @@ class MemoryManager:
     ) -> Dict[str, Any]:
         """Consolidate memories (move important short-term to long-term)"""
         memories = self._memories.get(session_id, [])
+        by_type = self._by_type.setdefault(session_id, {})
+        short_term = by_type.get(MemoryType.SHORT_TERM.value, [])
         
-        short_term = [m for m in memories if m["type"] == MemoryType.SHORT_TERM.value]
-        
-        # Find high-importance short-term memories
-        important = [m for m in short_term if m["importance"] > 0.7]
-        
-        # Convert to long-term
-        converted = 0
-        for memory in important:
-            memory["type"] = MemoryType.LONG_TERM.value
-            converted += 1
+        # Convert high-importance short-term memories to long-term, visiting only the short-term bucket
+        moved = [i for i in short_term if memories[i].importance > 0.7]
+        for i in moved:
+            memories[i].type = MemoryType.LONG_TERM.value
+        converted = len(moved)
+        if moved:
+            moved_set = set(moved)
+            by_type[MemoryType.SHORT_TERM.value] = [i for i in short_term if i not in moved_set]
+            by_type[MemoryType.LONG_TERM.value] = sorted(by_type.get(MemoryType.LONG_TERM.value, []) + moved)
         
         logger.info(
             "Memories consolidated",
@@ -246,25 +386,27 @@ class MemoryManager:
         memory_type: Optional[MemoryType] = None
     ) -> int:
         """Forget memories"""
-        memories = self._memories.get(session_id, [])
+        memories = self._memories.get(session_id)
+        if memories is None:
+            # nothing stored (or already evicted); don't resurrect the session
+            return 1 if memory_id else 0
+        self._inv_dirty[session_id] = True
         
         if memory_id:
             # Remove specific memory
-            self._memories[session_id] = [
-                m for m in memories if m["id"] != memory_id
-            ]
+            _compact(memories, lambda m: m.id != memory_id)
+            self._reindex_types(session_id)
             return 1
         elif memory_type:
             # Remove all memories of type
-            before = len(memories)
-            self._memories[session_id] = [
-                m for m in memories if m["type"] != memory_type.value
-            ]
-            return before - len(self._memories[session_id])
+            removed = _compact(memories, lambda m: m.type != memory_type.value)
+            self._reindex_types(session_id)
+            return removed
         else:
             # Clear all memories for session
             count = len(memories)
-            self._memories[session_id] = []
+            memories.clear()
+            self._by_type[session_id] = {}
             return count
     
     def get_memory_stats(self, session_id: str) -> Dict[str, Any]:
@@ -274,12 +416,9 @@ class MemoryManager:
         if not memories:
             return {"total": 0, "by_type": {}}
         
-        by_type = {}
-        for memory in memories:
-            mtype = memory["type"]
-            by_type[mtype] = by_type.get(mtype, 0) + 1
+        by_type = {mtype: len(positions) for mtype, positions in self._by_type.get(session_id, {}).items() if positions}
         
-        avg_importance = sum(m.get("importance", 0) for m in memories) / len(memories)
+        avg_importance = sum(m.importance for m in memories) / len(memories)
         
         return {
             "total": len(memories),
@@ -287,3 +426,9 @@ class MemoryManager:
             "average_importance": avg_importance,
             "session_summary": self._session_memory.get(session_id, {})
         }
+
+
+@lru_cache(maxsize=1)
+def get_memory_manager() -> MemoryManager:
+    """Process-wide MemoryManager shared across requests."""
+    return MemoryManager()
@@ -1,185 +1,159 @@
 """
-ICARUSIAV2 - FastAPI entrypoint
+ICARUSIAV2 - Main Application Entry Point
+Advanced Sales AI System with Cognitive Capabilities
 """
 
 from __future__ import annotations
 
 from contextlib import asynccontextmanager
+import asyncio
+import atexit
+import importlib
 import logging
+import logging.handlers
+import queue
+import sys
+
+import structlog
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse
 
-from config.settings import settings
-
-
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
-logger = logging.getLogger("icarusiav2")
-
-
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    logger.info("starting app=%s version=%s", settings.APP_NAME, settings.VERSION)
-    yield
-    logger.info("stopping app=%s version=%s", settings.APP_NAME, settings.VERSION)
-
-
-app = FastAPI(
-    title="ICARUSIAV2 - Advanced Sales AI",
-    version=settings.VERSION,
-    description="Next-generation Sales AI with cognitive modules",
-    lifespan=lifespan,
-)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=settings.ALLOWED_ORIGINS,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
+try:
+    from brotli_asgi import BrotliMiddleware  # type: ignore
+except Exception:  # pragma: no cover
+    BrotliMiddleware = None  # type: ignore
 
-@app.exception_handler(Exception)
-async def global_exception_handler(request: Request, exc: Exception):
-    logger.exception("unhandled_exception path=%s", str(request.url.path))
-    return JSONResponse(status_code=500, content={"error": "Internal server error"})
+try:
+    import orjson  # type: ignore
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+    DefaultResponse = JSONResponse  # type: ignore
 
+from config.settings import settings
+from core.openai_client import close_openai_client
 
-@app.get("/")
-async def root():
-    return {"status": "online", "system": settings.APP_NAME, "version": settings.VERSION}
 
+def _configure_logging() -> None:
+    # Handlers only enqueue; a listener thread owns the stream so request
+    # handlers never wait on the logging lock or stderr I/O.
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
 
-@app.get("/health")
-async def health():
-    return {"status": "healthy"}
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(settings.LOG_LEVEL)
+    listener.start()
+    atexit.register(listener.stop)
 
 
-from api.routes import cognitive, enterprise, knowledge, sales  # noqa: E402
+_configure_logging()
 
-app.include_router(cognitive.router, prefix=f"{settings.API_V1_PREFIX}/cognitive", tags=["Cognitive"])
-app.include_router(knowledge.router, prefix=f"{settings.API_V1_PREFIX}/knowledge", tags=["Knowledge"])
-app.include_router(sales.router, prefix=f"{settings.API_V1_PREFIX}/sales", tags=["Sales"])
-app.include_router(enterprise.router, prefix=f"{settings.API_V1_PREFIX}/enterprise", tags=["Enterprise"])
 
-"""
-ICARUSIAV2 - Main Application Entry Point
-Advanced Sales AI System with Cognitive Capabilities
-"""
+def _orjson_dumps(event: dict, **kw) -> str:
+    return orjson.dumps(event, default=kw.get("default")).decode()
 
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import structlog
-from contextlib import asynccontextmanager
 
-from core.modules.reasoning.verbal_reasoning import VerbalReasoningEngine
-from core.modules.guardrails.abcd import ABCDGuardrail
-from core.modules.anchor_points.manager import AnchorPointManager
-from core.modules.parallel_decoding.engine import ParallelDecodingEngine
-from core.modules.coreference.resolver import CoreferenceResolver
-from core.modules.thread_rot.detector import ThreadRotDetector
-from core.modules.classification.active_classifier import ActiveClassifier
-from core.modules.self_refinement.loop import SelfRefinementLoop
-
-from knowledge.inner_thoughts.processor import InnerThoughtsProcessor
-from knowledge.breadcrumbs.navigator import BreadcrumbsNavigator
-from knowledge.kgraph.integration import KnowledgeGraphIntegration
-from knowledge.memory.manager import MemoryManager
-from knowledge.manual_refresh.controller import ManualRefreshController
-
-from sales.webhooks.twilio_handler import TwilioWebhookHandler
-from sales.whatsapp.api import WhatsAppAPI
-from sales.scripts.engine import SalesScriptEngine
-from sales.objections.handler import ObjectionHandler
-from sales.tts.synthesizer import TTSSynthesizer
-from sales.stt.recognizer import STTRecognizer
-
-from enterprise.crm.integration import CRMIntegration
-from enterprise.erp.integration import ERPIntegration
-from enterprise.wais.framework import WAISFramework
-from enterprise.orchestration.coordinator import MultiAgentCoordinator
-from enterprise.analytics.dashboard import AnalyticsDashboard
-from enterprise.feedback.loop import FeedbackLearningLoop
-
-from config.settings import Settings
-
-# Configure structured logging
+# Configure structured logging. Calls below LOG_LEVEL are no-ops on the
+# filtering logger (no event dict, no processors), and each module's logger
+# is assembled once on first use instead of on every call.
 structlog.configure(
     processors=[
         structlog.processors.TimeStamper(fmt="iso"),
         structlog.processors.add_log_level,
-        structlog.processors.JSONRenderer()
+        structlog.processors.JSONRenderer(serializer=_orjson_dumps) if orjson else structlog.processors.JSONRenderer()
     ],
-    wrapper_class=structlog.make_filtering_bound_logger(log_level="INFO"),
+    wrapper_class=structlog.make_filtering_bound_logger(settings.LOG_LEVEL),
     context_class=dict,
-    logger_factory=structlog.PrintLoggerFactory(),
-    cache_logger_on_first_use=False,
+    logger_factory=structlog.stdlib.LoggerFactory(),  # through the queued root handler
+    cache_logger_on_first_use=True,
 )
 
 logger = structlog.get_logger()
 
-# Global settings
-settings = Settings()
-
-# Initialize core components
-reasoning_engine = VerbalReasoningEngine()
-guardrails = ABCDGuardrail()
-anchor_manager = AnchorPointManager()
-parallel_decoder = ParallelDecodingEngine()
-coreference_resolver = CoreferenceResolver()
-thread_rot_detector = ThreadRotDetector()
-active_classifier = ActiveClassifier()
-self_refinement = SelfRefinementLoop()
-
-# Initialize knowledge system
-inner_thoughts = InnerThoughtsProcessor()
-breadcrumbs = BreadcrumbsNavigator()
-kgraph = KnowledgeGraphIntegration()
-memory_manager = MemoryManager()
-manual_refresh = ManualRefreshController()
-
-# Initialize sales agent
-tts = TTSSynthesizer()
-stt = STTRecognizer()
-twilio_handler = TwilioWebhookHandler()
-whatsapp_api = WhatsAppAPI()
-sales_scripts = SalesScriptEngine()
-objection_handler = ObjectionHandler()
-
-# Initialize enterprise
-crm = CRMIntegration()
-erp = ERPIntegration()
-wais = WAISFramework()
-orchestrator = MultiAgentCoordinator()
-analytics = AnalyticsDashboard()
-feedback_loop = FeedbackLearningLoop()
+# Subsystems are process-wide singletons built by their get_*() factories on
+# first use (route dependencies or the lifespan below), so a worker only loads
+# what its enabled routers need.
+
+
+def _enabled_routers() -> list:
+    return [name.strip() for name in settings.API_ROUTERS.split(",") if name.strip()]
+
+
+def _include_routers(app: FastAPI, prefix: str) -> None:
+    # only the enabled route groups are imported, so the subsystems behind the
+    # others are never loaded in this worker
+    for name in _enabled_routers():
+        module = importlib.import_module(f"api.routes.{name}")
+        app.include_router(module.router, prefix=f"{prefix}/{name}", tags=[name.title()])
+
+
+def _created(factory) -> bool:
+    """Whether an lru_cache'd get_*() factory has already built its instance"""
+    return factory.cache_info().currsize > 0
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifecycle management for the application"""
     logger.info("Starting ICARUSIAV2", version="2.0.0")
+    routers = set(_enabled_routers())
     
-    # Initialize all systems
-    await memory_manager.initialize()
-    await kgraph.initialize()
-    await analytics.initialize()
+    # Initialize the systems behind the enabled routers
+    anchor_gc = None
+    if "knowledge" in routers:
+        from knowledge.memory.manager import get_memory_manager
+        from knowledge.kgraph.integration import get_knowledge_graph
+        await get_memory_manager().initialize()
+        await get_knowledge_graph().initialize()
+    if "enterprise" in routers:
+        from enterprise.analytics.dashboard import get_analytics_dashboard
+        from enterprise.orchestration.coordinator import get_coordinator
+        await get_analytics_dashboard().initialize()
+        # load the semantic-routing model now rather than on the first routed request
+        await asyncio.to_thread(get_coordinator().load_encoder)
+    if "cognitive" in routers:
+        from core.modules.anchor_points.manager import get_anchor_manager
+        anchor_gc = asyncio.create_task(
+            get_anchor_manager().run_gc(settings.ANCHOR_GC_INTERVAL, settings.ANCHOR_SESSION_TTL)
+        )
+    app.state.ready = True
     
     yield
     
-    # Cleanup
+    # Cleanup whatever was actually created
+    app.state.ready = False
+    if anchor_gc is not None:
+        anchor_gc.cancel()
     logger.info("Shutting down ICARUSIAV2")
-    await memory_manager.cleanup()
-    await kgraph.cleanup()
+    if "knowledge" in routers:
+        await get_memory_manager().cleanup()
+        await get_knowledge_graph().cleanup()
+    crm = sys.modules.get("enterprise.crm.integration")
+    if crm and _created(crm.get_crm_integration):
+        await crm.get_crm_integration().close()
+    memo = sys.modules.get("core.modules.reasoning.memo")
+    if memo and _created(memo.get_reasoning_memo):
+        memo.get_reasoning_memo().close()
+    whatsapp = sys.modules.get("sales.whatsapp.api")
+    if whatsapp and _created(whatsapp.get_whatsapp_api):
+        await whatsapp.get_whatsapp_api().close()
+    await close_openai_client()
+    redis_client = sys.modules.get("core.redis_client")
+    if redis_client:
+        await redis_client.close_redis()
 
 
 app = FastAPI(
     title="ICARUSIAV2 - Advanced Sales AI",
     version="2.0.0",
     description="Next-generation Sales AI with advanced cognitive capabilities",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=DefaultResponse
 )
 
 # CORS configuration
@@ -191,6 +165,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Response compression for large JSON payloads
+if BrotliMiddleware:
+    app.add_middleware(BrotliMiddleware, minimum_size=1024, gzip_fallback=True)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -214,25 +194,33 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Detailed health check"""
-    return {
-        "status": "healthy",
-        "components": {
-            "reasoning_engine": reasoning_engine.is_ready(),
-            "memory_manager": memory_manager.is_healthy(),
-            "knowledge_graph": kgraph.is_connected(),
-            "analytics": analytics.is_ready()
-        }
-    }
+    """Detailed health check (only components this worker has loaded)"""
+    components = {}
+    reasoning = sys.modules.get("core.modules.reasoning.verbal_reasoning")
+    if reasoning and _created(reasoning.get_reasoning_engine):
+        components["reasoning_engine"] = reasoning.get_reasoning_engine().is_ready()
+    memory = sys.modules.get("knowledge.memory.manager")
+    if memory and _created(memory.get_memory_manager):
+        components["memory_manager"] = memory.get_memory_manager().is_healthy()
+    kgraph = sys.modules.get("knowledge.kgraph.integration")
+    if kgraph and _created(kgraph.get_knowledge_graph):
+        components["knowledge_graph"] = kgraph.get_knowledge_graph().is_connected()
+    analytics = sys.modules.get("enterprise.analytics.dashboard")
+    if analytics and _created(analytics.get_analytics_dashboard):
+        components["analytics"] = analytics.get_analytics_dashboard().is_ready()
+    return {"status": "healthy", "components": components}
+
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe for the load balancer (503 until startup completes)"""
+    if not getattr(app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready"}
 
 
 # Include routers
-from api.routes import sales, knowledge, enterprise, cognitive
-
-app.include_router(cognitive.router, prefix="/api/v1/cognitive", tags=["Cognitive"])
-app.include_router(knowledge.router, prefix="/api/v1/knowledge", tags=["Knowledge"])
-app.include_router(sales.router, prefix="/api/v1/sales", tags=["Sales"])
-app.include_router(enterprise.router, prefix="/api/v1/enterprise", tags=["Enterprise"])
+_include_routers(app, settings.API_V1_PREFIX)
 
 
 if __name__ == "__main__":
@@ -242,5 +230,11 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=settings.DEBUG,
+        workers=None if settings.DEBUG else settings.UVICORN_WORKERS,
+        loop="uvloop",
+        http="httptools",
+        limit_concurrency=settings.UVICORN_LIMIT_CONCURRENCY,
+        timeout_keep_alive=settings.UVICORN_TIMEOUT_KEEP_ALIVE,
+        timeout_graceful_shutdown=settings.UVICORN_GRACEFUL_SHUTDOWN,
         log_level="info"
     )
@@ -1,90 +1,85 @@
+"""
+Objection Handling AI
+Handles customer objections intelligently
+"""
+
 from __future__ import annotations
 
+import json
+import re
 from enum import Enum
-from typing import Any, Dict, List, Optional
+from functools import lru_cache
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Pattern, Set, Tuple
+
+import structlog
 
 try:
-    from openai import AsyncOpenAI  # type: ignore
+    import orjson  # type: ignore
 except Exception:  # pragma: no cover
-    AsyncOpenAI = None  # type: ignore
+    orjson = None  # type: ignore
 
 from config.settings import settings
+from core.openai_client import chat_completion, get_openai_client
 
+logger = structlog.get_logger()
 
-class ObjectionType(Enum):
-    PRICE = "price"
-    TIMING = "timing"
-    NEED = "need"
-    TRUST = "trust"
-    COMPETITOR = "competitor"
-    AUTHORITY = "authority"
-    OTHER = "other"
+_loads = orjson.loads if orjson is not None else json.loads
 
+_FALLBACK_RESPONSE = "Entiendo tu preocupación. Déjame ayudarte a resolver esto."
 
-class ObjectionHandler:
-    def __init__(self):
-        self.client = (
-            AsyncOpenAI(api_key=settings.OPENAI_API_KEY) if (AsyncOpenAI and settings.OPENAI_API_KEY) else None
-        )
-        self.model = settings.OPENAI_MODEL
 
-    async def handle_objection_flow(
-        self,
-        message: str,
-        conversation_history: List[str],
-        customer_data: Optional[Dict[str, Any]] = None,
-    ) -> Dict[str, Any]:
-        objection = self._detect_simple(message)
-        if not self.client:
-            return {
-                "objection": {"type": objection.value, "concern": message, "confidence": 0.5},
-                "handling": {"response": "Te entiendo. ¿Qué presupuesto o rango tenías pensado para ver opciones?", "strategy": "fallback"},
-            }
+def _compile_keywords(patterns: Dict[Hashable, Iterable[str]]) -> Tuple[Pattern, Dict[str, Hashable]]:
+    """One regex with a named group per label, plus group name -> label.
 
-        prompt = f"""Eres experto manejando objeciones de ventas.
-Mensaje: {message}
-Historial: {conversation_history[-5:]}
-Cliente: {customer_data or {}}
+    The alternation sits in a lookahead so matches may overlap, and the group
+    that matched names the label directly. Within a label longer keywords are
+    tried first; a keyword must not be a prefix of another label's keyword.
+    """
+    labels = {f"k{i}": label for i, label in enumerate(patterns)}
+    groups = "|".join(
+        f"(?P<{name}>{'|'.join(re.escape(k) for k in sorted(patterns[label], key=len, reverse=True))})"
+        for name, label in labels.items()
+    )
+    return re.compile(f"(?=(?:{groups}))"), labels
 
-Devuelve JSON:
-{{"type":"price|timing|need|trust|competitor|authority|other","response":"...","next_question":"..."}}
-"""
-        resp = await self.client.chat.completions.create(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.6,
-            response_format={"type": "json_object"},
-        )
-        import json
 
-        data = json.loads(resp.choices[0].message.content or "{}")
-        return {
-            "objection": {"type": data.get("type", objection.value), "concern": message, "confidence": 0.7},
-            "handling": {"response": data.get("response", ""), "next_question": data.get("next_question", "")},
-        }
+def _matched_labels(regex: Pattern, labels: Dict[str, Hashable], text: str) -> Set[Hashable]:
+    found: Set[Hashable] = set()
+    for match in regex.finditer(text):
+        found.add(labels[match.lastgroup])
+        if len(found) == len(labels):
+            break
+    return found
 
-    def _detect_simple(self, message: str) -> ObjectionType:
-        m = message.lower()
-        if any(w in m for w in ["caro", "precio", "costoso"]):
-            return ObjectionType.PRICE
-        if any(w in m for w in ["luego", "después", "ahora no"]):
-            return ObjectionType.TIMING
-        if any(w in m for w in ["no necesito", "no me sirve"]):
-            return ObjectionType.NEED
-        return ObjectionType.OTHER
 
-"""
-Objection Handling AI
-Handles customer objections intelligently
-"""
+_OBJECTION_FLOW_PROMPT = """
+You are a sales expert handling a customer objection.
 
-from typing import Dict, List, Optional, Any
-from enum import Enum
-import structlog
-from openai import AsyncOpenAI
-from config.settings import settings
+Message: {message}
 
-logger = structlog.get_logger()
+Conversation History:
+{history}
+
+Customer Data: {customer}
+
+Recommended strategies by objection type:
+{strategies}
+
+1. Identify the objection type (price, timing, need, trust, competitor, authority, other),
+   the specific concern, the underlying reason and your confidence.
+2. Write a response that acknowledges the objection empathetically, addresses the
+   specific concern, reframes positively and moves toward resolution.
+
+Respond with JSON:
+{{
+    "type": "price/timing/need/trust/competitor/authority/other",
+    "concern": "specific concern",
+    "reason": "underlying reason",
+    "confidence": 0.0-1.0,
+    "keywords": ["keyword1", "keyword2"],
+    "response": "your response to the customer"
+}}
+"""
 
 
 class ObjectionType(Enum):
@@ -102,7 +97,7 @@ class ObjectionHandler:
     """Objection handling system"""
     
     def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        self.client = get_openai_client()
         self.model = settings.OPENAI_MODEL
         self._objection_patterns: Dict[ObjectionType, List[str]] = {
             ObjectionType.PRICE: ["caro", "precio", "costoso", "barato", "económico"],
@@ -112,6 +107,8 @@ class ObjectionHandler:
             ObjectionType.COMPETITOR: ["competencia", "otro", "alternativa"],
             ObjectionType.AUTHORITY: ["decidir", "jefe", "supervisor", "autorización"]
         }
+        self._pattern_re, self._pattern_types = _compile_keywords(self._objection_patterns)
+        self._types_by_value = {t.value: t for t in ObjectionType}
         self._handling_strategies: Dict[ObjectionType, List[str]] = {
             ObjectionType.PRICE: [
                 "Reframe value proposition",
@@ -146,6 +143,14 @@ class ObjectionHandler:
                 "Create urgency for decision"
             ]
         }
+        self._strategy_guide = "\n".join(
+            f"- {t.value}: {', '.join(strategies)}" for t, strategies in self._handling_strategies.items()
+        )
+    
+    def _keyword_types(self, message: str) -> List[ObjectionType]:
+        """Objection types whose keywords occur in the message (one scan, reported in pattern order)"""
+        found = _matched_labels(self._pattern_re, self._pattern_types, message.lower())
+        return [obj_type for obj_type in self._objection_patterns if obj_type in found]
     
     async def identify_objection(
         self,
@@ -154,13 +159,8 @@ class ObjectionHandler:
     ) -> Dict[str, Any]:
         """Identify objection type and details"""
         
-        message_lower = message.lower()
-        
         # Check against patterns
-        detected_types = []
-        for obj_type, patterns in self._objection_patterns.items():
-            if any(pattern in message_lower for pattern in patterns):
-                detected_types.append(obj_type)
+        detected_types = self._keyword_types(message)
         
         # Use AI for more nuanced detection
         prompt = f"""
@@ -186,14 +186,15 @@ Respond with JSON:
 """
         
         try:
-            response = await self.client.chat.completions.create(
+            response = await chat_completion(
+                self.client,
                 model=self.model,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.2,
                 response_format={"type": "json_object"}
             )
             
-            result = eval(response.choices[0].message.content)
+            result = _loads(response.choices[0].message.content or "{}")
             
             # Use detected types if AI didn't find one
             if result.get("type") == "other" and detected_types:
@@ -248,7 +249,8 @@ Response:
 """
         
         try:
-            response = await self.client.chat.completions.create(
+            response = await chat_completion(
+                self.client,
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "You are an expert at handling sales objections."},
@@ -272,7 +274,7 @@ Response:
         except Exception as e:
             logger.error("Objection handling error", error=str(e))
             return {
-                "response": "Entiendo tu preocupación. Déjame ayudarte a resolver esto.",
+                "response": _FALLBACK_RESPONSE,
                 "strategy_used": "fallback",
                 "error": str(e)
             }
@@ -320,15 +322,82 @@ Response:
         conversation_history: List[str],
         customer_data: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
-        """Complete objection handling flow"""
-        # Identify objection
-        objection = await self.identify_objection(message, conversation_history)
+        """Complete objection handling flow
         
-        # Handle objection
-        handling = await self.handle_objection(objection, conversation_history, customer_data)
+        Identification and the reply come from a single JSON completion instead of
+        two sequential calls; keyword matches fill in the type when the model says
+        "other".
+        """
+        detected_types = self._keyword_types(message)
+        prompt = _OBJECTION_FLOW_PROMPT.format(
+            message=message,
+            history=chr(10).join(conversation_history[-5:]),
+            customer=customer_data if customer_data else "Not available",
+            strategies=self._strategy_guide
+        )
+        
+        try:
+            response = await chat_completion(
+                self.client,
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": "You are an expert at handling sales objections."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.6,
+                max_tokens=600,
+                response_format={"type": "json_object"}
+            )
+            data = _loads(response.choices[0].message.content or "{}")
+            if not isinstance(data, dict):
+                data = {}
+        except Exception as e:
+            logger.error("Objection handling error", error=str(e))
+            return {
+                "objection": {
+                    "type": detected_types[0].value if detected_types else "other",
+                    "concern": message,
+                    "reason": "unknown",
+                    "confidence": 0.5,
+                    "error": str(e)
+                },
+                "handling": {
+                    "response": _FALLBACK_RESPONSE,
+                    "strategy_used": "fallback",
+                    "error": str(e)
+                },
+                "complete": True
+            }
+        
+        objection_type = self._types_by_value.get(str(data.get("type", "other")).lower(), ObjectionType.OTHER)
+        if objection_type is ObjectionType.OTHER and detected_types:
+            objection_type = detected_types[0]
+        strategies = self._handling_strategies.get(objection_type, [])
+        
+        objection = {
+            "type": objection_type.value,
+            "concern": data.get("concern", message),
+            "reason": data.get("reason", "unknown"),
+            "confidence": data.get("confidence", 0.5),
+            "keywords": data.get("keywords", [])
+        }
+        handling = {
+            # a completion without a usable reply still answers the customer
+            "response": str(data.get("response") or "").strip() or _FALLBACK_RESPONSE,
+            "strategy_used": strategies[0] if strategies else "general",
+            "objection_type": objection_type.value,
+            "next_steps": self._get_next_steps(objection_type)
+        }
+        logger.info("Objection handled", objection_type=objection_type.value, confidence=objection["confidence"])
         
         return {
             "objection": objection,
             "handling": handling,
             "complete": True
         }
+
+
+@lru_cache(maxsize=1)
+def get_objection_handler() -> ObjectionHandler:
+    """Process-wide ObjectionHandler shared across requests."""
+    return ObjectionHandler()
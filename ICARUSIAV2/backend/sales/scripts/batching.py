@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+import logging
+
+logger = logging.getLogger("icarusiav2.batching")
+
+BatchHandler = Callable[[List[Any]], Awaitable[List[Any]]]
+
+
+class BatchingQueue:
+    """Coalesces concurrent submissions into batched handler calls.
+
+    A background consumer collects up to ``batch_size`` items, waiting at most
+    ``max_wait_ms`` after the first one, then hands the batch to ``handler``
+    and resolves each caller's future with its slice of the result. A handler
+    reports a per-item failure by returning the exception in that item's slot;
+    only that caller's ``submit`` raises it.
+    """
+
+    def __init__(self, handler: BatchHandler, batch_size: int = 16, max_wait_ms: float = 20):
+        self._handler = handler
+        self.batch_size = max(batch_size, 1)
+        self.max_wait = max_wait_ms / 1000
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumer: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    async def submit(self, item: Any) -> Any:
+        queue = self._ensure_consumer()
+        fut = asyncio.get_running_loop().create_future()
+        await queue.put((item, fut))
+        return await fut
+
+    def _ensure_consumer(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # first use, or the previous event loop is gone (e.g. a new test client)
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._consumer = None
+        if self._consumer is None or self._consumer.done():
+            self._consumer = loop.create_task(self._run())
+        return self._queue
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        batch: List[Tuple[Any, asyncio.Future]] = []
+        try:
+            while True:
+                batch = [await queue.get()]
+                deadline = loop.time() + self.max_wait
+                while len(batch) < self.batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                # dispatch without blocking collection of the next batch
+                task = loop.create_task(self._dispatch(batch))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+                batch = []
+        except asyncio.CancelledError:
+            # closing: hand over the batch being collected and whatever is
+            # still queued, so no submitter is left waiting
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            for start in range(0, len(batch), self.batch_size):
+                await self._dispatch(batch[start:start + self.batch_size])
+            raise
+
+    async def _dispatch(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        try:
+            results = await self._handler([item for item, _ in batch])
+        except Exception as e:
+            logger.exception("batch_handler_error size=%s", len(batch))
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), result in zip(batch, results):
+            if fut.done():
+                continue
+            if isinstance(result, Exception):
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
+
+    async def close(self) -> None:
+        """Stop the consumer after flushing queued items, then wait for in-flight batches."""
+        consumer, self._consumer = self._consumer, None
+        if consumer is not None and not consumer.done():
+            consumer.cancel()
+            if consumer.get_loop() is asyncio.get_running_loop():
+                await asyncio.gather(consumer, return_exceptions=True)
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
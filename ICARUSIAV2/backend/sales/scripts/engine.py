@@ -1,113 +1,479 @@
+"""
+Sales Script Engine
+Manages and executes sales scripts
+"""
+
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from collections import OrderedDict, defaultdict
 from enum import Enum
-from typing import Any, Dict, List, Optional
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, AsyncIterator, Dict, Final, List, Mapping, Optional, Tuple
+
+import httpx
+import structlog
 
 try:
-    from openai import AsyncOpenAI  # type: ignore
+    import numpy as np  # type: ignore
 except Exception:  # pragma: no cover
-    AsyncOpenAI = None  # type: ignore
+    np = None  # type: ignore
+
+try:
+    import orjson  # type: ignore
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
 
 from config.settings import settings
+from core.openai_client import OPENAI_ERRORS, chat_completion, estimate_tokens, get_openai_client, truncate_prompt
+from core.redis_client import REDIS_ERRORS, get_redis
+from sales.objections.handler import _compile_keywords, _matched_labels
+from sales.scripts.batching import BatchingQueue
 
+logger = structlog.get_logger()
 
-class ScriptStage(Enum):
-    GREETING = "greeting"
-    QUALIFICATION = "qualification"
-    PRESENTATION = "presentation"
-    OBJECTION_HANDLING = "objection_handling"
-    CLOSING = "closing"
-    FOLLOW_UP = "follow_up"
+_loads = orjson.loads if orjson is not None else json.loads
 
 
-class SalesScriptEngine:
-    def __init__(self):
-        self.client = (
-            AsyncOpenAI(api_key=settings.OPENAI_API_KEY) if (AsyncOpenAI and settings.OPENAI_API_KEY) else None
-        )
-        self.model = settings.OPENAI_MODEL
+# Stage playbooks, keyed by ScriptStage value; built once, read-only
+_STAGE_SCRIPTS: Final[Mapping[str, Dict[str, Any]]] = MappingProxyType({
+    "greeting": {
+        "name": "greeting",
+        "tone": "friendly",
+        "key_points": ["introduce", "ask_how_can_help"],
+        "examples": [
+            "¡Hola! Bienvenido a [Empresa]. ¿En qué puedo ayudarte hoy?",
+            "Hola, gracias por contactarnos. ¿Cómo puedo asistirte?"
+        ]
+    },
+    "qualification": {
+        "name": "qualification",
+        "tone": "consultative",
+        "key_points": ["understand_needs", "identify_pain_points"],
+        "examples": [
+            "Para poder ayudarte mejor, ¿podrías contarme un poco sobre tu situación actual?",
+            "Entiendo. ¿Qué desafíos estás enfrentando actualmente?"
+        ]
+    },
+    "presentation": {
+        "name": "presentation",
+        "tone": "informative",
+        "key_points": ["highlight_benefits", "address_needs"],
+        "examples": [
+            "Nuestro producto/servicio puede ayudarte con [beneficio específico].",
+            "Basándome en lo que me has contado, creo que [solución] sería perfecta para ti."
+        ]
+    },
+    "objection_handling": {
+        "name": "objection_handling",
+        "tone": "empathetic",
+        "key_points": ["acknowledge", "address", "reframe"],
+        "examples": [
+            "Entiendo tu preocupación. Déjame explicarte cómo abordamos eso.",
+            "Esa es una pregunta válida. Te explico cómo lo resolvemos."
+        ]
+    },
+    "closing": {
+        "name": "closing",
+        "tone": "confident",
+        "key_points": ["summarize_benefits", "call_to_action"],
+        "examples": [
+            "Perfecto. ¿Te parece bien si procedemos con [acción]?",
+            "Excelente. ¿Cuándo sería un buen momento para comenzar?"
+        ]
+    },
+    "follow_up": {
+        "name": "follow_up",
+        "tone": "professional",
+        "key_points": ["check_in", "offer_assistance"],
+        "examples": [
+            "Hola, quería seguir en contacto contigo. ¿Cómo va todo?",
+            "Solo quería asegurarme de que todo está bien. ¿Necesitas algo más?"
+        ]
+    }
+})
 
-    async def get_response(
-        self,
-        user_message: str,
-        conversation_history: List[str],
-        session_id: str,
-        customer_data: Optional[Dict[str, Any]] = None,
-        current_stage: Optional[ScriptStage] = None,
-    ) -> Dict[str, Any]:
-        stage = current_stage or self._determine_stage(conversation_history)
-        prompt = self._build_prompt(user_message, conversation_history, customer_data, stage)
 
-        if not self.client:
-            return {
-                "response": f"[fallback:{stage.value}] Gracias. ¿Me cuentas un poco más para ayudarte mejor?",
-                "stage": stage.value,
-                "next_stage": self._next_stage(stage).value,
-                "script_used": "fallback",
-            }
-
-        resp = await self.client.chat.completions.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": "Eres un agente de ventas profesional (ES)."},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.7,
-            max_tokens=250,
-        )
-        text = (resp.choices[0].message.content or "").strip()
-        return {"response": text, "stage": stage.value, "next_stage": self._next_stage(stage).value, "script_used": "llm"}
+# Output caps per stage: WhatsApp replies run 30-60 tokens and output length
+# dominates latency, so only stages that explain or close get more room
+_STAGE_MAX_TOKENS: Dict[str, int] = {
+    "greeting": 80,
+    "qualification": 80,
+    "presentation": 120,
+    "objection_handling": 80,
+    "closing": 120,
+    "follow_up": 80,
+}
 
-    def _determine_stage(self, history: List[str]) -> ScriptStage:
-        if not history:
-            return ScriptStage.GREETING
-        last = history[-1].lower()
-        if any(w in last for w in ["precio", "cuesta", "coste"]):
-            return ScriptStage.PRESENTATION
-        if any(w in last for w in ["no", "pero", "caro", "duda"]):
-            return ScriptStage.OBJECTION_HANDLING
-        if any(w in last for w in ["comprar", "contratar", "pagar"]):
-            return ScriptStage.CLOSING
-        return ScriptStage.QUALIFICATION
-
-    def _next_stage(self, stage: ScriptStage) -> ScriptStage:
-        if stage == ScriptStage.GREETING:
-            return ScriptStage.QUALIFICATION
-        if stage == ScriptStage.QUALIFICATION:
-            return ScriptStage.PRESENTATION
-        if stage == ScriptStage.PRESENTATION:
-            return ScriptStage.OBJECTION_HANDLING
-        if stage == ScriptStage.OBJECTION_HANDLING:
-            return ScriptStage.CLOSING
-        if stage == ScriptStage.CLOSING:
-            return ScriptStage.FOLLOW_UP
-        return stage
-
-    def _build_prompt(
-        self, msg: str, history: List[str], customer_data: Optional[Dict[str, Any]], stage: ScriptStage
-    ) -> str:
-        hist = "\n".join(history[-6:])
-        return f"""Etapa: {stage.value}
-Cliente: {customer_data or {}}
-Historial:
-{hist}
 
-Mensaje: {msg}
+_FEW_SHOT_DIALOGS = (
+    ("Hola, vi su anuncio", "greeting",
+     "¡Hola! Gracias por escribirnos. Cuéntame, ¿qué te llamó la atención del anuncio?"),
+    ("Tenemos un equipo de 12 personas y perdemos muchos leads", "qualification",
+     "Entiendo, con 12 personas es fácil que se escapen oportunidades. ¿Hoy cómo registran y dan seguimiento a cada lead?"),
+    ("¿Cuánto cuesta?", "presentation",
+     "Depende del plan que mejor encaje contigo. Para equipos como el tuyo la mayoría elige el plan Profesional, que incluye seguimiento automático. ¿Te comparto qué incluye y su precio?"),
+    ("Me parece caro", "objection_handling",
+     "Entiendo que es una inversión importante. Si recuperas aunque sea dos leads al mes que hoy se pierden, ¿cuánto representaría eso para tu negocio?"),
+    ("Vale, ¿cómo empezamos?", "closing",
+     "¡Perfecto! Te envío el enlace de alta y agendamos una llamada de 20 minutos para dejarlo configurado. ¿Te viene mejor mañana o el jueves?"),
+    ("Lo tengo que consultar con mi socio", "objection_handling",
+     "Claro, tiene todo el sentido decidirlo juntos. ¿Te ayudaría que os prepare un resumen con lo que hemos hablado para compartirlo con él?"),
+    ("Perdona, estuve liado estas semanas", "follow_up",
+     "¡No te preocupes! Retomamos donde lo dejamos: estabas valorando el plan Profesional. ¿Sigue siendo una prioridad para este mes?"),
+)
 
-Responde en español, breve, empático y con una pregunta que avance la conversación."""
 
-"""
-Sales Script Engine
-Manages and executes sales scripts
-"""
+_QUALIFICATION_GUIDE = (
+    "Need: what problem they want to solve and what happens if they do not solve it.",
+    "Current process: which tool or routine they use today and what frustrates them about it.",
+    "Authority: who else takes part in the decision and who signs off the purchase.",
+    "Timing: when they would like to have a solution working and why that date.",
+    "Budget: whether they have a range in mind; ask only after the need is clear.",
+)
 
-from typing import Dict, List, Optional, Any
-from enum import Enum
-import structlog
-from openai import AsyncOpenAI
-from config.settings import settings
 
-logger = structlog.get_logger()
+_OBJECTION_GUIDE = (
+    "Price: acknowledge the concern, reframe in terms of return or cost of inaction, offer the plan that fits.",
+    "Timing (\"not now\"): ask what would need to change for it to be the right moment and propose a concrete follow-up date.",
+    "Competitor: ask what they value in the alternative and highlight the one difference that matters for their need.",
+    "Trust: offer references, a short demo or the trial period; never pressure.",
+    "Need a second opinion: offer material they can share and a joint call with the other decision maker.",
+)
+
+
+def _build_system_prompt(knowledge: str = "") -> str:
+    """Static system prompt: persona, rules, product knowledge, every stage playbook and few-shot dialogs.
+
+    It never varies between requests, so OpenAI's automatic prefix cache
+    (which needs 1024+ identical leading tokens) can serve it; all per-request
+    data goes in the user message after it.
+    """
+    parts = [
+        "You are a professional sales agent chatting with prospects over WhatsApp on behalf of the company.",
+        "",
+        "Rules:",
+        "- Always answer in the customer's language (Spanish unless they write otherwise).",
+        "- Keep replies short: at most 40 words, no lists, no markdown.",
+        "- Responde en 40 palabras o menos, con una sola pregunta final.",
+        "- Be warm and empathetic, never pushy; acknowledge what the customer said before moving on.",
+        "- End with exactly one question that moves the conversation to the next step.",
+        "- Never invent prices, discounts, deadlines or features that are not in the product knowledge or the customer data.",
+        "- If the customer asks for a human, say a colleague will contact them and ask for the best time.",
+        "- Follow the playbook of the stage given in the request: its tone and its key points.",
+        "",
+        "Qualification checklist (ask one item at a time, in natural language):",
+        *(f"- {item}" for item in _QUALIFICATION_GUIDE),
+        "",
+        "Objection handling (acknowledge, address, reframe, then ask):",
+        *(f"- {item}" for item in _OBJECTION_GUIDE),
+        "",
+    ]
+    if knowledge:
+        parts += ["Product knowledge (the only source for plans, prices and features):", knowledge, ""]
+    parts.append("Stage playbooks:")
+    for name, script in _STAGE_SCRIPTS.items():
+        parts.append(f"## {name}")
+        parts.append(f"Tone: {script['tone']}")
+        parts.append(f"Key points: {', '.join(script['key_points'])}")
+        parts.append("Examples:")
+        parts.extend(f"- {example}" for example in script["examples"])
+        parts.append("")
+    parts.append("Example dialogs:")
+    for message, stage, reply in _FEW_SHOT_DIALOGS:
+        parts.append(f"[stage: {stage}]")
+        parts.append(f"Customer: {message}")
+        parts.append(f"Agent: {reply}")
+        parts.append("")
+    parts.append("Each request gives the current stage, customer data, recent conversation and the new customer message. Reply with the agent's message only.")
+    return "\n".join(parts)
+
+
+_SALES_SYSTEM_PROMPT = _build_system_prompt()
+
+
+def _prompt_version(prompt: str) -> str:
+    # part of every response-cache key: editing the playbooks, prompt or
+    # knowledge files retires every cached reply, in-process and in Redis
+    return hashlib.blake2b(prompt.encode(), digest_size=4).hexdigest()
+
+
+def _load_knowledge(paths: str, model: str) -> str:
+    """Catalog/FAQ files rendered once for the system prompt (JSON compacted, text as-is)."""
+    sections = []
+    for path in (p.strip() for p in paths.split(",") if p.strip()):
+        try:
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            if path.endswith(".json"):
+                text = _compact_json(_loads(text))
+        except (OSError, ValueError) as e:
+            logger.warning("Sales knowledge file skipped", path=path, error=str(e))
+            continue
+        sections.append(f"### {os.path.basename(path)}\n{text.strip()}")
+    knowledge = "\n\n".join(sections)
+    limit = settings.SALES_KNOWLEDGE_MAX_TOKENS
+    if knowledge and limit > 0 and estimate_tokens(knowledge, model) > limit:
+        logger.warning("Sales knowledge truncated", max_tokens=limit)
+        knowledge = truncate_prompt(knowledge, model, limit)
+    return knowledge
+
+_REDIS_PREFIX = "icarus:sales:reply:"
+
+
+# Stage cues in the last message, highest priority first
+_STAGE_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "greeting": ("hola", "buenos", "buenas"),
+    "presentation": ("precio", "cuesta", "coste"),
+    "objection_handling": ("no", "pero", "sin embargo"),
+    "closing": ("comprar", "contratar", "adquirir"),
+}
+_STAGE_RE, _STAGE_GROUPS = _compile_keywords(_STAGE_KEYWORDS)
+
+
+def _keyword_stage(text: str) -> Optional[str]:
+    # one regex pass collects every cued stage; the highest-priority one wins
+    found = _matched_labels(_STAGE_RE, _STAGE_GROUPS, text)
+    return next((stage for stage in _STAGE_KEYWORDS if stage in found), None)
+
+
+# End of the first sentence in a streamed reply ("?" closes a Spanish "¿...")
+_SENTENCE_END_RE = re.compile(r"[.!?…](?=\s)|\n")
+
+
+def _csv_set(value: str) -> frozenset:
+    return frozenset(s.strip() for s in value.split(",") if s.strip())
+
+
+def _stage_ttls(value: str, default: int) -> Dict[str, int]:
+    # "greeting:86400,closing:300" -> per-stage TTL, unlisted stages get the default
+    ttls = {stage: default for stage in _STAGE_SCRIPTS}
+    for item in value.split(","):
+        stage, _, ttl = item.partition(":")
+        if stage.strip() and ttl.strip():
+            ttls[stage.strip()] = int(ttl)
+    return ttls
+
+
+def _canned_reply(script: Dict[str, Any], company: str = "") -> Optional[str]:
+    # script examples usable verbatim; "[Empresa]" is filled in when the company
+    # name is configured, otherwise examples with placeholders are skipped
+    examples = script.get("examples", [])
+    if company:
+        examples = [e.replace("[Empresa]", company) for e in examples]
+    examples = [e for e in examples if "[" not in e]
+    return random.choice(examples) if examples else None
+
+
+def _script_fallback(script: Dict[str, Any]) -> str:
+    examples = script.get("examples", [])
+    return examples[0] if examples else "Gracias por tu mensaje. ¿En qué puedo ayudarte?"
+
+
+def _compact_json(value: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str).decode()
+    return json.dumps(value, sort_keys=True, default=str, ensure_ascii=False, separators=(",", ":"))
+
+
+def _format_customer(customer_data: Optional[Dict[str, Any]], fields: frozenset) -> str:
+    """``key: value; ...`` with sorted keys, optionally only ``fields``.
+
+    The same customer always renders to the same bytes (stable cache keys),
+    and the flat form spends fewer tokens than JSON braces and quotes.
+    """
+    items = []
+    for key in sorted(customer_data or {}, key=str):
+        if fields and key not in fields:
+            continue
+        value = customer_data[key]
+        if value is None or value == "":
+            continue
+        items.append(f"{key}: {value if isinstance(value, (str, int, float)) else _compact_json(value)}")
+    return "; ".join(items)
+
+
+def _trim_history(history: List[str], model: str, budget: int, window: int = 5) -> List[str]:
+    """Newest messages of the last ``window`` that fit in ``budget`` tokens.
+
+    Counts come from estimate_tokens, whose cache means a message is only
+    encoded the first time it is seen, not on every turn of the session.
+    The newest message is always kept, cut from the middle if it alone is
+    over budget. A budget of 0 keeps the whole window.
+    """
+    recent = history[-window:]
+    if budget <= 0 or not recent:
+        return recent
+    kept: List[str] = []
+    used = 0
+    for message in reversed(recent):
+        cost = estimate_tokens(message, model)
+        if used + cost > budget:
+            if not kept:
+                kept.append(truncate_prompt(message, model, budget))
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    return kept
+
+
+def _response_key(version: str, model: str, stage: str, user_message: str, context: str) -> str:
+    # the context already carries the trimmed history and customer data
+    raw = f"{version}|{model}|{stage}|{user_message}|{context}"
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+class _ResponseCache:
+    """Bounded LRU with per-entry TTL for generated sales replies.
+
+    Replies are sampled at temperature 0.7, so a hit replays one sample
+    verbatim for the whole TTL instead of drawing a fresh one. That is fine
+    for greetings and FAQ answers; set SALES_RESPONSE_CACHE_TTL=0 where every
+    reply must be regenerated. Concurrent misses on one key share a lock so
+    only the first of them calls the model; every ``lock()`` is paired with a
+    ``release()``, and the lock is dropped once its last user releases it.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}  # holder + waiters per key
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, text = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return text
+
+    def put(self, key: str, text: str, ttl: Optional[float] = None) -> None:
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), text)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def lock(self, key: str) -> asyncio.Lock:
+        # counted, not lock.locked(): between a holder's release and the woken
+        # waiter's acquire the lock looks free but is still spoken for
+        self._lock_users[key] = self._lock_users.get(key, 0) + 1
+        return self._locks.setdefault(key, asyncio.Lock())
+
+    def release(self, key: str) -> None:
+        users = self._lock_users.get(key, 0) - 1
+        if users > 0:
+            self._lock_users[key] = users
+        else:
+            self._lock_users.pop(key, None)
+            self._locks.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_SAME_INTENT_PROMPT = """¿Piden lo mismo estos dos mensajes de un cliente? Responde solo "si" o "no".
+A: {a}
+B: {b}"""
+
+
+class _SemanticCache:
+    """Replies reused across paraphrased messages of the same stage.
+
+    Unit-norm message embeddings live in a fixed-size ring (oldest entry
+    overwritten) and are scanned with one matrix-vector product. Scores at or
+    above ``hit`` are served directly, scores below ``miss`` are ignored, and
+    anything in between is confirmed by a one-token "same intent?" check on
+    a cheap model before the stored reply is reused.
+    """
+
+    def __init__(self, client: Any, maxsize: int, ttl: float, stages: frozenset):
+        self.client = client
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stages = stages
+        self.hit = settings.SALES_SEMANTIC_CACHE_HIT
+        self.miss = settings.SALES_SEMANTIC_CACHE_MISS
+        self._vectors = None  # (maxsize, dim) float32, allocated on first add
+        self._expires = None
+        self._entries: List[Optional[Tuple[str, str, str]]] = [None] * max(maxsize, 0)  # (stage, message, reply)
+        self._next = 0
+
+    def enabled_for(self, stage: str) -> bool:
+        return np is not None and self.client is not None and self.maxsize > 0 and self.ttl > 0 and stage in self.stages
+
+    async def embed(self, text: str):
+        try:
+            resp = await self.client.embeddings.create(
+                model=settings.SALES_SEMANTIC_CACHE_EMBEDDING_MODEL,
+                input=text,
+                dimensions=settings.SALES_SEMANTIC_CACHE_DIMENSIONS,
+            )
+        except OPENAI_ERRORS as e:
+            logger.warning("Semantic cache embedding failed", error=str(e))
+            return None
+        vector = np.asarray(resp.data[0].embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else None
+
+    async def lookup(self, stage: str, message: str, vector) -> Optional[str]:
+        if self._vectors is None or vector.shape[0] != self._vectors.shape[1]:
+            return None
+        scores = self._vectors @ vector
+        scores[self._expires < time.monotonic()] = -1.0
+        order = np.argsort(-scores)
+        for i in order[:4]:
+            score = float(scores[i])
+            if score < self.miss:
+                break
+            entry = self._entries[i]
+            if entry is None or entry[0] != stage:
+                continue
+            if score >= self.hit or await self._same_intent(message, entry[1]):
+                return entry[2]
+        return None
+
+    def add(self, stage: str, message: str, vector, reply: str) -> None:
+        if self._vectors is None:
+            self._vectors = np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32)
+            self._expires = np.zeros(self.maxsize, dtype=np.float64)
+        elif vector.shape[0] != self._vectors.shape[1]:
+            return
+        i = self._next
+        self._vectors[i] = vector
+        self._expires[i] = time.monotonic() + self.ttl
+        self._entries[i] = (stage, message, reply)
+        self._next = (i + 1) % self.maxsize
+
+    async def _same_intent(self, a: str, b: str) -> bool:
+        try:
+            resp = await chat_completion(
+                self.client,
+                model=settings.SALES_SEMANTIC_CACHE_VERIFY_MODEL,
+                messages=[{"role": "user", "content": _SAME_INTENT_PROMPT.format(a=a, b=b)}],
+                temperature=0,
+                max_tokens=2,
+            )
+        except OPENAI_ERRORS as e:
+            logger.warning("Semantic cache intent check failed", error=str(e))
+            return False
+        return (resp.choices[0].message.content or "").strip().lower().startswith(("si", "sí", "yes"))
 
 
 class ScriptStage(Enum):
@@ -120,15 +486,51 @@ class ScriptStage(Enum):
     FOLLOW_UP = "follow_up"
 
 
+# Stage after a reply; presentation and follow-up hold until the customer's
+# words move the conversation (see _determine_stage)
+_NEXT_STAGE: Final[Mapping[ScriptStage, ScriptStage]] = MappingProxyType({
+    ScriptStage.GREETING: ScriptStage.QUALIFICATION,
+    ScriptStage.QUALIFICATION: ScriptStage.PRESENTATION,
+    ScriptStage.PRESENTATION: ScriptStage.PRESENTATION,
+    ScriptStage.OBJECTION_HANDLING: ScriptStage.CLOSING,
+    ScriptStage.CLOSING: ScriptStage.FOLLOW_UP,
+    ScriptStage.FOLLOW_UP: ScriptStage.FOLLOW_UP,
+})
+
+
 class SalesScriptEngine:
     """Sales script engine"""
     
     def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        self.client = get_openai_client()
         self.model = settings.OPENAI_MODEL
         self._scripts: Dict[str, Dict[str, Any]] = {}
         self._session_stage: Dict[str, ScriptStage] = {}
         self.auto_adapt = settings.SALES_SCRIPT_AUTO_ADAPT
+        # catalog/FAQ inlined into the cached prefix instead of retrieved per request
+        knowledge = _load_knowledge(settings.SALES_KNOWLEDGE_PATHS, self.model)
+        self._system_prompt = _build_system_prompt(knowledge) if knowledge else _SALES_SYSTEM_PROMPT
+        self._prompt_version = _prompt_version(self._system_prompt)
+        self._max_tokens = dict(_STAGE_MAX_TOKENS)
+        # near-templated stages go to the light model, or skip the LLM entirely
+        light_stages = _csv_set(settings.SALES_LIGHT_MODEL_STAGES)
+        self._stage_models = {
+            stage.value: settings.SALES_LIGHT_MODEL if stage.value in light_stages else self.model
+            for stage in ScriptStage
+        }
+        self._canned_stages = _csv_set(settings.SALES_CANNED_STAGES)
+        self._customer_fields = _csv_set(settings.SALES_PROMPT_CUSTOMER_FIELDS)
+        self._history_tokens = settings.SALES_HISTORY_MAX_TOKENS
+        self._response_cache = _ResponseCache(settings.SALES_RESPONSE_CACHE_SIZE, settings.SALES_RESPONSE_CACHE_TTL)
+        self._cache_ttls = _stage_ttls(settings.SALES_RESPONSE_CACHE_STAGE_TTLS, settings.SALES_RESPONSE_CACHE_TTL)
+        # shared second level so workers and restarts reuse each other's replies
+        self._redis = get_redis() if settings.SALES_RESPONSE_CACHE_REDIS else None
+        self._semantic_cache = _SemanticCache(
+            self.client,
+            settings.SALES_SEMANTIC_CACHE_SIZE,
+            settings.SALES_RESPONSE_CACHE_TTL,
+            _csv_set(settings.SALES_SEMANTIC_CACHE_STAGES),
+        )
     
     async def get_response(
         self,
@@ -147,6 +549,18 @@ class SalesScriptEngine:
         # Get script for stage
         script = self._get_script_for_stage(current_stage)
         
+        # Templated stages are answered straight from the script, no prompt or LLM call
+        if current_stage.value in self._canned_stages:
+            canned = _canned_reply(script, settings.COMPANY_NAME)
+            if canned is not None:
+                next_stage = self._advance_stage(session_id, canned, current_stage, conversation_history)
+                return {
+                    "response": canned,
+                    "stage": current_stage.value,
+                    "next_stage": next_stage.value,
+                    "script_used": "template"
+                }
+        
         # Build context
         context = self._build_context(
             conversation_history,
@@ -164,15 +578,7 @@ class SalesScriptEngine:
         )
         
         # Update stage if needed
-        next_stage = self._determine_next_stage(
-            response,
-            current_stage,
-            conversation_history
-        )
-        
-        if next_stage != current_stage:
-            self._session_stage[session_id] = next_stage
-            logger.info("Stage transition", session_id=session_id, from_stage=current_stage.value, to_stage=next_stage.value)
+        next_stage = self._advance_stage(session_id, response, current_stage, conversation_history)
         
         return {
             "response": response,
@@ -181,6 +587,114 @@ class SalesScriptEngine:
             "script_used": script.get("name", "default")
         }
     
+    async def stream_response(
+        self,
+        user_message: str,
+        conversation_history: List[str],
+        session_id: str,
+        customer_data: Optional[Dict[str, Any]] = None,
+        current_stage: Optional[ScriptStage] = None
+    ) -> AsyncIterator[str]:
+        """Like get_response, but yields the reply in parts as the model writes it.
+        
+        The first sentence is yielded as soon as it is complete and the rest
+        once generation ends, so the caller can deliver the opening right away.
+        Cached, canned and fallback replies arrive as a single part.
+        """
+        if not current_stage:
+            current_stage = self._determine_stage(conversation_history, session_id)
+        script = self._get_script_for_stage(current_stage)
+        if current_stage.value in self._canned_stages:
+            canned = _canned_reply(script, settings.COMPANY_NAME)
+            if canned is not None:
+                self._advance_stage(session_id, canned, current_stage, conversation_history)
+                yield canned
+                return
+        context = self._build_context(conversation_history, customer_data, current_stage, script)
+        
+        parts: List[str] = []
+        async for part in self._stream_generate(user_message, context, script, current_stage):
+            parts.append(part)
+            yield part
+        
+        self._advance_stage(session_id, " ".join(parts), current_stage, conversation_history)
+    
+    async def _stream_generate(
+        self,
+        user_message: str,
+        context: str,
+        script: Dict[str, Any],
+        stage: ScriptStage
+    ) -> AsyncIterator[str]:
+        """Streamed counterpart of _generate_response (exact caches only, no semantic lookup)"""
+        if not self.client:
+            yield await self._generate_response(user_message, context, script, stage)
+            return
+        
+        key = None
+        if self._response_cache.enabled:
+            key = _response_key(self._prompt_version, self._stage_models[stage.value], stage.value, user_message, context)
+            cached = self._response_cache.get(key) or await self._shared_get(key)
+            if cached is not None:
+                yield cached
+                return
+        
+        buffer = ""
+        sent = 0
+        complete = False
+        try:
+            stream = await chat_completion(
+                self.client,
+                model=self._stage_models[stage.value],
+                messages=[
+                    {"role": "system", "content": self._system_prompt},
+                    {"role": "user", "content": f"{context}\n\nUser Message: {user_message}"}
+                ],
+                temperature=0.7,
+                max_tokens=self._max_tokens.get(stage.value, 80),
+                extra_body={"prompt_cache_key": f"sales-{stage.value}"},
+                stream=True
+            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                buffer += chunk.choices[0].delta.content or ""
+                if not sent:
+                    end = _SENTENCE_END_RE.search(buffer)
+                    if end and buffer[:end.end()].strip():
+                        sent = end.end()
+                        yield buffer[:sent].strip()
+            complete = True
+        except (*OPENAI_ERRORS, httpx.HTTPError) as e:
+            # rate limits and API errors arrive after chat_completion's retries;
+            # an interrupted stream surfaces as a transport error
+            logger.error("Response streaming error", error=str(e))
+            if not sent:
+                yield _script_fallback(script)
+                return
+        
+        rest = buffer[sent:].strip()
+        if rest:
+            yield rest
+        # a reply cut short by a stream error is delivered but never cached
+        text = buffer.strip()
+        if complete and key is not None and text:
+            await self._store_response(key, text, stage)
+    
+    def _advance_stage(
+        self,
+        session_id: str,
+        response: str,
+        current_stage: ScriptStage,
+        conversation_history: List[str]
+    ) -> ScriptStage:
+        """Record the session's next stage after a reply and return it"""
+        next_stage = self._determine_next_stage(response, current_stage, conversation_history)
+        if next_stage != current_stage:
+            self._session_stage[session_id] = next_stage
+            logger.info("Stage transition", session_id=session_id, from_stage=current_stage.value, to_stage=next_stage.value)
+        return next_stage
+    
     def _determine_stage(
         self,
         conversation_history: List[str],
@@ -196,79 +710,12 @@ class SalesScriptEngine:
             return ScriptStage.GREETING
         
         # Simple heuristics (can be enhanced with ML)
-        last_message = conversation_history[-1].lower()
-        
-        if any(word in last_message for word in ["hola", "buenos", "buenas"]):
-            return ScriptStage.GREETING
-        elif any(word in last_message for word in ["precio", "cuesta", "coste"]):
-            return ScriptStage.PRESENTATION
-        elif any(word in last_message for word in ["no", "pero", "sin embargo", "pero"]):
-            return ScriptStage.OBJECTION_HANDLING
-        elif any(word in last_message for word in ["comprar", "contratar", "adquirir"]):
-            return ScriptStage.CLOSING
-        else:
-            return ScriptStage.QUALIFICATION
+        stage = _keyword_stage(conversation_history[-1].lower())
+        return ScriptStage(stage) if stage else ScriptStage.QUALIFICATION
     
     def _get_script_for_stage(self, stage: ScriptStage) -> Dict[str, Any]:
         """Get script configuration for stage"""
-        scripts = {
-            ScriptStage.GREETING: {
-                "name": "greeting",
-                "tone": "friendly",
-                "key_points": ["introduce", "ask_how_can_help"],
-                "examples": [
-                    "¡Hola! Bienvenido a [Empresa]. ¿En qué puedo ayudarte hoy?",
-                    "Hola, gracias por contactarnos. ¿Cómo puedo asistirte?"
-                ]
-            },
-            ScriptStage.QUALIFICATION: {
-                "name": "qualification",
-                "tone": "consultative",
-                "key_points": ["understand_needs", "identify_pain_points"],
-                "examples": [
-                    "Para poder ayudarte mejor, ¿podrías contarme un poco sobre tu situación actual?",
-                    "Entiendo. ¿Qué desafíos estás enfrentando actualmente?"
-                ]
-            },
-            ScriptStage.PRESENTATION: {
-                "name": "presentation",
-                "tone": "informative",
-                "key_points": ["highlight_benefits", "address_needs"],
-                "examples": [
-                    "Nuestro producto/servicio puede ayudarte con [beneficio específico].",
-                    "Basándome en lo que me has contado, creo que [solución] sería perfecta para ti."
-                ]
-            },
-            ScriptStage.OBJECTION_HANDLING: {
-                "name": "objection_handling",
-                "tone": "empathetic",
-                "key_points": ["acknowledge", "address", "reframe"],
-                "examples": [
-                    "Entiendo tu preocupación. Déjame explicarte cómo abordamos eso.",
-                    "Esa es una pregunta válida. Te explico cómo lo resolvemos."
-                ]
-            },
-            ScriptStage.CLOSING: {
-                "name": "closing",
-                "tone": "confident",
-                "key_points": ["summarize_benefits", "call_to_action"],
-                "examples": [
-                    "Perfecto. ¿Te parece bien si procedemos con [acción]?",
-                    "Excelente. ¿Cuándo sería un buen momento para comenzar?"
-                ]
-            },
-            ScriptStage.FOLLOW_UP: {
-                "name": "follow_up",
-                "tone": "professional",
-                "key_points": ["check_in", "offer_assistance"],
-                "examples": [
-                    "Hola, quería seguir en contacto contigo. ¿Cómo va todo?",
-                    "Solo quería asegurarme de que todo está bien. ¿Necesitas algo más?"
-                ]
-            }
-        }
-        
-        return scripts.get(stage, scripts[ScriptStage.GREETING])
+        return _STAGE_SCRIPTS[stage.value]
     
     def _build_context(
         self,
@@ -277,19 +724,16 @@ class SalesScriptEngine:
         stage: ScriptStage,
         script: Dict[str, Any]
     ) -> str:
-        """Build context for response generation"""
-        context_parts = [
-            f"Current Stage: {stage.value}",
-            f"Script: {script.get('name')}",
-            f"Tone: {script.get('tone')}",
-            f"Key Points: {', '.join(script.get('key_points', []))}"
-        ]
+        """Build the per-request part of the prompt (the playbooks live in the system prompt)"""
+        context_parts = [f"Current Stage: {stage.value}"]
         
-        if customer_data:
-            context_parts.append(f"Customer Data: {customer_data}")
+        customer = _format_customer(customer_data, self._customer_fields)
+        if customer:
+            context_parts.append(f"Customer Data: {customer}")
         
-        if conversation_history:
-            context_parts.append(f"Recent Conversation:\n" + "\n".join(conversation_history[-5:]))
+        history = _trim_history(conversation_history, self._stage_models[stage.value], self._history_tokens)
+        if history:
+            context_parts.append(f"Recent Conversation:\n" + "\n".join(history))
         
         return "\n".join(context_parts)
     
@@ -300,43 +744,106 @@ class SalesScriptEngine:
         script: Dict[str, Any],
         stage: ScriptStage
     ) -> str:
-        """Generate response using script"""
+        """Generate response using script (repeated or paraphrased requests served from cache)"""
         
-        prompt = f"""
-You are a sales agent following a sales script.
-
-Context:
-{context}
-
-User Message: {user_message}
-
-Generate a response that:
-1. Follows the script guidelines
-2. Maintains the appropriate tone
-3. Addresses the user's message
-4. Moves the conversation forward
-
-Response:
-"""
+        if not self.client:
+            # no OPENAI_API_KEY / SDK: answer from the script
+            return _script_fallback(script)
+        
+        cache = self._response_cache
+        if not cache.enabled:
+            return await self._complete_response(user_message, context, script, stage)
+        
+        key = _response_key(self._prompt_version, self._stage_models[stage.value], stage.value, user_message, context)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
         
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
+            async with cache.lock(key):
+                cached = cache.get(key)
+                if cached is None:
+                    cached = await self._shared_get(key)
+                    if cached is not None:
+                        cache.put(key, cached, self._cache_ttls[stage.value])
+                if cached is not None:
+                    return cached
+                return await self._complete_response(user_message, context, script, stage, key)
+        finally:
+            cache.release(key)
+    
+    async def _complete_response(
+        self,
+        user_message: str,
+        context: str,
+        script: Dict[str, Any],
+        stage: ScriptStage,
+        cache_key: Optional[str] = None
+    ) -> str:
+        """Semantic cache lookup, then the model; only real completions are cached, never the script fallback"""
+        
+        semantic = self._semantic_cache
+        vector = None
+        if cache_key is not None and semantic.enabled_for(stage.value):
+            vector = await semantic.embed(user_message)
+            if vector is not None:
+                reused = await semantic.lookup(stage.value, user_message, vector)
+                if reused is not None:
+                    await self._store_response(cache_key, reused, stage)
+                    return reused
+        
+        # static system prompt first, request data last, for prefix caching
+        prompt = f"{context}\n\nUser Message: {user_message}"
+        
+        try:
+            response = await chat_completion(
+                self.client,
+                model=self._stage_models[stage.value],
                 messages=[
-                    {"role": "system", "content": "You are a professional sales agent."},
+                    {"role": "system", "content": self._system_prompt},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.7,
-                max_tokens=300
+                max_tokens=self._max_tokens.get(stage.value, 80),
+                extra_body={"prompt_cache_key": f"sales-{stage.value}"}
             )
             
-            return response.choices[0].message.content.strip()
+            text = (response.choices[0].message.content or "").strip()
+            if not text:
+                return _script_fallback(script)
+            if cache_key is not None:
+                await self._store_response(cache_key, text, stage)
+                if vector is not None:
+                    semantic.add(stage.value, user_message, vector, text)
+            return text
             
-        except Exception as e:
-            logger.error("Response generation error", error=str(e))
-            # Fallback to script examples
-            examples = script.get("examples", [])
-            return examples[0] if examples else "Gracias por tu mensaje. ¿En qué puedo ayudarte?"
+        except OPENAI_ERRORS as e:
+            # exact and semantic caches were already consulted: the script is the last resort
+            logger.error("Response generation error", error=str(e), error_type=type(e).__name__)
+            return _script_fallback(script)
+    
+    async def _store_response(self, key: str, text: str, stage: ScriptStage):
+        """Cache a reply in-process and, when enabled, in Redis (stage TTL)"""
+        ttl = self._cache_ttls[stage.value]
+        if ttl <= 0:
+            return
+        self._response_cache.put(key, text, ttl)
+        if self._redis is not None:
+            try:
+                await self._redis.setex(_REDIS_PREFIX + key, ttl, text)
+            except REDIS_ERRORS as e:
+                logger.warning("Shared response cache write failed", error=str(e))
+    
+    async def _shared_get(self, key: str) -> Optional[str]:
+        """Reply cached in Redis by any worker; errors count as a miss"""
+        if self._redis is None:
+            return None
+        try:
+            value = await self._redis.get(_REDIS_PREFIX + key)
+        except REDIS_ERRORS as e:
+            logger.warning("Shared response cache read failed", error=str(e))
+            return None
+        return value.decode() if value is not None else None
     
     def _determine_next_stage(
         self,
@@ -345,17 +852,14 @@ Response:
         conversation_history: List[str]
     ) -> ScriptStage:
         """Determine next stage based on response and history"""
-        # Simple logic - can be enhanced
-        if current_stage == ScriptStage.GREETING:
-            return ScriptStage.QUALIFICATION
-        elif current_stage == ScriptStage.QUALIFICATION:
-            return ScriptStage.PRESENTATION
-        elif current_stage == ScriptStage.OBJECTION_HANDLING:
-            return ScriptStage.CLOSING
-        elif current_stage == ScriptStage.CLOSING:
-            return ScriptStage.FOLLOW_UP
-        
-        return current_stage
+        return _NEXT_STAGE[current_stage]
+    
+    async def get_response_batch(
+        self,
+        requests: List[Dict[str, Any]]
+    ) -> List[Any]:
+        """Get responses for a batch of get_response() keyword sets, in order (exceptions for failed ones)"""
+        return await _run_batch(self, requests)
     
     def register_script(
         self,
@@ -369,3 +873,40 @@ Response:
     def get_script(self, name: str) -> Optional[Dict[str, Any]]:
         """Get registered script"""
         return self._scripts.get(name)
+
+
+async def _run_batch(engine: SalesScriptEngine, requests: List[Dict[str, Any]]) -> List[Any]:
+    # Sessions run concurrently; messages of one session stay sequential so
+    # stage transitions apply in arrival order. A failed message yields its
+    # exception in its slot and does not affect other messages or sessions.
+    results: List[Any] = [None] * len(requests)
+    by_session: Dict[str, List[int]] = defaultdict(list)
+    for i, req in enumerate(requests):
+        by_session[req["session_id"]].append(i)
+
+    async def run_session(indices: List[int]) -> None:
+        for i in indices:
+            try:
+                results[i] = await engine.get_response(**requests[i])
+            except Exception as e:
+                logger.error("Batched sales response failed", session_id=requests[i].get("session_id"), error=str(e))
+                results[i] = e
+
+    await asyncio.gather(*(run_session(indices) for indices in by_session.values()))
+    return results
+
+
+@lru_cache(maxsize=1)
+def get_sales_engine() -> SalesScriptEngine:
+    """Process-wide SalesScriptEngine shared across requests."""
+    return SalesScriptEngine()
+
+
+@lru_cache(maxsize=1)
+def get_sales_batcher() -> BatchingQueue:
+    """Process-wide queue coalescing webhook messages into engine batches."""
+    return BatchingQueue(
+        lambda requests: get_sales_engine().get_response_batch(requests),
+        batch_size=settings.WEBHOOK_BATCH_SIZE,
+        max_wait_ms=settings.WEBHOOK_BATCH_MAX_WAIT_MS,
+    )
@@ -1,57 +1,44 @@
+"""
+Twilio Webhook Handler
+Handles incoming webhooks from Twilio
+"""
+
 from __future__ import annotations
 
+import asyncio
+from functools import lru_cache
+from typing import Optional
+
+import structlog
 from fastapi import Request
-import logging
 
 try:
+    from twilio.base.exceptions import TwilioException  # type: ignore
+    from twilio.rest import Client  # type: ignore
     from twilio.twiml.messaging_response import MessagingResponse  # type: ignore
+    from twilio.twiml.voice_response import VoiceResponse  # type: ignore
+    # API errors, plus transport errors from requests (OSError subclasses)
+    _TWILIO_ERRORS: tuple = (TwilioException, OSError)
 except Exception:  # pragma: no cover
-    MessagingResponse = None  # type: ignore
+    Client = MessagingResponse = VoiceResponse = None  # type: ignore
+    _TWILIO_ERRORS = (OSError,)
 
-logger = logging.getLogger("icarusiav2.twilio")
-
-
-class TwilioWebhookHandler:
-    async def handle_incoming_message(self, request: Request) -> str:
-        try:
-            form = await request.form()
-            body = (form.get("Body") or "").strip()
-            frm = form.get("From")
-            logger.info("twilio_in", from_number=frm, body_preview=body[:80])
-            if not MessagingResponse:
-                return "Twilio SDK not installed"
-            resp = MessagingResponse()
-            resp.message("Recibido. ¿Qué producto/servicio te interesa y cuál es tu objetivo?")
-            return str(resp)
-        except Exception as e:
-            logger.error("twilio_error", error=str(e))
-            if not MessagingResponse:
-                return "Twilio SDK not installed"
-            resp = MessagingResponse()
-            resp.message("Error procesando mensaje.")
-            return str(resp)
-
-"""
-Twilio Webhook Handler
-Handles incoming webhooks from Twilio
-"""
-
-from typing import Dict, Any, Optional
-from fastapi import Request, HTTPException
-import structlog
-from twilio.rest import Client
-from twilio.twiml.messaging_response import MessagingResponse
 from config.settings import settings
+from sales.scripts.engine import get_sales_batcher
 
-logger = structlog.get_logger()
+logger = structlog.get_logger().bind(svc="sales", component="twilio")
 
+_ACK_MESSAGE = "Mensaje recibido. Procesando..."
+_SDK_MISSING = "Twilio SDK not installed"
 
 class TwilioWebhookHandler:
     """Handles Twilio webhooks"""
     
     def __init__(self):
         self.client = None
-        if settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN:
+        if Client is None:
+            logger.warning("Twilio SDK not installed")
+        elif settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN:
             self.client = Client(
                 settings.TWILIO_ACCOUNT_SID,
                 settings.TWILIO_AUTH_TOKEN
@@ -65,6 +52,8 @@ class TwilioWebhookHandler:
         request: Request
     ) -> str:
         """Handle incoming Twilio message"""
+        if MessagingResponse is None:
+            return _SDK_MISSING
         try:
             form_data = await request.form()
             
@@ -80,12 +69,12 @@ class TwilioWebhookHandler:
                 body_preview=body[:50]
             )
             
-            # Process message (integrate with sales agent)
-            # This would call the sales script engine
+            # Process message through the sales agent (batched with concurrent webhooks)
+            reply = await self._sales_reply(from_number, body)
             
             # Create response
             response = MessagingResponse()
-            response.message("Mensaje recibido. Procesando...")
+            response.message(reply)
             
             return str(response)
             
@@ -95,11 +84,28 @@ class TwilioWebhookHandler:
             response.message("Error procesando mensaje.")
             return str(response)
     
+    async def _sales_reply(self, session_id: Optional[str], text: str) -> str:
+        """Get the sales engine reply for an inbound message"""
+        if not text or not session_id:
+            return _ACK_MESSAGE
+        try:
+            result = await get_sales_batcher().submit({
+                "user_message": text,
+                "conversation_history": [],
+                "session_id": session_id
+            })
+            return result.get("response") or _ACK_MESSAGE
+        except Exception as e:
+            logger.error("Sales engine error", error=str(e))
+            return _ACK_MESSAGE
+    
     async def handle_incoming_call(
         self,
         request: Request
     ) -> str:
         """Handle incoming Twilio call"""
+        if VoiceResponse is None:
+            return _SDK_MISSING
         try:
             form_data = await request.form()
             
@@ -114,8 +120,6 @@ class TwilioWebhookHandler:
             )
             
             # Create TwiML response
-            from twilio.twiml.voice_response import VoiceResponse
-            
             response = VoiceResponse()
             response.say("Hola, bienvenido a Icarus IA.", language="es-ES")
             response.record(max_length=60, transcribe=True)
@@ -124,7 +128,6 @@ class TwilioWebhookHandler:
             
         except Exception as e:
             logger.error("Twilio call error", error=str(e))
-            from twilio.twiml.voice_response import VoiceResponse
             response = VoiceResponse()
             response.say("Lo siento, hubo un error.", language="es-ES")
             return str(response)
@@ -141,7 +144,9 @@ class TwilioWebhookHandler:
             return None
         
         try:
-            message = self.client.messages.create(
+            # the Twilio REST client does blocking HTTP; keep it off the event loop
+            message = await asyncio.to_thread(
+                self.client.messages.create,
                 body=body,
                 from_=from_number or settings.TWILIO_PHONE_NUMBER,
                 to=to
@@ -151,7 +156,7 @@ class TwilioWebhookHandler:
             
             return message.sid
             
-        except Exception as e:
+        except _TWILIO_ERRORS as e:
             logger.error("Twilio send error", error=str(e))
             return None
     
@@ -166,7 +171,8 @@ class TwilioWebhookHandler:
             return None
         
         try:
-            call = self.client.calls.create(
+            call = await asyncio.to_thread(
+                self.client.calls.create,
                 url=url,
                 from_=from_number or settings.TWILIO_PHONE_NUMBER,
                 to=to
@@ -176,7 +182,7 @@ class TwilioWebhookHandler:
             
             return call.sid
             
-        except Exception as e:
+        except _TWILIO_ERRORS as e:
             logger.error("Twilio call error", error=str(e))
             return None
     
@@ -185,3 +191,9 @@ class TwilioWebhookHandler:
         # Implement Twilio signature verification
         # For now, return True (should implement proper verification in production)
         return True
+
+
+@lru_cache(maxsize=1)
+def get_twilio_handler() -> TwilioWebhookHandler:
+    """Process-wide TwilioWebhookHandler shared across requests."""
+    return TwilioWebhookHandler()
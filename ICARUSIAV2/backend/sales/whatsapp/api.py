@@ -1,36 +1,29 @@
-from __future__ import annotations
-
-from typing import Any, Dict
-
-
-class WhatsAppAPI:
-    async def handle_webhook(self, payload: Dict[str, Any]) -> Dict[str, Any]:
-        # Minimal handler; tu integración real irá aquí.
-        entry = (payload.get("entry") or [{}])[0]
-        changes = (entry.get("changes") or [{}])[0]
-        value = changes.get("value") or {}
-        messages = value.get("messages") or []
-        if not messages:
-            return {"status": "no_messages"}
-
-        msg = messages[0]
-        text = ""
-        if msg.get("type") == "text":
-            text = (msg.get("text") or {}).get("body", "")
-        return {"status": "received", "from": msg.get("from"), "text": text}
-
 """
 WhatsApp Business API Integration
 Integrates with WhatsApp Business API
 """
 
-from typing import Dict, Any, Optional
-import structlog
+from __future__ import annotations
+
+import asyncio
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Set, Tuple
+
 import httpx
-from config.settings import settings
+import structlog
+
+try:
+    import h2  # type: ignore  # noqa: F401
+    _HTTP2 = True
+except Exception:  # pragma: no cover
+    _HTTP2 = False
 
-logger = structlog.get_logger()
+from config.settings import settings
+from core.openai_client import RateLimiter
+from sales.scripts.batching import BatchingQueue
+from sales.scripts.engine import get_sales_batcher, get_sales_engine
 
+logger = structlog.get_logger().bind(svc="sales", component="whatsapp")
 
 class WhatsAppAPI:
     """WhatsApp Business API client"""
@@ -41,19 +34,44 @@ class WhatsAppAPI:
         self.verify_token = settings.WHATSAPP_VERIFY_TOKEN
         self.base_url = "https://graph.facebook.com/v18.0"
         self._client = None
+        self._reply_tasks: Set[asyncio.Task] = set()
+        self._reply_slots = asyncio.Semaphore(settings.MAX_CONCURRENT_LLM)
+        # outbound sends coalesce for a few ms, then go out concurrently over the
+        # pooled (HTTP/2) client, paced to the Cloud API's per-number rate
+        self._send_batcher = BatchingQueue(
+            self._post_batch,
+            batch_size=settings.WHATSAPP_SEND_BATCH_SIZE,
+            max_wait_ms=settings.WHATSAPP_SEND_BATCH_MAX_WAIT_MS
+        )
+        self._send_limiter = RateLimiter(
+            settings.WHATSAPP_SEND_RATE_LIMIT * 60, 0, burst=settings.WHATSAPP_SEND_RATE_LIMIT
+        )
     
     def _get_client(self) -> httpx.AsyncClient:
-        """Get HTTP client"""
+        """Get the shared HTTP client (keeps graph.facebook.com connections alive across requests)"""
         if not self._client:
             self._client = httpx.AsyncClient(
-                timeout=30.0,
-                headers={
-                    "Authorization": f"Bearer {self.api_token}",
-                    "Content-Type": "application/json"
-                }
+                timeout=settings.WHATSAPP_TIMEOUT,
+                headers={"Content-Type": "application/json"},
+                limits=httpx.Limits(
+                    max_keepalive_connections=settings.WHATSAPP_MAX_KEEPALIVE_CONNECTIONS,
+                    max_connections=settings.WHATSAPP_MAX_CONNECTIONS
+                ),
+                http2=_HTTP2
             )
         return self._client
     
+    def _auth_headers(self) -> Dict[str, str]:
+        """Per-request auth, so a rotated api_token applies without rebuilding the pool"""
+        return {"Authorization": f"Bearer {self.api_token}"}
+    
+    async def close(self):
+        """Flush pending sends and close the shared HTTP client"""
+        await self._send_batcher.close()
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+    
     async def send_text_message(
         self,
         to: str,
@@ -76,20 +94,31 @@ class WhatsAppAPI:
                 }
             }
             
-            client = self._get_client()
-            response = await client.post(url, json=payload)
-            response.raise_for_status()
-            
-            result = response.json()
+            result = await self._send(url, payload)
             
             logger.info("WhatsApp message sent", to=to, message_id=result.get("messages", [{}])[0].get("id"))
             
             return result
             
-        except Exception as e:
+        except (httpx.HTTPError, ValueError) as e:
+            # transport/status errors and undecodable responses; anything else is a bug
             logger.error("WhatsApp send error", error=str(e))
             return None
     
+    async def _send(self, url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST a message through the send batcher"""
+        return await self._send_batcher.submit((url, payload))
+    
+    async def _post_batch(self, items: List[Tuple[str, Dict[str, Any]]]) -> List[Any]:
+        """Send one coalesced batch concurrently; failures are returned per item"""
+        return await asyncio.gather(*(self._post(url, payload) for url, payload in items), return_exceptions=True)
+    
+    async def _post(self, url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        await self._send_limiter.acquire()
+        response = await self._get_client().post(url, json=payload, headers=self._auth_headers())
+        response.raise_for_status()
+        return response.json()
+    
     async def send_template_message(
         self,
         to: str,
@@ -124,17 +153,13 @@ class WhatsAppAPI:
                 }
             }
             
-            client = self._get_client()
-            response = await client.post(url, json=payload)
-            response.raise_for_status()
-            
-            result = response.json()
+            result = await self._send(url, payload)
             
             logger.info("WhatsApp template sent", to=to, template=template_name)
             
             return result
             
-        except Exception as e:
+        except (httpx.HTTPError, ValueError) as e:
             logger.error("WhatsApp template error", error=str(e))
             return None
     
@@ -142,46 +167,90 @@ class WhatsAppAPI:
         self,
         payload: Dict[str, Any]
     ) -> Dict[str, Any]:
-        """Handle incoming WhatsApp webhook"""
+        """Handle incoming WhatsApp webhook (every message of every entry/change)"""
         try:
-            entry = payload.get("entry", [{}])[0]
-            changes = entry.get("changes", [{}])[0]
-            value = changes.get("value", {})
-            messages = value.get("messages", [])
+            messages = [
+                message
+                for entry in payload.get("entry", [])
+                for change in entry.get("changes", [])
+                for message in change.get("value", {}).get("messages", [])
+            ]
             
             if not messages:
                 return {"status": "no_messages"}
             
-            message = messages[0]
-            from_number = message.get("from")
-            message_id = message.get("id")
-            message_type = message.get("type")
-            
-            # Extract text
-            text = ""
-            if message_type == "text":
-                text = message.get("text", {}).get("body", "")
-            
-            logger.info(
-                "WhatsApp message received",
-                from_number=from_number,
-                message_id=message_id,
-                message_type=message_type,
-                text_preview=text[:50]
+            results = await asyncio.gather(
+                *(self._process_one(message) for message in messages),
+                return_exceptions=True
             )
+            received = []
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error("WhatsApp message error", error=str(result))
+                else:
+                    received.append(result)
+            if not received:
+                return {"status": "error", "error": "no message could be processed"}
             
-            return {
-                "status": "received",
-                "from": from_number,
-                "message_id": message_id,
-                "type": message_type,
-                "text": text
-            }
+            # first message at the top level, as before; the full list alongside
+            return {"status": "received", **received[0], "messages": received}
             
         except Exception as e:
             logger.error("WhatsApp webhook error", error=str(e))
             return {"status": "error", "error": str(e)}
     
+    async def _process_one(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Extract one inbound message and schedule its reply"""
+        from_number = message.get("from")
+        message_id = message.get("id")
+        message_type = message.get("type")
+        
+        # Extract text
+        text = ""
+        if message_type == "text":
+            text = message.get("text", {}).get("body", "")
+        
+        logger.info(
+            "WhatsApp message received",
+            from_number=from_number,
+            message_id=message_id,
+            message_type=message_type,
+            text_preview=text[:50]
+        )
+        
+        # Reply in the background so the webhook is acknowledged immediately
+        if text and from_number and self.api_token and self.phone_number_id:
+            task = asyncio.create_task(self._reply(from_number, text))
+            self._reply_tasks.add(task)
+            task.add_done_callback(self._reply_tasks.discard)
+        
+        return {
+            "from": from_number,
+            "message_id": message_id,
+            "type": message_type,
+            "text": text
+        }
+    
+    async def _reply(self, to: str, text: str):
+        """Answer an inbound message with the (batched) sales engine"""
+        try:
+            # bounds in-flight LLM replies when a burst of messages arrives
+            async with self._reply_slots:
+                if settings.WHATSAPP_STREAM_REPLIES:
+                    # opening sentence goes out while the rest is generated
+                    async for part in get_sales_engine().stream_response(text, [], to):
+                        await self.send_text_message(to, part)
+                    return
+                result = await get_sales_batcher().submit({
+                    "user_message": text,
+                    "conversation_history": [],
+                    "session_id": to
+                })
+                if result.get("response"):
+                    await self.send_text_message(to, result["response"])
+        except Exception as e:
+            logger.error("WhatsApp reply error", error=str(e))
+    
     def verify_webhook(
         self,
         mode: str,
@@ -202,3 +271,9 @@ class WhatsAppAPI:
         # This would require webhook handling to track status
         # For now, return None
         return None
+
+
+@lru_cache(maxsize=1)
+def get_whatsapp_api() -> WhatsAppAPI:
+    """Process-wide WhatsAppAPI shared across requests."""
+    return WhatsAppAPI()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+_BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (_BACKEND, os.path.dirname(_BACKEND)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,54 @@
+import pytest
+
+from core.modules.reasoning.verbal_reasoning import VerbalReasoningEngine
+
+
+def _parse(text):
+    # the parser doesn't touch the OpenAI client, so skip __init__
+    return VerbalReasoningEngine._parse_reasoning_response(object.__new__(VerbalReasoningEngine), text)
+
+
+NUMBERED = """1. Premises: all men are mortal; Socrates is a man
+2. Logical steps: apply the universal premise
+3. Conclusion: Socrates is mortal
+4. Confidence level: 0.85"""
+
+
+def test_numbered_prompt_format():
+    result = _parse(NUMBERED)
+    assert result["conclusion"] == "Socrates is mortal"
+    assert result["confidence"] == pytest.approx(0.85)
+    assert len(result["reasoning_steps"]) == 2
+
+
+def test_numbered_label_with_range():
+    assert _parse("4. Confidence level (0-1): 0.7")["confidence"] == pytest.approx(0.7)
+
+
+def test_plain_labels():
+    result = _parse("Conclusion: yes\nConfidence: .9")
+    assert result["conclusion"] == "yes"
+    assert result["confidence"] == pytest.approx(0.9)
+
+
+def test_markdown_labels():
+    result = _parse("**Conclusion:** yes\n**Confidence:** 0.9")
+    assert result["conclusion"] == "yes"
+    assert result["confidence"] == pytest.approx(0.9)
+
+    result = _parse("- __Conclusion__: no\n- **Confidence level**: 0.65")
+    assert result["conclusion"] == "no"
+    assert result["confidence"] == pytest.approx(0.65)
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [("Confidence: 85%", 0.85), ("4. Confidence level: 72 %", 0.72), ("Confidence: 150%", 1.0), ("Confidence: 3", 1.0)],
+)
+def test_percentages_and_clamping(line, expected):
+    assert _parse(line)["confidence"] == pytest.approx(expected)
+
+
+def test_last_value_wins_and_default():
+    assert _parse("Confidence: 0.2\nConfidence: 0.8")["confidence"] == pytest.approx(0.8)
+    assert _parse("Conclusion: unsure")["confidence"] == 0.5
@@ -1,75 +1,10 @@
-"""
-ICARUSIAV2 settings (pydantic-settings)
-"""
-
-from __future__ import annotations
-
-from pydantic_settings import BaseSettings
-from typing import List, Optional
-
-
-class Settings(BaseSettings):
-    # App
-    APP_NAME: str = "ICARUSIAV2"
-    DEBUG: bool = False
-    VERSION: str = "2.0.0"
-
-    # API / CORS
-    API_V1_PREFIX: str = "/api/v1"
-    ALLOWED_ORIGINS: List[str] = [
-        "http://localhost:3000",
-        "http://localhost:8000",
-    ]
-
-    # OpenAI
-    OPENAI_API_KEY: Optional[str] = None
-    OPENAI_MODEL: str = "gpt-4o-mini"
-
-    # Cognitive tuning
-    MAX_REASONING_DEPTH: int = 5
-    PARALLEL_DECODING_WORKERS: int = 4
-    THREAD_ROT_THRESHOLD: float = 0.7
-    MEMORY_RETENTION_DAYS: int = 30
-
-    # Sales
-    MAX_CONVERSATION_TURNS: int = 50
-    OBJECTION_HANDLING_ENABLED: bool = True
-    SALES_SCRIPT_AUTO_ADAPT: bool = True
-
-    # Twilio
-    TWILIO_ACCOUNT_SID: Optional[str] = None
-    TWILIO_AUTH_TOKEN: Optional[str] = None
-    TWILIO_PHONE_NUMBER: Optional[str] = None
-
-    # WhatsApp Business API
-    WHATSAPP_API_TOKEN: Optional[str] = None
-    WHATSAPP_PHONE_NUMBER_ID: Optional[str] = None
-    WHATSAPP_VERIFY_TOKEN: Optional[str] = None
-
-    # Google Cloud
-    GOOGLE_APPLICATION_CREDENTIALS: Optional[str] = None
-    GOOGLE_TTS_VOICE: str = "es-ES-Neural2-D"
-
-    # Enterprise
-    CRM_SYNC_INTERVAL: int = 300
-    ANALYTICS_UPDATE_INTERVAL: int = 60
-    FEEDBACK_LEARNING_ENABLED: bool = True
-
-    class Config:
-        env_file = ".env"
-        case_sensitive = True
-
-
-settings = Settings()
-
 """
 Configuration settings for ICARUSIAV2
 """
 
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import List, Optional
 import os
-from pathlib import Path
 
 
 class Settings(BaseSettings):
@@ -77,11 +12,20 @@ class Settings(BaseSettings):
     
     # Application
     APP_NAME: str = "ICARUSIAV2"
+    COMPANY_NAME: str = os.getenv("COMPANY_NAME", "")  # fills "[Empresa]" in templated replies
     DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()  # e.g. WARNING in production skips info/debug logging entirely
     VERSION: str = "2.0.0"
     
+    # Server (uvicorn); I/O-bound handlers, so 2 workers per vCPU
+    UVICORN_WORKERS: int = int(os.getenv("UVICORN_WORKERS", str(2 * (os.cpu_count() or 1))))
+    UVICORN_LIMIT_CONCURRENCY: int = 1000
+    UVICORN_TIMEOUT_KEEP_ALIVE: int = 30  # seconds
+    UVICORN_GRACEFUL_SHUTDOWN: int = 30  # seconds
+    
     # API
     API_V1_PREFIX: str = "/api/v1"
+    API_ROUTERS: str = os.getenv("API_ROUTERS", "cognitive,knowledge,sales,enterprise")  # comma-separated route groups this worker mounts
     ALLOWED_ORIGINS: List[str] = [
         "http://localhost:3000",
         "http://localhost:8080",
@@ -91,6 +35,19 @@ class Settings(BaseSettings):
     # OpenAI
     OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
     OPENAI_MODEL: str = "gpt-4-turbo-preview"
+    REASONING_MODEL: str = os.getenv("REASONING_MODEL", OPENAI_MODEL)
+    GUARDRAIL_MODEL: str = os.getenv("GUARDRAIL_MODEL", "gpt-4o-mini")  # ABCD checks are classification; a small model suffices
+    OPENAI_STRUCTURED_OUTPUTS: bool = os.getenv("OPENAI_STRUCTURED_OUTPUTS", "False").lower() == "true"  # json_schema responses (gpt-4o+)
+    OPENAI_MAX_CONNECTIONS: int = 200  # shared client pool
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = 100
+    OPENAI_TIMEOUT: float = 30.0  # seconds
+    OPENAI_CONNECT_TIMEOUT: float = 5.0  # seconds
+    OPENAI_RPM_LIMIT: int = int(os.getenv("OPENAI_RPM_LIMIT", "500"))  # 0 disables
+    OPENAI_TPM_LIMIT: int = int(os.getenv("OPENAI_TPM_LIMIT", "150000"))  # 0 disables
+    OPENAI_MAX_INPUT_TOKENS: int = int(os.getenv("OPENAI_MAX_INPUT_TOKENS", "8000"))  # prompts are trimmed past this; 0 disables
+    OPENAI_RETRY_ATTEMPTS: int = 5  # per call, on connection errors / timeouts / 429
+    OPENAI_RETRY_MIN_WAIT: float = 1.0  # seconds; jittered exponential backoff
+    OPENAI_RETRY_MAX_WAIT: float = 20.0  # seconds
     OPENAI_EMBEDDING_MODEL: str = "text-embedding-3-large"
     
     # Firebase
@@ -109,6 +66,7 @@ class Settings(BaseSettings):
     REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT: int = int(os.getenv("REDIS_PORT", "6379"))
     REDIS_DB: int = int(os.getenv("REDIS_DB", "0"))
+    REDIS_SOCKET_TIMEOUT: float = 0.1  # seconds; Redis only backs caches, so fail fast
     
     # Vector Database
     CHROMA_PERSIST_DIR: str = os.getenv("CHROMA_PERSIST_DIR", "./data/chroma")
@@ -122,6 +80,13 @@ class Settings(BaseSettings):
     WHATSAPP_API_TOKEN: Optional[str] = os.getenv("WHATSAPP_API_TOKEN")
     WHATSAPP_PHONE_NUMBER_ID: Optional[str] = os.getenv("WHATSAPP_PHONE_NUMBER_ID")
     WHATSAPP_VERIFY_TOKEN: Optional[str] = os.getenv("WHATSAPP_VERIFY_TOKEN")
+    WHATSAPP_MAX_CONNECTIONS: int = 100  # pooled connections to graph.facebook.com
+    WHATSAPP_MAX_KEEPALIVE_CONNECTIONS: int = 50
+    WHATSAPP_TIMEOUT: float = 30.0  # seconds
+    WHATSAPP_STREAM_REPLIES: bool = os.getenv("WHATSAPP_STREAM_REPLIES", "False").lower() == "true"  # send the first sentence as its own message while the rest streams
+    WHATSAPP_SEND_BATCH_SIZE: int = 50  # outbound messages sent together
+    WHATSAPP_SEND_BATCH_MAX_WAIT_MS: int = 20  # coalescing window for outbound sends
+    WHATSAPP_SEND_RATE_LIMIT: int = 80  # messages per second (Cloud API default throughput); 0 disables
     
     # Google Cloud TTS/STT
     GOOGLE_APPLICATION_CREDENTIALS: Optional[str] = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
@@ -132,15 +97,67 @@ class Settings(BaseSettings):
     PARALLEL_DECODING_WORKERS: int = 4
     THREAD_ROT_THRESHOLD: float = 0.7
     MEMORY_RETENTION_DAYS: int = 30
+    MEMORY_TIMESTAMP_CACHE_MS: int = int(os.getenv("MEMORY_TIMESTAMP_CACHE_MS", "1"))  # reuse now() isoformat within this window; 0 disables
+    MEMORY_CLOCK_TICKER: bool = os.getenv("MEMORY_CLOCK_TICKER", "False").lower() == "true"  # background task refreshes the timestamp every window instead of reading the clock per call
+    MEMORY_MAX_SESSIONS: int = 10_000  # least recently used sessions evicted past this; 0 disables
+    REASONING_CACHE_SIZE: int = 4096
+    REASONING_CACHE_TTL: int = 3600  # seconds
+    REASONING_CACHE_MIN_CONFIDENCE: float = 0.6  # only memoize confident results
+    REASONING_CHAIN_WINDOW: int = 5  # prior steps shown to each step of a chain
+    REASONING_MEMO_PATH: str = os.getenv("REASONING_MEMO_PATH", "./data/reasoning_memo.db")
+    REASONING_MEMO_SIMILARITY: float = 0.8  # cosine / token-overlap threshold
+    REASONING_MEMO_TTL: int = 7 * 24 * 3600  # seconds
+    REASONING_MEMO_EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
+    REASONING_MEMO_MAX_CHAINS: int = 10_000  # oldest chains pruned past this; 0 disables the cap
+    ANCHOR_HISTORY_SIZE: int = 64  # anchors kept per session
+    BREADCRUMB_MAX_TRAIL: int = 10_000  # breadcrumbs kept per session (oldest evicted)
+    ANCHOR_SESSION_TTL: int = 3600  # seconds idle before a session is evicted
+    ANCHOR_GC_INTERVAL: int = 60  # seconds between eviction sweeps
+    GUARDRAIL_TIMEOUT: float = 10.0  # seconds for the combined ABCD check
+    GUARDRAIL_CACHE_SIZE: int = 50_000  # cached verdicts (0 disables)
+    KG_PATH_CACHE_SIZE: int = 10_000  # cached (source, target) shortest paths
+    GUARDRAIL_BATCH_POLL_INTERVAL: float = 30.0  # seconds between Batch API status polls
     
     # Sales Settings
     MAX_CONVERSATION_TURNS: int = 50
     OBJECTION_HANDLING_ENABLED: bool = True
     SALES_SCRIPT_AUTO_ADAPT: bool = True
+    WEBHOOK_BATCH_SIZE: int = 16  # max messages per engine batch
+    WEBHOOK_BATCH_MAX_WAIT_MS: int = 20  # coalescing window
+    MAX_CONCURRENT_LLM: int = 20  # in-flight webhook replies per worker
+    SALES_RESPONSE_CACHE_SIZE: int = 10_000  # exact-match replies kept (0 disables)
+    SALES_RESPONSE_CACHE_TTL: int = int(os.getenv("SALES_RESPONSE_CACHE_TTL", "1800"))  # seconds; FAQ-heavy bots can go to 86400, 0 disables
+    SALES_SEMANTIC_CACHE_SIZE: int = 2000  # paraphrase-matched replies kept (0 disables; needs numpy)
+    SALES_SEMANTIC_CACHE_STAGES: str = os.getenv("SALES_SEMANTIC_CACHE_STAGES", "greeting,presentation")  # comma-separated stages
+    SALES_SEMANTIC_CACHE_HIT: float = 0.95  # cosine at or above: reuse directly
+    SALES_SEMANTIC_CACHE_MISS: float = 0.85  # cosine below: ignore; in between: intent check
+    SALES_SEMANTIC_CACHE_EMBEDDING_MODEL: str = "text-embedding-3-small"
+    SALES_SEMANTIC_CACHE_DIMENSIONS: int = 256
+    SALES_SEMANTIC_CACHE_VERIFY_MODEL: str = "gpt-4o-mini"  # cheap "same intent?" check in the gray zone
+    SALES_LIGHT_MODEL: str = os.getenv("SALES_LIGHT_MODEL", "gpt-4o-mini")  # model for near-templated stages
+    SALES_LIGHT_MODEL_STAGES: str = os.getenv("SALES_LIGHT_MODEL_STAGES", "greeting,qualification,follow_up")
+    SALES_CANNED_STAGES: str = os.getenv("SALES_CANNED_STAGES", "greeting,follow_up")  # answered from script examples, no LLM call
+    SALES_PROMPT_CUSTOMER_FIELDS: str = os.getenv("SALES_PROMPT_CUSTOMER_FIELDS", "")  # customer_data keys shown to the model (e.g. "name,industry,budget"); empty = all
+    SALES_HISTORY_MAX_TOKENS: int = 600  # recent-conversation budget per request, newest messages first; 0 disables
+    SALES_KNOWLEDGE_PATHS: str = os.getenv("SALES_KNOWLEDGE_PATHS", "")  # comma-separated catalog/FAQ files (.json, .md, .txt) inlined into the system prompt
+    SALES_KNOWLEDGE_MAX_TOKENS: int = 20_000  # knowledge beyond this is trimmed from the middle; 0 disables the cap
+    SALES_RESPONSE_CACHE_REDIS: bool = os.getenv("SALES_RESPONSE_CACHE_REDIS", "False").lower() == "true"  # share cached replies across workers via Redis
+    SALES_RESPONSE_CACHE_STAGE_TTLS: str = os.getenv("SALES_RESPONSE_CACHE_STAGE_TTLS", "greeting:86400,objection_handling:1800,closing:300")  # stage:seconds overrides of SALES_RESPONSE_CACHE_TTL
     
     # Enterprise Settings
     CRM_SYNC_INTERVAL: int = 300  # seconds
+    CRM_MAX_CONNECTIONS: int = 100  # shared pool across all CRM providers
+    CRM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    CRM_TIMEOUT: float = 30.0  # seconds
+    SESSION_HISTORY_MAX: int = 200  # routed requests kept per coordinator session
+    AGENT_ROUTING_EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"  # semantic routing on agent descriptions
+    AGENT_ROUTING_TOP_K: int = 5  # best description matches considered before load balancing
     ANALYTICS_UPDATE_INTERVAL: int = 60  # seconds
+    ANALYTICS_MAX_EVENTS: int = 10_000  # raw events kept (overall and per type)
+    ANALYTICS_CACHE_TTL: int = 30  # seconds a rollup response is reused
+    ANALYTICS_ROLLUP_MINUTE_RETENTION_MINUTES: int = 24 * 60 + 1
+    ANALYTICS_ROLLUP_HOURLY_RETENTION_HOURS: int = 49
+    ANALYTICS_ROLLUP_DAILY_RETENTION_DAYS: int = 90
     FEEDBACK_LEARNING_ENABLED: bool = True
     
     # Security
@@ -148,9 +165,8 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     
-    class Config:
-        env_file = ".env"
-        case_sensitive = True
+    # read once at import and never reassigned; frozen makes that explicit
+    model_config = SettingsConfigDict(env_file=".env", case_sensitive=True, frozen=True)
 
 
 settings = Settings()
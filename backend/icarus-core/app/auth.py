@@ -1,3 +1,8 @@
+import asyncio
+import base64
+import json
+import time
+from collections import OrderedDict
 from fastapi import Header, HTTPException
 import firebase_admin
 from firebase_admin import auth, credentials
@@ -6,13 +11,55 @@ if not firebase_admin._apps:
     cred = credentials.ApplicationDefault()
     firebase_admin.initialize_app(cred)
 
-def verify_token(authorization: str = Header(...)):
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid auth header")
+# verified tokens -> (claims, expires_at); repeat requests skip the signature check
+_TOKEN_CACHE = OrderedDict()
+_TOKEN_CACHE_SIZE = 10_000
+_TOKEN_CACHE_TTL = 300
+
+def _cached_claims(token):
+    entry = _TOKEN_CACHE.get(token)
+    if entry is None:
+        return None
+    if entry[1] <= time.time():
+        _TOKEN_CACHE.pop(token, None)
+        return None
+    return entry[0]
 
-    token = authorization.replace("Bearer ", "")
+def _cache_claims(token, decoded):
+    # never past the token's own expiry
+    expires_at = min(time.time() + _TOKEN_CACHE_TTL, decoded.get("exp", 0))
+    if expires_at <= time.time():
+        return
+    _TOKEN_CACHE[token] = (decoded, expires_at)
+    if len(_TOKEN_CACHE) > _TOKEN_CACHE_SIZE:
+        _TOKEN_CACHE.popitem(last=False)
+
+def _unverified_exp(token):
+    # exp claim read without checking the signature; only used to reject early
     try:
-        decoded = auth.verify_id_token(token)
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    except (IndexError, ValueError):
+        return None
+    return claims.get("exp") if isinstance(claims, dict) else None
+
+async def verify_token(authorization: str = Header(...)):
+    scheme, _, token = authorization.partition(" ")
+    if scheme != "Bearer" or not token:
+        raise HTTPException(status_code=401, detail="Invalid auth header")
+
+    decoded = _cached_claims(token)
+    if decoded is not None:
         return decoded
+    exp = _unverified_exp(token)
+    if not isinstance(exp, (int, float)):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if exp < time.time():
+        raise HTTPException(status_code=401, detail="Token expired")
+    try:
+        # cache misses only; the firebase-admin verifier is blocking
+        decoded = await asyncio.to_thread(auth.verify_id_token, token)
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid token")
+    _cache_claims(token, decoded)
+    return decoded
@@ -1,8 +1,77 @@
+import atexit
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from services.firestore import db
 from datetime import datetime
 
+# one writer thread: Firestore RPCs leave the request path and stay in order
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="breadcrumbs")
+
+_FIRESTORE_BATCH_LIMIT = 500
+
+_log = logging.getLogger(__name__)
+
+def _commit(docs):
+    # runs in the writer thread, where nobody sees the future: log failures here
+    try:
+        collection = db.collection("breadcrumbs")
+        for start in range(0, len(docs), _FIRESTORE_BATCH_LIMIT):
+            batch = db.batch()
+            for doc in docs[start:start + _FIRESTORE_BATCH_LIMIT]:
+                batch.set(collection.document(), doc)
+            batch.commit()
+    except Exception:
+        _log.exception("breadcrumb batch write failed (%d docs dropped)", len(docs))
+
+class BreadcrumbBuffer:
+    """Collects breadcrumbs and writes them as one Firestore batch every
+    ``max_pending`` docs or ``flush_interval`` seconds, whichever comes first."""
+
+    def __init__(self, max_pending=50, flush_interval=0.5):
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def add(self, doc):
+        with self._lock:
+            self._pending.append(doc)
+            if len(self._pending) < self.max_pending:
+                if self._timer is None:
+                    self._timer = threading.Timer(self.flush_interval, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            docs = self._take()
+        _writer.submit(_commit, docs)
+
+    def flush(self):
+        with self._lock:
+            docs = self._take()
+        if docs:
+            _writer.submit(_commit, docs)
+
+    def close(self):
+        # at exit the writer no longer accepts work, so commit inline
+        with self._lock:
+            docs = self._take()
+        if docs:
+            _commit(docs)
+
+    def _take(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        docs, self._pending = self._pending, []
+        return docs
+
+_buffer = BreadcrumbBuffer()
+atexit.register(_buffer.close)
+
 def log_breadcrumb(session_id, module, step, payload):
-    db.collection("breadcrumbs").add({
+    _buffer.add({
         "session_id": session_id,
         "module": module,
         "step": step,
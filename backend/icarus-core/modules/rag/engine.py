@@ -1,4 +1,9 @@
-from services.embeddings import fake_embedding
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+from services.embeddings import fake_embedding, fake_embeddings
 from modules.breadcrumbs.logger import log_breadcrumb
 
 KNOWLEDGE = [
@@ -6,6 +11,22 @@ KNOWLEDGE = [
     {"id": 2, "text": "Lustin-IA integra CRM, ERP y RAG"},
 ]
 
+# doc embeddings stacked once so a query is scored with a single matrix-vector product
+DOC_TEXTS = [doc["text"] for doc in KNOWLEDGE]
+DOC_MAT = fake_embeddings(DOC_TEXTS)
+
+# inner-product index (SIMD search) when faiss is installed; otherwise DOC_MAT @ q
+DOC_INDEX = None
+if faiss is not None and len(DOC_TEXTS):
+    DOC_INDEX = faiss.IndexFlatIP(DOC_MAT.shape[1])
+    DOC_INDEX.add(DOC_MAT)
+
+def _best_doc(q_emb):
+    if DOC_INDEX is not None:
+        _, ids = DOC_INDEX.search(q_emb.reshape(1, -1), 1)
+        return int(ids[0, 0])
+    return int((DOC_MAT @ q_emb).argmax())
+
 def rag_query(query: str, session_id="anon"):
     log_breadcrumb(
         session_id=session_id,
@@ -16,14 +37,7 @@ def rag_query(query: str, session_id="anon"):
 
     q_emb = fake_embedding(query)
 
-    scored = []
-    for doc in KNOWLEDGE:
-        d_emb = fake_embedding(doc["text"])
-        score = sum(a*b for a,b in zip(q_emb, d_emb))
-        scored.append((score, doc["text"]))
-
-    scored.sort(reverse=True)
-    answer = scored[0][1]
+    answer = DOC_TEXTS[_best_doc(q_emb)]
 
     log_breadcrumb(
         session_id=session_id,
@@ -1,5 +1,5 @@
+from google.cloud import firestore
 from services.firestore import db
-from datetime import datetime
 
 def save_survey(session_id, uid, channel, metric, answer, status="received"):
     db.collection("surveys").add({
@@ -9,5 +9,5 @@ def save_survey(session_id, uid, channel, metric, answer, status="received"):
         "metric": metric,
         "answer": answer,
         "status": status,
-        "ts": datetime.utcnow()
+        "ts": firestore.SERVER_TIMESTAMP
     })
@@ -1,5 +1,18 @@
 import hashlib
+from functools import lru_cache
+import numpy as np
 
+def _digest(text: str):
+    return hashlib.blake2b(text.encode(), digest_size=32).digest()
+
+@lru_cache(maxsize=4096)
 def fake_embedding(text: str):
-    h = hashlib.sha256(text.encode()).hexdigest()
-    return [int(h[i:i+2], 16)/255 for i in range(0, 64, 2)]
+    # float32 vector shared by every caller through the cache, so read-only
+    emb = np.frombuffer(_digest(text), dtype=np.uint8).astype(np.float32) / 255
+    emb.flags.writeable = False
+    return emb
+
+def fake_embeddings(texts):
+    # (len(texts), 32) float32 matrix; the byte -> float step runs once in numpy
+    digests = b"".join(_digest(text) for text in texts)
+    return np.frombuffer(digests, dtype=np.uint8).reshape(-1, 32).astype(np.float32) / 255
@@ -1,7 +1,16 @@
 # En backend/icarus-core/services/storage.py
+import os
+from functools import lru_cache
 import pandas as pd
 
-def cargar_configuracion_negociacion():
+_CONFIG_PATH = 'data/raw/datos_ia.ods'
+
+@lru_cache(maxsize=1)
+def _leer_configuracion(mtime):
     # Lee tu archivo de estrategias y anchor points
-    df = pd.read_excel('data/raw/datos_ia.ods', engine='odf')
+    df = pd.read_excel(_CONFIG_PATH, engine='odf')
     return df.to_dict()
+
+def cargar_configuracion_negociacion():
+    # Solo se vuelve a leer el .ods cuando cambia en disco (la caché va por mtime)
+    return _leer_configuracion(os.path.getmtime(_CONFIG_PATH))